@@ -4,8 +4,32 @@ import logging
 import csv  # 追加: CSV出力用
 import argparse
 import sys
-from urllib.parse import urlparse, parse_qs
-from datetime import datetime
+import queue
+import threading
+import json
+import hashlib
+import re
+import sqlite3
+import math
+import contextlib
+import zipfile
+from collections import Counter, deque
+from html.parser import HTMLParser
+from urllib.parse import urlparse, parse_qs, urljoin
+from datetime import datetime, date
+import calendar
+import requests
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Parquet/Arrow で出力する場合のみ必要
+    pa = None
+try:
+    import psutil
+except ImportError:
+    # ブラウザのメモリ使用量は /proc から求める（Linux 以外では psutil が必要）
+    psutil = None
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -18,38 +42,2144 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S')
 logger = logging.getLogger(__name__)
 
+# PROGRESS: / CSV_FILE: の出力を並列ワーカー間で直列化するためのロック
+_stdout_lock = threading.Lock()
+
 # --- 設定 ---
-LOGIN_URL = "https://www.kantankaigo.jp/home/users/login"
-BASE_URL = "https://www.kantankaigo.jp/home"
+# KANTAN_BASE_URL を指定すると、録画したページを返すローカルのスタブサーバー等に向けられる
+BASE_URL = os.getenv("KANTAN_BASE_URL", "https://www.kantankaigo.jp/home").rstrip("/")
+LOGIN_URL = f"{BASE_URL}/users/login"
 
 # ユーザー情報（環境変数から取得、なければデフォルト値）
 USERNAME = os.getenv("KANTAN_USERNAME", "4845850")
 PASSWORD = os.getenv("KANTAN_PASSWORD", "fskildzolk")
 GROUP_NAME = os.getenv("KANTAN_GROUP_NAME", "ibuki")
 
+# セッション・結果などのローカルキャッシュの保存先
+CACHE_DIR = os.path.expanduser(os.getenv("KANTAN_CACHE_DIR", "~/.cache/kantankaigo"))
+# ログインセッションを使い回す最大秒数（Cookie自体の有効期限の方が短ければそちらを優先）
+SESSION_TTL = int(os.getenv("KANTAN_SESSION_TTL", "1800"))
+# 月末からこの日数を超えて経過した月（当月・前月を除く）は保存済みの取得結果を使う
+MONTH_CACHE_DAYS = int(os.getenv("KANTAN_MONTH_CACHE_DAYS", "30"))
+# 完了しなかったジョブのチェックポイントを残しておく日数（これより古いものは次のジョブの開始時に削除する）
+CHECKPOINT_DAYS = int(os.getenv("KANTAN_CHECKPOINT_DAYS", "7"))
+
+# ページ準備完了の待機上限（秒）。固定sleepを積み重ねる代わりにこの時間内でシグナルを待つ
+PAGE_TIMEOUT = float(os.getenv("KANTAN_PAGE_TIMEOUT", "20"))
+# WebDriver のページ読み込みタイムアウトの既定値（秒）。利用者ごとの時間の上限の後で元に戻す
+DEFAULT_PAGE_LOAD_TIMEOUT = 300
+
+# 1回のスクリプト実行でページの状態をまとめて取得する
+PAGE_STATE_SCRIPT = """
+var el = document.getElementById('serviceDate');
+var picker = document.getElementById('ui-monthpicker-div');
+return {
+    readyState: document.readyState,
+    serviceDate: el && el.value ? el.value : null,
+    table: !!document.querySelector('.list_table'),
+    ajaxIdle: !window.jQuery || window.jQuery.active === 0,
+    replaced: (function () {
+        var table = document.querySelector('.list_table');
+        if (!window.__kantanStale || !table || !table.hasAttribute('data-kantan-stale')
+                || window.__kantanAjaxDone) { return true; }
+        // innerHTML でテーブルの中身だけを差し替えた場合は、印を付けたときの最後の行がページから外れる
+        var row = window.__kantanStaleRow;
+        if (row ? !row.isConnected : table.rows.length !== window.__kantanStaleRows) { return true; }
+        // ajaxComplete で確認できないページ（jQuery がない）では、serviceDate が変わったことで判断する
+        return !window.__kantanAjaxHook && !!el && el.value !== window.__kantanStaleDate;
+    })(),
+    pickerVisible: !!(picker && (picker.offsetWidth || picker.offsetHeight || picker.getClientRects().length))
+};
+"""
+
+# 年月を切り替える前に、表示中のページと一覧テーブルに印を付ける。ページの再読み込みで window の印が、
+# AJAXでのテーブルの差し替えでテーブルの印が消えるため、PAGE_STATE_SCRIPT の replaced で切り替わったことを確認できる。
+# テーブル要素を残したまま中身だけを差し替える画面に備え、最後の行・行数・serviceDate を控え、
+# 印を付けた後に完了したAJAX（jQuery の ajaxComplete）も差し替えとみなす
+STALE_MARK_SCRIPT = """
+window.__kantanStale = true;
+window.__kantanAjaxDone = false;
+var table = document.querySelector('.list_table');
+var el = document.getElementById('serviceDate');
+window.__kantanStaleRow = table && table.rows.length ? table.rows[table.rows.length - 1] : null;
+window.__kantanStaleRows = table ? table.rows.length : 0;
+window.__kantanStaleDate = el ? el.value : null;
+if (table) { table.setAttribute('data-kantan-stale', '1'); }
+if (window.jQuery && !window.__kantanAjaxHook) {
+    var doc = window.jQuery(document);
+    if (typeof doc.ajaxComplete === 'function') {
+        window.__kantanAjaxHook = true;
+        doc.ajaxComplete(function () { window.__kantanAjaxDone = true; });
+    }
+}
+"""
+
+# 日付セルの文字列から日を取り出す正規表現（"11/15(土)"・"2025-11-15"・"11月15日"・"15日"・"15(土)"）。
+# 最初にマッチしたグループが日。SCHEDULE_ROWS_SCRIPT（JavaScript）でも同じ正規表現を使う
+DAY_CELL_PATTERN = r"\d{4}[-/]\d{1,2}[-/](\d{1,2})|\d{1,2}/(\d{1,2})|\d{1,2}月(\d{1,2})|(\d{1,2})日|^\s*(\d{1,2})(?!\d)"
+DAY_CELL_RE = re.compile(DAY_CELL_PATTERN)
+
+# 一覧テーブルの全セルを [日付, 時間, サービス, スタッフ] の配列として一括で返す。
+# arguments[0] に日を指定すると、日付セルがその日の行だけを返す（ほかの列のセルは読まない）
+SCHEDULE_ROWS_SCRIPT = """
+var day = arguments[0], pattern = day ? new RegExp(arguments[1]) : null;
+function text(el) {
+    return el ? (el.innerText || el.textContent || '') : '';
+}
+function dayOf(value) {
+    var m = pattern.exec(value);
+    if (!m) { return null; }
+    for (var g = 1; g < m.length; g++) {
+        if (m[g] !== undefined) { return parseInt(m[g], 10); }
+    }
+    return null;
+}
+var dates = document.querySelectorAll('.day.edit'), times = document.querySelectorAll('.time.edit'),
+    services = document.querySelectorAll('.service.edit'), staffs = document.querySelectorAll('.staff.edit');
+var rows = [];
+for (var i = 0; i < dates.length; i++) {
+    var date = text(dates[i]);
+    if (day && dayOf(date) !== day) { continue; }
+    rows.push([date, text(times[i]), text(services[i]), text(staffs[i])]);
+}
+return rows;
+"""
+
+# --browser-profile lean で読み込まないリソース（DevToolsの Network.setBlockedURLs のパターン）
+LEAN_BLOCKED_URLS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css",
+]
+
+# 現在のページの転送バイト数と読み込み時間（Navigation Timing / Resource Timing）
+PAGE_METRICS_SCRIPT = """
+var nav = performance.getEntriesByType('navigation')[0];
+var resources = performance.getEntriesByType('resource');
+var bytes = nav ? nav.transferSize || 0 : 0;
+for (var i = 0; i < resources.length; i++) {
+    bytes += resources[i].transferSize || 0;
+}
+return {
+    bytes: bytes,
+    resources: resources.length,
+    domContentLoaded: nav ? nav.domContentLoadedEventEnd : null,
+    load: nav && nav.loadEventEnd ? nav.loadEventEnd : null
+};
+"""
+
+
+def parse_day(date_text):
+    """日付セルの文字列から日（1-31）を返す。読み取れない場合は None"""
+    m = DAY_CELL_RE.search(date_text or "")
+    if not m:
+        return None
+    return int(next(g for g in m.groups() if g))
+
+
+def filter_by_day(schedules, day):
+    """ScheduleRecord のリストから、日付が day の行だけを返す"""
+    return [r for r in schedules if r.day == day]
+
+
+def rows_to_schedules(rows, year_month, customer=None, pid=None):
+    """[日付, 時間, サービス, スタッフ] の配列を ScheduleRecord のリストに変換する（year_month は "YYYY-MM"）"""
+    schedules = []
+    for row in rows:
+        date_txt = (row[0] or "").strip()
+        if not date_txt:
+            continue
+        schedules.append(ScheduleRecord(
+            date_txt, (row[1] or "").strip(), (row[2] or "").strip(), (row[3] or "").strip(),
+            year_month, customer, pid))
+    return schedules
+
+
+class PhaseTimer:
+    """処理フェーズごとの所要時間（スパン）を記録し、JSON Lines のメトリクスファイルに書き出す"""
+
+    def __init__(self, metrics_path=None):
+        self.metrics_path = metrics_path
+        self.spans = []
+        self.lock = threading.Lock()
+        # スレッドごとの付加情報（処理中の利用者のPIDなど）
+        self._context = threading.local()
+        self._file = open(metrics_path, "a", encoding="utf-8") if metrics_path else None
+
+    @contextlib.contextmanager
+    def context(self, **attrs):
+        """このスレッドで記録するスパンに attrs を付加する"""
+        previous = getattr(self._context, "attrs", {})
+        self._context.attrs = {**previous, **attrs}
+        try:
+            yield
+        finally:
+            self._context.attrs = previous
+
+    @contextlib.contextmanager
+    def span(self, phase, **attrs):
+        """with ブロックの所要時間を記録する。yield した辞書に項目を追加すると一緒に記録される"""
+        info = dict(attrs)
+        started_at = time.time()
+        start = time.monotonic()
+        try:
+            yield info
+        finally:
+            self.record(phase, time.monotonic() - start,
+                        started_at=started_at, **info)
+
+    def record(self, phase, seconds, **attrs):
+        entry = {"phase": phase, "seconds": round(seconds, 4),
+                 **getattr(self._context, "attrs", {}), **attrs}
+        entry.setdefault("started_at", time.time() - seconds)
+        with self.lock:
+            self.spans.append(entry)
+            if self._file is not None:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def report(self, slowest=10):
+        """フェーズごとの件数・p50・p95・最大と、時間のかかった利用者をログ出力する"""
+        by_phase = {}
+        for span in self.spans:
+            by_phase.setdefault(span["phase"], []).append(span["seconds"])
+        logger.info("=" * 50)
+        logger.info("フェーズ別の所要時間（秒）")
+        logger.info(f"  {'フェーズ':<28} {'件数':>6} {'合計':>9} {'p50':>8} {'p95':>8} {'最大':>8}")
+        for phase, values in by_phase.items():
+            values.sort()
+            logger.info(
+                f"  {phase:<28} {len(values):>6} {sum(values):>9.2f} "
+                f"{_percentile(values, 50):>8.2f} {_percentile(values, 95):>8.2f} {values[-1]:>8.2f}")
+        customers = sorted((s for s in self.spans if s["phase"] == "customer"),
+                           key=lambda s: s["seconds"], reverse=True)[:slowest]
+        if customers:
+            logger.info(f"時間のかかった利用者（上位{len(customers)}名）")
+            for s in customers:
+                logger.info(f"  {s['seconds']:>8.2f}秒  {s.get('name')} (PID: {s.get('pid')})")
+        logger.info("=" * 50)
+
+    def reset(self):
+        """集計済みのスパンを破棄する（メトリクスファイルには残る）"""
+        with self.lock:
+            self.spans = []
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def process_tree_rss(pid):
+    """pid とその子孫プロセス（chromedriver と Chrome の各プロセス）の RSS の合計バイト数。求められない場合は None"""
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return None
+        total = 0
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # プロセス名は括弧内に空白を含むことがあるため、最後の ')' より後ろ（状態, 親PID, ...）を分割する
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = None
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total = (total or 0) + int(f.read().split()[1]) * page_size
+        except OSError:
+            pass
+        stack.extend(children.get(current, []))
+    return total
+
+
+def _percentile(sorted_values, pct):
+    """ソート済みのリストの pct パーセンタイル（最近傍順位法）"""
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class AdaptivePacer:
+    """利用者ページの取得の同時実行数と開始間隔を、応答時間と失敗に応じて調整する（AIMD）
+
+    1ページあたりの応答時間が基準（直近の成功した応答の最小値＝混雑していないときの応答時間）の slow_factor 倍を超えるか
+    取得に失敗した場合は、同時実行数を半分・間隔を2倍にする（乗算的減少）。それ以外は同時実行数を
+    少しずつ増やし、間隔を詰める（加算的増加）。adaptive=False の場合は max_rps の上限だけを守る。
+    max_rps はページ読み込みの開始を1秒あたりの回数で制限する。
+    """
+
+    SPACING_STEP = 0.1
+    # 基準の応答時間を求める直近の件数
+    BASELINE_WINDOW = 50
+
+    def __init__(self, max_concurrency, max_rps=None, adaptive=True, slow_factor=2.0,
+                 max_spacing=5.0, timer=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_rps = max_rps
+        self.adaptive = adaptive
+        self.slow_factor = slow_factor
+        self.max_spacing = max_spacing
+        self.timer = timer
+        # 現在の同時実行数の上限（小数で持ち、整数部分を使う）と開始間隔（秒）
+        self.limit = float(self.max_concurrency)
+        self.spacing = 0.0
+        self.baseline = None
+        self._recent = deque(maxlen=self.BASELINE_WINDOW)
+        self.active = 0
+        self.increases = 0
+        self.decreases = 0
+        self._next_start = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self, pages=1):
+        """同時実行数と開始間隔・max_rps が許すまで待ってから、pages ページ分の取得を始める"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.active < int(self.limit):
+                    if now >= self._next_start:
+                        break
+                    self._cond.wait(self._next_start - now)
+                else:
+                    self._cond.wait()
+            self.active += 1
+            interval = self.spacing
+            if self.max_rps:
+                interval = max(interval, pages / self.max_rps)
+            self._next_start = now + interval
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def observe(self, seconds_per_page, ok):
+        """1人分の取得結果（1ページあたりの秒数、成功したか）から同時実行数と間隔を調整する"""
+        if not self.adaptive:
+            return
+        with self._cond:
+            before = (int(self.limit), self.spacing)
+            slow = self.baseline is not None and seconds_per_page > self.baseline * self.slow_factor
+            if not ok or slow:
+                now = time.monotonic()
+                # 同じ混雑で続けて減らしすぎないよう、基準の数倍の時間は次の減少をしない
+                if now - self._last_decrease < max(1.0, (self.baseline or 1.0) * 4):
+                    return
+                self._last_decrease = now
+                self.limit = max(1.0, self.limit / 2)
+                self.spacing = min(self.max_spacing, max(self.spacing * 2, self.SPACING_STEP))
+                self.decreases += 1
+                reason = "取得失敗" if not ok else "応答の遅延"
+                decision = "decrease"
+            else:
+                self._recent.append(seconds_per_page)
+                self.baseline = min(self._recent)
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+                self.spacing = max(0.0, round(self.spacing - self.SPACING_STEP, 3))
+                reason = "応答が安定"
+                decision = "increase"
+            after = (int(self.limit), self.spacing)
+            self._cond.notify_all()
+        if after == before:
+            return
+        if decision == "increase":
+            self.increases += 1
+        logger.info(
+            f"ペース調整（{reason}）: 同時実行数 {before[0]}→{after[0]}, 間隔 {before[1]:.2f}→{after[1]:.2f}秒 "
+            f"(応答 {seconds_per_page:.2f}秒/ページ, 基準 {self.baseline or 0:.2f}秒)")
+        if self.timer is not None:
+            self.timer.record("pace", seconds_per_page, decision=decision, ok=ok,
+                              concurrency=after[0], spacing=after[1])
+
+    def summarize(self):
+        return (f"同時実行数 {int(self.limit)}/{self.max_concurrency}, 間隔 {self.spacing:.2f}秒, "
+                f"増加 {self.increases}回, 減少 {self.decreases}回"
+                + (f", 上限 {self.max_rps}回/秒" if self.max_rps else ""))
+
+
+class MonthNavigationLearner:
+    """年月の切り替え方法ごとの成否と所要時間を記録し、速く確実な方法から試す順番を決める（ワーカー間で共有する）
+
+    最初の数回は試す順番を入れ替えて各方法の所要時間を測り、以降は成功率が高く平均時間が短い方法から試す。
+    あわせて、ページを開いた時点の年月から、サーバーが ?year=&month= を反映するか・
+    選んだ年月をセッションに保持するか（次に開くページが前回選んだ年月になるか）を判定する。
+    """
+
+    STRATEGIES = ("monthpicker", "direct_set", "selenium_click")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 方法 -> [成功回数, 失敗回数, 成功したときの合計秒]
+        self.stats = {s: [0, 0, 0.0] for s in self.STRATEGIES}
+        self.navigations = 0
+        # None は未判定
+        self.url_params = None
+        self.session_sticky = None
+
+    def order(self):
+        """今回試す方法の順番"""
+        with self.lock:
+            n = self.navigations
+            self.navigations += 1
+            if n < len(self.STRATEGIES):
+                # 学習中: 各方法を1回ずつ先頭にして所要時間を測る
+                return self.STRATEGIES[n:] + self.STRATEGIES[:n]
+
+            def key(s):
+                ok, failed, seconds = self.stats[s]
+                if not ok:
+                    return (1, failed, self.STRATEGIES.index(s))
+                return (0, -ok / (ok + failed), seconds / ok)
+            return tuple(sorted(self.STRATEGIES, key=key))
+
+    def observe(self, strategy, ok, seconds, replaced=True):
+        """切り替えの結果を記録する。ページ（テーブル）が差し替えられていなければ、年月が合っていても失敗として数える
+
+        古いページのまま年月の値だけが変わった場合はすぐに「成功」するため、これを成功に数えると
+        その方法が最速として選ばれ続けてしまう。
+        """
+        with self.lock:
+            entry = self.stats[strategy]
+            if ok and replaced:
+                entry[0] += 1
+                entry[2] += seconds
+            else:
+                entry[1] += 1
+
+    def observe_landing(self, target, landed, session_month):
+        """?year=&month= 付きのURLを開いた直後の年月から、URLパラメータとセッション保持の有無を判定する
+
+        target・landed・session_month は (年, 月)。session_month はこのブラウザで最後に選んだ年月（未選択なら None）。
+        """
+        with self.lock:
+            if landed != target:
+                if self.url_params is not False:
+                    logger.info("  年月の切り替え: サーバーはURLパラメータの年月を反映しません")
+                self.url_params = False
+                if session_month is not None and landed != session_month:
+                    self.session_sticky = False
+            elif session_month is not None and session_month != target:
+                self.url_params = True
+            elif self.url_params is False and session_month == target and self.session_sticky is None:
+                self.session_sticky = True
+                logger.info("  年月の切り替え: サーバーは選んだ年月をセッションに保持しています"
+                            "（同じ年月の利用者は切り替えを省略します）")
+
+    def summarize(self):
+        with self.lock:
+            parts = []
+            for s in self.STRATEGIES:
+                ok, failed, seconds = self.stats[s]
+                if ok or failed:
+                    mean = f" 平均{seconds / ok:.2f}秒" if ok else ""
+                    parts.append(f"{s} 成功{ok}/失敗{failed}{mean}")
+            flags = {None: "未判定", True: "あり", False: "なし"}
+            return (", ".join(parts) or "切り替えなし") + \
+                f" (URLパラメータ: {flags[self.url_params]}, セッション保持: {flags[self.session_sticky]})"
+
+
+class PageReadiness:
+    """ページの準備完了を実際のシグナルで待機し、各待機にかかった時間を記録する"""
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, driver, timeout=PAGE_TIMEOUT, timer=None):
+        self.driver = driver
+        self.timeout = timeout
+        self.timer = timer
+        # (待機名, 経過秒, 成功したか) のリスト
+        self.records = []
+        self.last_service_date = None
+        # 利用者ごとの時間の上限（time.monotonic() の値）。待機はこの時刻を超えない
+        self.deadline = None
+
+    def page_state(self):
+        """serviceDate・テーブル・AJAX状態などを1回の往復で取得する"""
+        try:
+            return self.driver.execute_script(PAGE_STATE_SCRIPT) or {}
+        except Exception:
+            # ページ遷移中などはスクリプトが実行できない
+            return {}
+
+    def service_date_value(self):
+        """現在のserviceDateの値（未設定ならNone）"""
+        return self.page_state().get("serviceDate")
+
+    def wait_for(self, name, condition, timeout=None):
+        """condition(state) が真になるまで待機する。成立しなければ timeout 秒で諦める"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        if self.deadline is not None:
+            timeout = max(0.0, min(timeout, self.deadline - start))
+        ok = False
+        while True:
+            state = self.page_state()
+            if state.get("serviceDate"):
+                self.last_service_date = state["serviceDate"]
+            if state and condition(state):
+                ok = True
+                break
+            if time.monotonic() - start >= timeout:
+                break
+            time.sleep(self.POLL_INTERVAL)
+        elapsed = time.monotonic() - start
+        self.records.append((name, elapsed, ok))
+        if self.timer is not None:
+            self.timer.record(f"wait:{name}", elapsed, ok=ok)
+        if not ok:
+            logger.debug(f"  待機タイムアウト: {name} ({elapsed:.1f}秒)")
+        return ok
+
+    def wait_service_date(self, timeout=None):
+        """serviceDateに値が入り、AJAXが落ち着くまで待機して値を返す"""
+        if self.wait_for("service_date",
+                         lambda s: s.get("serviceDate") and s.get("ajaxIdle"),
+                         timeout):
+            return self.last_service_date
+        return None
+
+    def mark_stale(self):
+        """年月を切り替える前に、表示中のページとテーブルに印を付ける（wait_month_loaded で差し替えを確認する）"""
+        self.driver.execute_script(STALE_MARK_SCRIPT)
+
+    def wait_month_loaded(self, target_year_month, timeout=None):
+        """serviceDateが目標の年月になり、テーブルが表示されAJAXが完了するまで待機
+
+        mark_stale() の後は、ページまたはテーブルが差し替えられるまで待つ
+        （serviceDate の値だけが先に変わった古いページの表を読まないように）。
+        """
+        return self.wait_for(
+            "month_loaded",
+            lambda s: (s.get("serviceDate") or "").startswith(target_year_month)
+            and s.get("table") and s.get("ajaxIdle") and s.get("replaced"),
+            timeout)
+
+    def wait_table(self, timeout=None):
+        """.list_table が表示されAJAXが完了するまで待機"""
+        return self.wait_for(
+            "table", lambda s: s.get("table") and s.get("ajaxIdle"), timeout)
+
+    def wait_ajax_idle(self, timeout=None):
+        """jQueryのAJAX通信が完了するまで待機"""
+        return self.wait_for("ajax_idle", lambda s: s.get("ajaxIdle"), timeout)
+
+    def wait_monthpicker(self, visible, timeout=2):
+        """月ピッカーの表示状態が変わるまで待機"""
+        return self.wait_for(
+            "monthpicker", lambda s: bool(s.get("pickerVisible")) == visible,
+            timeout)
+
+    def summarize(self, since=0):
+        """records[since:] の待機時間を待機名ごとに合計した文字列を返す"""
+        totals = {}
+        for name, elapsed, _ in self.records[since:]:
+            totals[name] = totals.get(name, 0.0) + elapsed
+        detail = ", ".join(f"{n}={t:.2f}秒" for n, t in totals.items())
+        return f"合計 {sum(totals.values()):.2f}秒 ({detail or 'なし'})"
+
+
+# 利用者一覧の全行を [PID, 名前] の配列として一括で返す
+CUSTOMER_ROWS_SCRIPT = """
+return Array.prototype.map.call(document.querySelectorAll('span.planJisseki'), function (el) {
+    var row = el.closest('tr');
+    var link = row ? row.querySelector('a.focus') : null;
+    return [el.getAttribute('pid') || '', link ? (link.innerText || link.textContent || '') : ''];
+});
+"""
+
+
+def rows_to_customers(rows):
+    """[PID, 名前] の配列を get_all_customers と同じ [{"name", "pid"}] に変換する"""
+    customers = []
+    for pid, name in rows:
+        if not pid:
+            continue
+        customers.append({"name": (name or "").strip() or f"利用者ID_{pid}", "pid": pid})
+    return customers
+
+
+def ensure_private_dir(path):
+    """キャッシュのディレクトリを所有者のみ読み書きできる権限（0700）で作る（既にある場合も権限を直す）
+
+    セッションのCookie・取得結果を保存するため、どのキャッシュもファイルを開く前にこれを呼ぶ。
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.stat(path).st_mode & 0o777 != 0o700:
+        try:
+            os.chmod(path, 0o700)
+        except OSError as e:
+            logger.warning(f"キャッシュのディレクトリの権限を変更できません: {path} ({e})")
+
+
+def _account_key():
+    """接続先・ユーザー・担当者コードごとにキャッシュを分けるためのキー"""
+    return hashlib.sha256(
+        f"{BASE_URL}|{USERNAME}|{GROUP_NAME}".encode("utf-8")).hexdigest()[:16]
+
+
+class RosterCache:
+    """利用者一覧（PID→名前）を内容のハッシュとともに保存し、前回からの変化を検出する"""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, f"roster_{_account_key()}.json")
+
+    @staticmethod
+    def content_hash(customers):
+        payload = json.dumps([[c["pid"], c["name"]] for c in customers],
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def index(self):
+        """保存済みの {PID: 名前}"""
+        entry = self.load()
+        return {c["pid"]: c["name"] for c in entry["customers"]} if entry else {}
+
+    def update(self, customers):
+        """新しい一覧を保存する。内容が変わっていれば追加・削除・名前変更をログ出力する"""
+        digest = self.content_hash(customers)
+        previous = self.load()
+        if previous and previous.get("hash") == digest:
+            logger.info(f"利用者一覧は前回から変更ありません（{len(customers)}名）")
+            return
+        if previous:
+            old = {c["pid"]: c["name"] for c in previous["customers"]}
+            new = {c["pid"]: c["name"] for c in customers}
+            for pid in new.keys() - old.keys():
+                logger.info(f"  + 追加された利用者: {new[pid]} (PID: {pid})")
+            for pid in old.keys() - new.keys():
+                logger.info(f"  - 削除された利用者: {old[pid]} (PID: {pid})")
+            for pid in new.keys() & old.keys():
+                if new[pid] != old[pid]:
+                    logger.info(f"  * 名前が変更された利用者: {old[pid]} -> {new[pid]} (PID: {pid})")
+        try:
+            ensure_private_dir(self.cache_dir)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"hash": digest, "saved_at": time.time(),
+                           "customers": customers}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"利用者一覧の保存に失敗: {e}")
+
+
+class SessionCache:
+    """ログイン済みセッションのCookieを USERNAME・GROUP_NAME ごとに有効期限付きで保存する"""
+
+    def __init__(self, ttl=SESSION_TTL, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, f"session_{_account_key()}.json")
+        self.ttl = ttl
+
+    def load(self):
+        """有効期限内のCookieを返す（なければ None）"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            logger.info("セッションキャッシュの有効期限が切れています")
+            return None
+        return entry.get("cookies") or None
+
+    def save(self, cookies):
+        """Cookieを所有者のみ読み書きできるファイルに保存する"""
+        expires_at = time.time() + self.ttl
+        for cookie in cookies:
+            if cookie.get("expiry"):
+                expires_at = min(expires_at, cookie["expiry"])
+        try:
+            ensure_private_dir(self.cache_dir)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"saved_at": time.time(), "expires_at": expires_at,
+                           "cookies": cookies}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"セッションキャッシュの保存に失敗: {e}")
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _cdp_cookie(cookie):
+    """Seleniumの get_cookies() 形式を DevTools の Network.setCookie の引数に変換する"""
+    params = {
+        "name": cookie["name"],
+        "value": cookie["value"],
+        "path": cookie.get("path") or "/",
+        "secure": bool(cookie.get("secure")),
+        "httpOnly": bool(cookie.get("httpOnly")),
+    }
+    domain = cookie.get("domain") or ""
+    if domain.startswith("."):
+        params["domain"] = domain
+    else:
+        # ホスト限定のCookieはURLで指定する
+        scheme = urlparse(BASE_URL).scheme
+        params["url"] = f"{scheme}://{domain or urlparse(BASE_URL).netloc}{params['path']}"
+    if cookie.get("expiry"):
+        params["expires"] = cookie["expiry"]
+    if cookie.get("sameSite") in ("Strict", "Lax", "None"):
+        params["sameSite"] = cookie["sameSite"]
+    return params
+
+
+class CustomerScrapeError(Exception):
+    """利用者1人分のスケジュール取得に失敗したことを表す（メッセージが失敗理由）"""
+
+
+class CircuitBreaker:
+    """直近の利用者の取得の失敗率が閾値以上になったら開き、以降の取得を止める（サイト停止の検知）"""
+
+    def __init__(self, threshold=0.8, window=10):
+        self.threshold = threshold
+        self._recent = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.is_open = False
+
+    def record(self, ok):
+        """1人分の結果を記録し、開いているかを返す"""
+        with self.lock:
+            self._recent.append(ok)
+            failures = self._recent.count(False)
+            if not self.is_open and len(self._recent) == self._recent.maxlen \
+                    and failures / len(self._recent) >= self.threshold:
+                self.is_open = True
+                logger.error(
+                    f"直近{len(self._recent)}名中{failures}名の取得に失敗したため、以降の取得を中止します")
+            return self.is_open
+
+
+class CheckpointStore:
+    """ジョブIDごとに、利用者・月単位の取得結果をSQLiteへ逐次記録する（中断後の再開用）"""
+
+    def __init__(self, job_id, months, day=None, cache_dir=CACHE_DIR):
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", job_id)
+        directory = os.path.join(cache_dir, "checkpoints")
+        ensure_private_dir(cache_dir)
+        ensure_private_dir(directory)
+        self.path = os.path.join(directory, f"{safe_id}.sqlite3")
+        self.purge_expired(directory, keep=self.path)
+        self.target = ",".join(f"{y}-{m:02d}" for y, m in months) + \
+            (f"-{day:02d}" if day else "")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS customers (
+                pid TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                name TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                pid TEXT NOT NULL,
+                month TEXT NOT NULL,
+                status TEXT NOT NULL,
+                rows TEXT,
+                error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (pid, month)
+            );
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def purge_expired(directory, keep=None, days=CHECKPOINT_DAYS):
+        """最終更新から days 日を超えたチェックポイントを削除する（keep は削除しない）"""
+        limit = time.time() - days * 86400
+        for entry in os.scandir(directory):
+            if not entry.name.endswith(".sqlite3") or entry.path == keep:
+                continue
+            try:
+                if entry.stat().st_mtime < limit:
+                    os.remove(entry.path)
+                    logger.info(f"期限切れのチェックポイントを削除しました: {entry.path}")
+            except OSError:
+                pass
+
+    def remove(self):
+        """ジョブが完了したらチェックポイントを削除する"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _matches_target(self):
+        row = self.conn.execute(
+            "SELECT value FROM meta WHERE key = 'target'").fetchone()
+        return row is not None and row[0] == self.target
+
+    def load_roster(self):
+        """前回保存した利用者一覧を元の順番で返す（対象年月が異なる場合は空）"""
+        with self.lock:
+            if not self._matches_target():
+                return []
+            rows = self.conn.execute(
+                "SELECT name, pid FROM customers ORDER BY position").fetchall()
+        return [{"name": name, "pid": pid} for name, pid in rows]
+
+    def start(self, customers, resume):
+        """利用者一覧を登録する。resume でなければ前回の記録を破棄して最初からやり直す"""
+        with self.lock:
+            if resume and not self._matches_target():
+                logger.warning(
+                    f"チェックポイントの対象年月が異なるため最初から処理します: {self.path}")
+                resume = False
+            if not resume:
+                self.conn.execute("DELETE FROM customers")
+                self.conn.execute("DELETE FROM results")
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('target', ?)",
+                    (self.target,))
+            self.conn.executemany(
+                "INSERT INTO customers (pid, position, name) VALUES (?, ?, ?) "
+                "ON CONFLICT(pid) DO UPDATE SET position = excluded.position, name = excluded.name",
+                [(c["pid"], pos, c["name"]) for pos, c in enumerate(customers)])
+            self.conn.commit()
+
+    def completed_results(self):
+        """取得済みの {(PID, (年, 月)): ScheduleRecord のリスト}"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT r.pid, r.month, r.rows, c.name FROM results r "
+                "LEFT JOIN customers c ON c.pid = r.pid WHERE r.status = 'done'").fetchall()
+        results = {}
+        for pid, month, data, name in rows:
+            year, mon = month.split("-")
+            results[(pid, (int(year), int(mon)))] = \
+                schedule_records(json.loads(data), month, name, pid) if data else []
+        return results
+
+    def record(self, cust, year_month, rows, error=None):
+        """1人・1か月分の結果を即座に書き込む（失敗した場合は再開時に再取得の対象になる）"""
+        status = "failed" if error else "done"
+        year, month = year_month
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (pid, month, status, rows, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cust["pid"], f"{year}-{month:02d}", status,
+                 json.dumps(schedule_dicts(rows), ensure_ascii=False), error, time.time()))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def month_is_closed(year, month, closed_after_days, today=None):
+    """締まった月か（当月・前月ではなく、月末から closed_after_days 日を超えて経過している）"""
+    today = today or date.today()
+    months_ago = (today.year - year) * 12 + (today.month - month)
+    if months_ago < 2:
+        return False
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    return (today - last_day).days > closed_after_days
+
+
+class MonthResultCache:
+    """利用者・年月ごとの取得結果を保存し、締まった月の再取得を省略する
+
+    PID は事業所ごとの番号のため、接続先・アカウントごとに別のファイルに保存する。
+    """
+
+    def __init__(self, closed_after_days=MONTH_CACHE_DAYS, cache_dir=CACHE_DIR):
+        ensure_private_dir(cache_dir)
+        self.path = os.path.join(cache_dir, f"month_results_{_account_key()}.sqlite3")
+        self.closed_after_days = closed_after_days
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                pid TEXT NOT NULL,
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                rows TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (pid, year, month)
+            )
+        """)
+        self.conn.commit()
+
+    def is_closed(self, year, month):
+        return month_is_closed(year, month, self.closed_after_days)
+
+    def get(self, pid, year, month, name=None):
+        """キャッシュ済みの結果（ScheduleRecord のリスト）を返す（締まっていない月・未取得の場合は None）"""
+        if not self.is_closed(year, month):
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT rows FROM results WHERE pid = ? AND year = ? AND month = ?",
+                (pid, year, month)).fetchone()
+        return schedule_records(json.loads(row[0]), f"{year}-{month:02d}", name, pid) if row else None
+
+    def put(self, pid, year, month, records):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (pid, year, month, rows, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (pid, year, month, json.dumps(schedule_dicts(records), ensure_ascii=False), time.time()))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# スケジュールの1行の項目（スナップショットのハッシュと差分の比較に使う）
+SCHEDULE_FIELDS = ("date", "time", "service", "staff")
+
+
+def snapshot_scope(year, month, day=None):
+    """スナップショットの対象期間を表す文字列（"YYYY-MM" または "YYYY-MM-DD"）"""
+    return f"{year}-{month:02d}" + (f"-{day:02d}" if day else "")
+
+
+class SnapshotStore:
+    """利用者・期間ごとの取得結果と内容のハッシュを名前（ラベル）付きで保存する
+
+    保存した内容は commit() まで確定しない（途中で失敗した実行で前回のスナップショットを上書きしない）。
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        ensure_private_dir(cache_dir)
+        self.path = os.path.join(cache_dir, f"snapshots_{_account_key()}.sqlite3")
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                label TEXT NOT NULL,
+                scope TEXT NOT NULL,
+                pid TEXT NOT NULL,
+                name TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                rows TEXT NOT NULL,
+                taken_at REAL NOT NULL,
+                PRIMARY KEY (label, scope, pid)
+            )
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def content_hash(rows):
+        payload = json.dumps([r.key() for r in rows],
+                             ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, label, scope, pid, name=None):
+        """保存済みの (ハッシュ, ScheduleRecord のリスト) を返す（未保存なら None）"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hash, rows FROM snapshots WHERE label = ? AND scope = ? AND pid = ?",
+                (label, scope, pid)).fetchone()
+        # scope は "YYYY-MM" または "YYYY-MM-DD"
+        return (row[0], schedule_records(json.loads(row[1]), scope[:7], name, pid)) if row else None
+
+    def customers(self, label, scope):
+        """保存済みの利用者 {PID: 名前}"""
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT pid, name FROM snapshots WHERE label = ? AND scope = ?",
+                (label, scope)).fetchall())
+
+    def put(self, label, scope, pid, name, rows, digest):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshots (label, scope, pid, name, hash, rows, taken_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (label, scope, pid, name, digest,
+                 json.dumps(schedule_dicts(rows), ensure_ascii=False), time.time()))
+
+    def delete(self, label, scope, pid):
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM snapshots WHERE label = ? AND scope = ? AND pid = ?",
+                (label, scope, pid))
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.conn.rollback()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def diff_schedules(old, new):
+    """前回と今回のスケジュールを比べ、追加・削除・変更された行を op 付きで返す
+
+    完全に一致する行を除いたうえで、日付と時間帯が同じ行どうしは変更（changed）とみなす。
+    """
+    unmatched = Counter(r.key() for r in old)
+    added = []
+    for r in new:
+        if unmatched[r.key()]:
+            unmatched[r.key()] -= 1
+        else:
+            added.append(r)
+    removed_by_slot = {}
+    for r in old:
+        if unmatched[r.key()]:
+            unmatched[r.key()] -= 1
+            removed_by_slot.setdefault((r.date_text, r.time_text), []).append(r)
+
+    delta = []
+    for r in added:
+        previous = removed_by_slot.get((r.date_text, r.time_text))
+        if previous:
+            previous.pop(0)
+            delta.append(r.with_op("changed"))
+        else:
+            delta.append(r.with_op("added"))
+    for rows in removed_by_slot.values():
+        delta.extend(r.with_op("removed") for r in rows)
+    return delta
+
+
+# CSVのヘッダー行
+CSV_HEADER = ["利用者名", "日付", "時間帯", "サービス内容", "スタッフ名"]
+
+
+def csv_filename(year, month, day=None):
+    """出力するCSVのファイル名"""
+    if day:
+        return f"schedule_{year}_{month:02d}_{day:02d}.csv"
+    return f"schedule_{year}_{month:02d}.csv"
+
+
+def csv_range_filename(first, last):
+    """複数月をまとめたCSVのファイル名"""
+    return f"schedule_{first[0]}_{first[1]:02d}-{last[0]}_{last[1]:02d}.csv"
+
+
+def diff_filename(csv_name):
+    """--diff-against で出力する差分CSVのファイル名"""
+    return csv_name[:-len(".csv")] + "_diff.csv"
+
+
+def parse_shard(text):
+    """"i/N" を (i, N) にする（i は1始まり）。形式が正しくない場合は ValueError"""
+    m = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", text or "")
+    if not m or not 1 <= int(m.group(1)) <= int(m.group(2)):
+        raise ValueError(f"シャードの指定が正しくありません: {text}")
+    return int(m.group(1)), int(m.group(2))
+
+
+def shard_of(pid, shards):
+    """PID を担当するシャードの番号（1始まり）
+
+    ホストや Python のプロセスによらず同じ結果になるよう、組み込みの hash() ではなく SHA-256 で分ける。
+    """
+    return int(hashlib.sha256(str(pid).encode("utf-8")).hexdigest(), 16) % shards + 1
+
+
+def shard_filename(csv_name, shard):
+    """--shard i/N で出力するCSVのファイル名（例: schedule_2025_11_shard2of4.csv）"""
+    return csv_name[:-len(".csv")] + f"_shard{shard[0]}of{shard[1]}.csv"
+
+
+def manifest_filename(csv_name):
+    """シャードのCSVと一緒に出力するマニフェスト（担当した利用者と件数）のファイル名"""
+    return csv_name[:-len(".csv")] + ".manifest.json"
+
+
+# 出力形式ごとの拡張子（--output で複数指定できる）
+OUTPUT_EXTENSIONS = {"csv": ".csv", "sqlite": ".sqlite3", "parquet": ".parquet", "arrow": ".arrow",
+                     "summary": ".summary.json"}
+
+# 時間帯セルの "09:00～10:30" から開始・終了時刻を取り出す
+TIME_RANGE_RE = re.compile(r"(\d{1,2}):(\d{2})\s*[～〜~\-－]\s*(\d{1,2}):(\d{2})")
+
+
+def output_filename(csv_name, fmt):
+    """CSVのファイル名を出力形式の拡張子に置き換える"""
+    return csv_name[:-len(".csv")] + OUTPUT_EXTENSIONS[fmt]
+
+
+def parse_time_range(time_text):
+    """時間帯の文字列から (開始, 終了) を0時からの分で返す。読み取れない場合は (None, None)"""
+    m = TIME_RANGE_RE.search(time_text or "")
+    if not m:
+        return None, None
+    h1, m1, h2, m2 = (int(v) for v in m.groups())
+    return h1 * 60 + m1, h2 * 60 + m2
+
+
+class ScheduleRecord:
+    """スケジュール1行分の元の文字列と、解析した値（サービス提供日・開始/終了の0時からの分）
+
+    表の読み取り時に1行につき1回だけ作り、CSV・型付きの出力・月次キャッシュ・スナップショットで共有する。
+    行数が多いため、__slots__ で1行ごとの属性の辞書を持たないようにしている。
+    """
+
+    __slots__ = ("month", "customer", "pid", "date_text", "time_text", "service", "staff",
+                 "service_date", "start_minutes", "end_minutes", "op")
+
+    def __init__(self, date_text, time_text, service, staff, month, customer=None, pid=None):
+        """month は "YYYY-MM"。日付セルには年月が含まれないことがあるため、対象の年月から日付を組み立てる"""
+        self.month = month
+        self.customer = customer
+        self.pid = pid
+        self.date_text = date_text
+        self.time_text = time_text
+        self.service = service
+        self.staff = staff
+        year, mon = (int(v) for v in month.split("-"))
+        day = parse_day(date_text)
+        try:
+            self.service_date = date(year, mon, day) if day else None
+        except ValueError:
+            self.service_date = None
+        self.start_minutes, self.end_minutes = parse_time_range(time_text)
+        # 差分の操作（added / removed / changed）。差分でない行は None
+        self.op = None
+
+    @classmethod
+    def from_dict(cls, sched, month, customer=None, pid=None):
+        """キャッシュ・スナップショットに保存した辞書（SCHEDULE_FIELDS）から作る"""
+        return cls(sched["date"], sched["time"], sched["service"], sched["staff"],
+                   month, customer, pid)
+
+    def key(self):
+        """元の文字列 (日付, 時間, サービス, スタッフ)。差分・内容のハッシュに使う"""
+        return (self.date_text, self.time_text, self.service, self.staff)
+
+    def to_dict(self):
+        """キャッシュ・スナップショットに保存する辞書（SCHEDULE_FIELDS）"""
+        return dict(zip(SCHEDULE_FIELDS, self.key()))
+
+    def with_op(self, op):
+        """差分の操作 op を付けた複製を返す（解析し直さない）"""
+        record = object.__new__(ScheduleRecord)
+        for slot in self.__slots__:
+            setattr(record, slot, getattr(self, slot))
+        record.op = op
+        return record
+
+    def __eq__(self, other):
+        if not isinstance(other, ScheduleRecord):
+            return NotImplemented
+        return self.month == other.month and self.key() == other.key()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"ScheduleRecord({self.month}, {self.key()!r})"
+
+    @property
+    def day(self):
+        """日付セルの日（1-31）。読み取れない場合は None"""
+        return self.service_date.day if self.service_date else parse_day(self.date_text)
+
+    @property
+    def minutes(self):
+        """サービス提供時間（分）。終了が開始より前なら日付をまたぐとみなす。時間帯を読み取れない場合は None"""
+        if self.start_minutes is None:
+            return None
+        return (self.end_minutes - self.start_minutes) % (24 * 60)
+
+
+def schedule_records(scheds, year_month, customer=None, pid=None):
+    """保存済みのスケジュールの辞書のリストを ScheduleRecord のリストにする"""
+    return [ScheduleRecord.from_dict(s, year_month, customer, pid) for s in scheds]
+
+
+def schedule_dicts(records):
+    """ScheduleRecord のリストをキャッシュ・スナップショットに保存する辞書のリストにする"""
+    return [r.to_dict() for r in records]
+
+
+class StreamingWriter:
+    """利用者ごとの結果を一覧の順番どおりに書き出し、完了時にリネームで確定する出力の基底クラス
+
+    並列取得で順番が前後した利用者は、手前の利用者が揃うまでだけ保持する。
+    スレッドから使う場合は呼び出し側で排他すること。
+    add() には ScheduleRecord のリストを渡す。year_month（"YYYY-MM"）を指定しない場合は、各行の r.month を年月として使う。
+    """
+
+    format = None
+    # True の場合は差分（各行の r.op）を出力する
+    op_column = False
+
+    def __init__(self, filename, year_month=None):
+        self.filename = filename
+        self.partial_path = f"{filename}.part"
+        self.year_month = year_month
+        self._pending = {}
+        self._next = 1
+        self.row_count = 0
+        # 書き込んだ順の (利用者名, 件数)・PID・サービス提供時間（分）
+        self.counts = []
+        self.pids = []
+        self.customer_minutes = []
+
+    def add(self, idx, name, scheds, pid=None):
+        """idx番目（1始まり）の利用者の結果を受け取り、書き込める分を書き出す"""
+        self._pending[idx] = (name, pid, scheds)
+        while self._next in self._pending:
+            self._write(*self._pending.pop(self._next))
+            self._next += 1
+        self._flush()
+
+    def _write(self, name, pid, scheds):
+        self._write_rows(name, pid, scheds)
+        self.row_count += len(scheds)
+        self.counts.append((name, len(scheds)))
+        self.pids.append(pid)
+        self.customer_minutes.append(sum(r.minutes or 0 for r in scheds))
+
+    def finalize(self):
+        """残りを書き出してファイルを閉じ、完成したファイルとしてリネームする"""
+        for idx in sorted(self._pending):
+            self._write(*self._pending.pop(idx))
+        self._close()
+        os.replace(self.partial_path, self.filename)
+
+    def abort(self):
+        """書きかけのファイルを破棄する"""
+        self._discard()
+        try:
+            os.remove(self.partial_path)
+        except FileNotFoundError:
+            pass
+
+    def _write_rows(self, name, pid, scheds):
+        raise NotImplementedError
+
+    def _flush(self):
+        pass
+
+    def _close(self):
+        pass
+
+    def _discard(self):
+        pass
+
+
+class StreamingCsvWriter(StreamingWriter):
+    """利用者ごとの結果を .part ファイルへ追記するCSV出力"""
+
+    format = "csv"
+
+    def __init__(self, filename, month_column=False, year_month=None, op_column=False):
+        super().__init__(filename, year_month)
+        # True の場合、先頭に「年月」列を付ける（各行の r.month を出力）
+        self.month_column = month_column
+        # True の場合、さらに先頭に「操作」列（added / removed / changed）を付ける
+        self.op_column = op_column
+        # encoding='utf-8-sig' にすることでExcelで文字化けせずに開けます
+        self._file = open(self.partial_path, 'w', newline='', encoding='utf-8-sig')
+        self._writer = csv.writer(self._file)
+        header = ["年月"] + CSV_HEADER if month_column else CSV_HEADER
+        self._writer.writerow(["操作"] + header if op_column else header)
+        self._file.flush()
+
+    def _write_rows(self, name, pid, records):
+        for r in records:
+            row = [
+                name,
+                r.date_text,
+                r.time_text,
+                r.service,
+                r.staff
+            ]
+            if self.month_column:
+                row = [r.month] + row
+            self._writer.writerow([r.op] + row if self.op_column else row)
+
+    def _flush(self):
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+    def _discard(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class SqliteWriter(StreamingWriter):
+    """取得結果を1つのトランザクションでSQLiteに一括登録する出力
+
+    元の文字列と、解析したサービス提供日・開始/終了の分を同じ行に保存する。
+    インデックスは全件の登録後に (customer, service_date, staff) で作成する。
+    """
+
+    format = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE schedules (
+            month TEXT NOT NULL,
+            customer TEXT NOT NULL,
+            pid TEXT,
+            date_text TEXT,
+            time_text TEXT,
+            service TEXT,
+            staff TEXT,
+            service_date TEXT,
+            start_minutes INTEGER,
+            end_minutes INTEGER
+        )
+    """
+
+    def __init__(self, filename, year_month=None):
+        super().__init__(filename, year_month)
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+        # 並列ワーカーからの書き込みは呼び出し側のロックで直列化される
+        self.conn = sqlite3.connect(self.partial_path, isolation_level=None,
+                                    check_same_thread=False)
+        # 書きかけのファイルは完成後にリネームするため、ジャーナルは不要
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute("BEGIN")
+        self.conn.execute(self.SCHEMA)
+
+    def _write_rows(self, name, pid, records):
+        self.conn.executemany(
+            "INSERT INTO schedules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(r.month, r.customer, r.pid, r.date_text, r.time_text, r.service, r.staff,
+              r.service_date.isoformat() if r.service_date else None, r.start_minutes, r.end_minutes)
+             for r in records])
+
+    def _close(self):
+        self.conn.execute(
+            "CREATE INDEX idx_schedules_customer_date_staff ON schedules (customer, service_date, staff)")
+        self.conn.execute("COMMIT")
+        self.conn.close()
+
+    def _discard(self):
+        try:
+            self.conn.close()
+        except sqlite3.Error:
+            pass
+
+
+class ArrowWriter(StreamingWriter):
+    """取得結果を列ごとに保持し、完了時に Parquet または Arrow IPC ファイルとして書き出す（pyarrow が必要）"""
+
+    COLUMNS = ("month", "customer", "pid", "date_text", "time_text", "service", "staff",
+               "service_date", "start_minutes", "end_minutes")
+
+    def __init__(self, filename, fmt="parquet", year_month=None):
+        if pa is None:
+            raise RuntimeError("Parquet/Arrow の出力には pyarrow が必要です（pip install pyarrow）")
+        super().__init__(filename, year_month)
+        self.format = fmt
+        self._columns = {key: [] for key in self.COLUMNS}
+
+    def _write_rows(self, name, pid, records):
+        for key in self.COLUMNS:
+            self._columns[key].extend(getattr(r, key) for r in records)
+
+    def _close(self):
+        schema = pa.schema(
+            [(key, pa.string()) for key in self.COLUMNS[:7]]
+            + [("service_date", pa.date32()),
+               ("start_minutes", pa.int16()), ("end_minutes", pa.int16())])
+        table = pa.table(self._columns, schema=schema)
+        if self.format == "parquet":
+            pq.write_table(table, self.partial_path)
+        else:
+            with pa.OSFile(self.partial_path, "wb") as sink:
+                with pa.ipc.new_file(sink, schema) as writer:
+                    writer.write_table(table)
+
+
+class SummaryWriter(StreamingWriter):
+    """利用者・スタッフごとのサービス提供時間と件数、日ごとの件数を集計し、完了時にJSONとして書き出す
+
+    行は受け取った時点で集計し、保持しない。
+    """
+
+    format = "summary"
+
+    def __init__(self, filename, year_month=None):
+        super().__init__(filename, year_month)
+        # 利用者（一覧の順）・スタッフ・サービス提供日ごとの {"visits": 件数, "minutes": 分}
+        self.customers = []
+        self.staff = {}
+        self.days = {}
+        self.minutes = 0
+        # 時間帯・日付を読み取れなかった行数（サービス提供時間・日ごとの集計には含めない）
+        self.unparsed_time = 0
+        self.unparsed_date = 0
+
+    def _write_rows(self, name, pid, records):
+        customer = {"pid": pid, "name": name, "visits": len(records), "minutes": 0}
+        self.customers.append(customer)
+        for r in records:
+            minutes = r.minutes
+            if minutes is None:
+                self.unparsed_time += 1
+                minutes = 0
+            customer["minutes"] += minutes
+            staff = self.staff.setdefault(r.staff, {"visits": 0, "minutes": 0})
+            staff["visits"] += 1
+            staff["minutes"] += minutes
+            if r.service_date is None:
+                self.unparsed_date += 1
+            else:
+                day = self.days.setdefault(r.service_date, {"visits": 0, "minutes": 0})
+                day["visits"] += 1
+                day["minutes"] += minutes
+        self.minutes += customer["minutes"]
+
+    def _close(self):
+        summary = {
+            "year_month": self.year_month,
+            "rows": self.row_count,
+            "minutes": self.minutes,
+            "unparsed_time": self.unparsed_time,
+            "unparsed_date": self.unparsed_date,
+            "customers": self.customers,
+            "staff": [{"name": name, **totals} for name, totals in
+                      sorted(self.staff.items(), key=lambda kv: (-kv[1]["minutes"], kv[0]))],
+            "days": [{"date": day.isoformat(), **totals} for day, totals in sorted(self.days.items())],
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(self.partial_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1)
+
+
+def open_output_writer(fmt, csv_name, year_month=None, month_column=False, diff=False):
+    """出力形式 fmt の書き出しを開始する（ファイル名はCSVの拡張子を置き換えたもの）
+
+    diff=True の場合、CSVは差分CSV（「操作」列付き）として出力する。
+    """
+    if fmt == "csv":
+        if diff:
+            return StreamingCsvWriter(diff_filename(csv_name), month_column=month_column,
+                                      year_month=year_month, op_column=True)
+        return StreamingCsvWriter(csv_name, month_column=month_column, year_month=year_month)
+    filename = output_filename(csv_name, fmt)
+    if fmt == "sqlite":
+        return SqliteWriter(filename, year_month)
+    if fmt == "summary":
+        return SummaryWriter(filename, year_month)
+    return ArrowWriter(filename, fmt, year_month)
+
+
+# 子要素を持たない（閉じタグのない）HTML要素
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input",
+              "link", "meta", "source", "track", "wbr"}
+
+
+def _normalize_cell_text(raw):
+    """ブラウザの表示テキスト（innerText）に近い形に空白を整える"""
+    lines = (" ".join(line.split()) for line in raw.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+class ScheduleTableParser(HTMLParser):
+    """editCustomer ページのHTMLから serviceDate と一覧テーブルのセルを取り出す"""
+
+    COLUMNS = ("day", "time", "service", "staff")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.columns = {key: [] for key in self.COLUMNS}
+        self.service_date = None
+        self.has_table = False
+        # 取得中のセル: [列名, ネストの深さ, テキスト断片]
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if tag == "input" and attrs.get("id") == "serviceDate":
+            self.service_date = attrs.get("value") or None
+        if "list_table" in classes:
+            self.has_table = True
+
+        if self._cell is not None:
+            if tag == "br":
+                self._cell[2].append("\n")
+            elif tag not in _VOID_TAGS:
+                self._cell[1] += 1
+            return
+
+        if "edit" in classes and tag not in _VOID_TAGS:
+            for key in self.COLUMNS:
+                if key in classes:
+                    self._cell = [key, 1, []]
+                    break
+
+    def handle_endtag(self, tag):
+        if self._cell is None or tag in _VOID_TAGS:
+            return
+        self._cell[1] -= 1
+        if self._cell[1] == 0:
+            key, _, parts = self._cell
+            self.columns[key].append(_normalize_cell_text("".join(parts)))
+            self._cell = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell[2].append(data)
+
+    def rows(self):
+        """SCHEDULE_ROWS_SCRIPT と同じ [日付, 時間, サービス, スタッフ] の配列を返す"""
+        cols = [self.columns[key] for key in self.COLUMNS]
+        return [[col[i] if i < len(col) else "" for col in cols]
+                for i in range(len(cols[0]))]
+
+
+class CustomerListParser(HTMLParser):
+    """利用者一覧ページのHTMLから span.planJisseki の PID と行内の名前を取り出す"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.has_customer_list = False
+        # (出現順, PID, 名前) のリスト
+        self._found = []
+        # 開いている <tr> ごとの {"pids": [(出現順, PID)], "name": 名前}
+        self._rows = []
+        self._name_parts = None
+        self._order = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get("class") or "").split()
+        if attrs.get("id") == "customerList":
+            self.has_customer_list = True
+        if tag == "tr":
+            self._rows.append({"pids": [], "name": None})
+        elif tag == "span" and "planJisseki" in classes:
+            pid = attrs.get("pid")
+            if pid:
+                self._order += 1
+                if self._rows:
+                    self._rows[-1]["pids"].append((self._order, pid))
+                else:
+                    self._found.append((self._order, pid, None))
+        elif tag == "a" and "focus" in classes and self._rows \
+                and self._rows[-1]["name"] is None:
+            self._name_parts = []
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._name_parts is not None:
+            if self._rows:
+                self._rows[-1]["name"] = "".join(self._name_parts).strip()
+            self._name_parts = None
+        elif tag == "tr" and self._rows:
+            self._close_row(self._rows.pop())
+
+    def handle_data(self, data):
+        if self._name_parts is not None:
+            self._name_parts.append(data)
+
+    def _close_row(self, row):
+        for order, pid in row["pids"]:
+            self._found.append((order, pid, row["name"]))
+
+    def customers(self):
+        """get_all_customers と同じ形式 [{"name", "pid"}] で返す"""
+        while self._rows:
+            self._close_row(self._rows.pop())
+        return [{"name": name or f"利用者ID_{pid}", "pid": pid}
+                for _, pid, name in sorted(self._found)]
+
+
+def parse_schedule_page(html):
+    """editCustomer ページのHTMLを (serviceDate, テーブルの有無, 行の配列) にする"""
+    parser = ScheduleTableParser()
+    parser.feed(html)
+    return parser.service_date, parser.has_table, parser.rows()
+
+
+def parse_customer_page(html):
+    """利用者一覧ページのHTMLを [{"name", "pid"}] にする（customerList要素がない場合は RuntimeError）"""
+    parser = CustomerListParser()
+    parser.feed(html)
+    if not parser.has_customer_list:
+        raise RuntimeError("customerList要素が見つかりません")
+    return parser.customers()
+
+
+class LoginFormParser(HTMLParser):
+    """ログインページのフォームから送信先と入力項目（hiddenのトークン等を含む）を集める"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.action = None
+        self.fields = {}
+        self.group_field = None
+        self.submit_field = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form" and self.action is None:
+            self.action = attrs.get("action")
+        elif tag in ("input", "button"):
+            name = attrs.get("name")
+            if not name:
+                return
+            input_type = (attrs.get("type") or "text").lower()
+            if attrs.get("id") == "UserGroupGroupname2":
+                self.group_field = name
+            if input_type == "submit" or tag == "button":
+                if name == "login":
+                    self.submit_field = (name, attrs.get("value") or "")
+                return
+            if input_type in ("checkbox", "radio") and "checked" not in attrs:
+                return
+            self.fields.setdefault(name, attrs.get("value") or "")
+
+
+class HttpPageFetcher:
+    """ログイン済みセッションのCookieを使い、ブラウザを介さずにページをHTTPで取得する"""
+
+    def __init__(self, pool_size=4, timeout=PAGE_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Keep-Aliveの接続を並列ワーカー数ぶんプールして使い回す
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max(1, pool_size))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.logged_in = False
+
+    def load_cookies_from_driver(self, driver):
+        """Seleniumでログインしたブラウザのセッションを引き継ぐ"""
+        for cookie in driver.get_cookies():
+            self.session.cookies.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain"), path=cookie.get("path", "/"))
+        try:
+            self.session.headers["User-Agent"] = driver.execute_script(
+                "return navigator.userAgent")
+        except Exception:
+            pass
+        self.logged_in = True
+
+    def export_cookies(self):
+        """セッションのCookieを Selenium の get_cookies() と同じ形式で返す"""
+        cookies = []
+        for c in self.session.cookies:
+            cookie = {"name": c.name, "value": c.value, "domain": c.domain,
+                      "path": c.path, "secure": bool(c.secure)}
+            if c.expires:
+                cookie["expiry"] = c.expires
+            cookies.append(cookie)
+        return cookies
+
+    def restore_session(self, cookies):
+        """保存済みのCookieを読み込み、BASE_URLへの1回のリクエストで有効か確認する"""
+        for cookie in cookies:
+            self.session.cookies.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain"), path=cookie.get("path", "/"))
+        resp = self.session.get(BASE_URL, timeout=self.timeout)
+        self.logged_in = resp.ok and "login" not in resp.url
+        return self.logged_in
+
+    def login(self):
+        """ログインフォームをブラウザなしでPOSTしてログインする"""
+        logger.info("ログイン処理を開始（HTTP）...")
+        try:
+            resp = self.session.get(LOGIN_URL, timeout=self.timeout)
+            resp.raise_for_status()
+            form = LoginFormParser()
+            form.feed(resp.text)
+
+            data = dict(form.fields)
+            data["data[User][username]"] = USERNAME
+            data["data[User][password]"] = PASSWORD
+            if form.group_field:
+                # 担当者コードがある場合
+                data[form.group_field] = GROUP_NAME
+            name, value = form.submit_field or ("login", "")
+            data[name] = value
+
+            action = urljoin(resp.url, form.action or LOGIN_URL)
+            resp = self.session.post(action, data=data, timeout=self.timeout)
+            resp.raise_for_status()
+            if "login" in resp.url:
+                logger.error("ログイン失敗（HTTP）: ログインページから遷移しませんでした")
+                return False
+            logger.info("ログイン成功（HTTP）")
+            self.logged_in = True
+            return True
+        except Exception as e:
+            logger.error(f"ログイン失敗（HTTP）: {e}")
+            return False
+
+    def fetch(self, url):
+        """ページのHTMLを取得する。ログインページに戻された場合は None"""
+        resp = self.session.get(url, timeout=self.timeout)
+        resp.raise_for_status()
+        if "login" in resp.url:
+            self.logged_in = False
+            return None
+        return resp.text
+
+    def fetch_customers(self):
+        """利用者一覧ページを取得して ([{"name", "pid"}], HTML) を返す"""
+        html = self.fetch(f"{BASE_URL}/customers")
+        if html is None:
+            raise RuntimeError("セッションが切れています")
+        return parse_customer_page(html), html
+
+    def fetch_schedule(self, url):
+        """editCustomer ページを取得して (serviceDate, テーブルの有無, 行の配列, HTML) を返す"""
+        html = self.fetch(url)
+        if html is None:
+            raise RuntimeError("セッションが切れています")
+        return (*parse_schedule_page(html), html)
+
+
+def archive_filename(csv_name):
+    """--record で保存するページのアーカイブのファイル名（例: schedule_2025_11.pages.zip）"""
+    return csv_name[:-len(".csv")] + ".pages.zip"
+
+
+def archive_page_name(pid, year, month, day=None):
+    """アーカイブ内の利用者ページのファイル名"""
+    return f"pages/{pid}/{snapshot_scope(year, month, day)}.html"
+
+
+class PageArchive:
+    """ジョブ中に取得したページのHTMLを1つの圧縮アーカイブ（ZIP）に保存する（--record）
+
+    利用者一覧は roster.html、利用者ページは pages/<PID>/<YYYY-MM[-DD]>.html に保存し、
+    対象期間と各ページのURL・取得時刻を index.json に記録する。close() で .part から確定する。
+    """
+
+    def __init__(self, path, months, day=None):
+        self.path = path
+        self.partial_path = f"{path}.part"
+        self.lock = threading.Lock()
+        self._zip = zipfile.ZipFile(self.partial_path, "w", compression=zipfile.ZIP_DEFLATED)
+        self.index = {
+            "base_url": BASE_URL,
+            "months": [f"{y}-{m:02d}" for y, m in months],
+            "day": day,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "roster": None,
+            "customers": [],
+            # --shard i/N で記録した場合は [i, N]（再生時の出力ファイル名にも付ける）
+            "shard": None,
+            "pages": {},
+        }
+
+    def _write(self, name, html):
+        with self.lock:
+            self._zip.writestr(name, html)
+
+    def add_roster(self, html, url):
+        self._write("roster.html", html)
+        self.index["roster"] = {"url": url, "fetched_at": time.time()}
+
+    def add_page(self, pid, year, month, day, html, url):
+        name = archive_page_name(pid, year, month, day)
+        self._write(name, html)
+        with self.lock:
+            self.index["pages"][name] = {"url": url, "fetched_at": time.time()}
+
+    def close(self):
+        """index.json を書き込み、アーカイブを確定する"""
+        with self.lock:
+            self._zip.writestr("index.json", json.dumps(self.index, ensure_ascii=False, indent=1))
+            self._zip.close()
+        os.replace(self.partial_path, self.path)
+        logger.info(f"ページのアーカイブ保存完了: {self.path}（{len(self.index['pages'])}ページ, "
+                    f"{os.path.getsize(self.path) / 1024:.1f}KB）")
+
+    def abort(self):
+        """書きかけのアーカイブを破棄する"""
+        with self.lock:
+            self._zip.close()
+        try:
+            os.remove(self.partial_path)
+        except FileNotFoundError:
+            pass
+
+
+class PageArchiveReader:
+    """PageArchive で保存したアーカイブからページのHTMLを読み出す（--replay）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        self.index = json.loads(self._zip.read("index.json"))
+
+    def months(self):
+        """記録した対象の [(年, 月)]"""
+        return [tuple(int(v) for v in ym.split("-")) for ym in self.index["months"]]
+
+    def customers(self):
+        """記録したジョブの対象者 [{"name", "pid"}]"""
+        return [{"name": name, "pid": pid} for pid, name in self.index.get("customers", [])]
+
+    def shard(self):
+        """記録したときのシャード (i, N)。シャードなしで記録した場合は None"""
+        shard = self.index.get("shard")
+        return tuple(shard) if shard else None
+
+    def roster_html(self):
+        if self.index.get("roster") is None:
+            return None
+        return self._zip.read("roster.html").decode("utf-8")
+
+    def page_html(self, pid, year, month, day=None):
+        """利用者ページのHTML（記録されていない場合は None）"""
+        name = archive_page_name(pid, year, month, day)
+        if name not in self.index["pages"]:
+            return None
+        return self._zip.read(name).decode("utf-8")
+
+    def close(self):
+        self._zip.close()
+
+
+def customer_url(pid, year, month, day=None):
+    """利用者の実績ページのURL（?year=&month= で年月を指定してみる。反映されない場合は年月を切り替える）"""
+    url = f"{BASE_URL}/jissekis/editCustomer/{pid}?year={year}&month={month}"
+    if day:
+        # 日の指定に対応していれば、サーバー側でその日だけに絞り込まれる
+        url += f"&day={day}"
+    return url
+
+
+def same_page_url(current, expected):
+    """current が expected と同じパス・クエリ（PID と年月）のページか"""
+    a, b = urlparse(current or ""), urlparse(expected)
+    return a.path == b.path and parse_qs(a.query) == parse_qs(b.query)
+
 
 class KantanKaigoFastScraper:
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, workers=1, page_timeout=PAGE_TIMEOUT,
+                 verify_extraction=False, fetch_mode="browser", http_login=False,
+                 http_client=None, session_cache=True, month_cache=None,
+                 roster_cache=True, timer=None, profile=False,
+                 browser_profile="default", outputs=("csv",), snapshot_label=None,
+                 adaptive_pacing=False, max_rps=None, customer_budget=None,
+                 retries=0, retry_backoff=5.0, breaker_threshold=None,
+                 month_navigator=None, tabs=1, shard=None, replay=None,
+                 recycle_rss_mb=None, recycle_pages=None):
+        self.headless = headless
+        # 利用者1人・1か月あたりの取得時間の上限（秒）。超えた利用者は失敗として再試行キューに入れる
+        self.customer_budget = customer_budget
+        self._deadline = None
+        # driver.set_page_load_timeout を時間の上限に合わせて変更しているか
+        self._page_load_limited = False
+        # 失敗した利用者を1巡目の後に取得し直す回数と、1回目の待ち時間（以降は2倍ずつ）
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        # 直近の失敗率がこの値以上になったら実行を中止する（None の場合は中止しない）
+        self.breaker_threshold = breaker_threshold
+        # 利用者・期間ごとの取得結果を snapshot_label の名前で保存する（None の場合は保存しない）
+        self.snapshots = SnapshotStore() if snapshot_label else None
+        self.snapshot_label = snapshot_label
+        # 差分CSVの比較対象のスナップショット名（run_months() の間だけ設定される）
+        self._diff_against = None
+        # 取得に失敗した {(PID, (年, 月)): (利用者名, 理由, 試行回数)}（run_months() のたびに作り直す）
+        self._failures = {}
+        # (i, N) の場合、利用者一覧を PID で N 分割した i 番目だけを取得し、マニフェスト付きのCSVを出力する
+        self.shard = shard
+        # 出力形式（"csv"・"sqlite"・"parquet"・"arrow"）。月ごと（または期間ごと）に形式の数だけファイルを作る
+        self.outputs = tuple(outputs)
+        # "lean" の場合、画像・フォント・CSSを読み込まず、DOMContentLoaded で driver.get から戻る
+        self.browser_profile = browser_profile
+        # フェーズごとの所要時間の記録（並列ワーカー間で共有する）
+        self.timer = timer or PhaseTimer()
+        # 年月の切り替え方法の学習（並列ワーカー間で共有する）と、このブラウザで最後に選んだ (年, 月)
+        self.month_nav = month_navigator or MonthNavigationLearner()
+        self._session_month = None
+        # 利用者ページの取得の同時実行数・間隔の調整（並列ワーカー間で共有する）
+        self.pacer = AdaptivePacer(max(1, workers), max_rps, adaptive=adaptive_pacing,
+                                   timer=self.timer) \
+            if adaptive_pacing or max_rps else None
+        # True の場合、実行の最後にフェーズ別の所要時間の集計をログ出力する
+        self.profile = profile
+        # 利用者一覧の保存先（追加・削除の検出と --pids 指定時の名前の参照に使う）
+        self.roster_cache = RosterCache() if roster_cache else None
+        # 締まった月の取得結果キャッシュ（None の場合は毎回取得する）
+        self.month_cache = month_cache
+        # ログイン済みCookieの保存先（None の場合は毎回フォームからログインする）
+        self.session_cache = SessionCache() if session_cache else None
+        self.page_timeout = page_timeout
+        # 一括取得と要素ごとの取得の両方を実行して件数・内容を照合する
+        self.verify_extraction = verify_extraction
+        # 並列ワーカー数（1の場合は従来通り1つのブラウザで順番に処理）
+        self.workers = max(1, workers)
+        # "http" の場合、ログイン後の利用者ページはブラウザを介さずHTTPで取得する
+        self.fetch_mode = fetch_mode
+        self.http_login = http_login
+        self.http = None
+        if fetch_mode == "http":
+            self.http = http_client or HttpPageFetcher(
+                pool_size=self.workers, timeout=page_timeout)
+        self.progress_callback = None
+        # 実行中のジョブのCSV書き出し（run_months() の間だけ設定される）
+        self._writers = []
+        # True の場合（デーモンモード）、ジョブが終わってもブラウザと追加ワーカーを閉じない
+        self.keep_alive = False
+        self._extra_workers = []
+        # 最後にログイン状態を確認した時刻（デーモンモードでは SESSION_TTL の間は確認を省略する）
+        self._logged_in_at = None
+        # 1つのブラウザで開いておくタブの数（2以上の場合、次の利用者のページを別のタブで先に読み込む）
+        self.tabs = max(1, tabs)
+        # 先読み中のタブ {ウィンドウハンドル: (URL, 読み込み開始時刻)}・タブ番号・次に取得する予定のタスク
+        self._tab_pages = {}
+        self._tab_numbers = {}
+        self._upcoming = []
+        self.prefetched = 0
+
+        # ブラウザ（chromedriver とその子プロセス）の RSS がこの値（MB）以上か、起動してからこのページ数を
+        # 開いたら、利用者の間でブラウザを再起動する（None の場合は再起動しない。RSS は常に記録する）
+        self.recycle_rss_mb = recycle_rss_mb
+        self.recycle_pages = recycle_pages
+        self.pages_since_launch = 0
+        self._rss_samples = 0
+        # --record の場合、ジョブ中に取得したページのHTMLの保存先（run_months() の間だけ設定される）
+        self.recorder = None
+        # --replay のアーカイブ（PageArchiveReader）。指定した場合はサイトにアクセスせず、保存したHTMLを解析する
+        self.replay = replay
+
+        # HTTPでログインする場合・アーカイブから再生する場合はブラウザを起動しない
+        self.driver = None
+        self.readiness = PageReadiness(None, page_timeout, self.timer)
+        if replay is not None or (fetch_mode == "http" and http_login):
+            return
+        self._launch_driver()
+
+    def _chrome_options(self):
         options = webdriver.ChromeOptions()
         # 高速化オプション
         options.add_argument('--no-sandbox')
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--disable-gpu')
         # バックグラウンド実行のためヘッドレスモードを有効化
-        if headless:
+        if self.headless:
             options.add_argument('--headless')
         options.add_argument('--disable-blink-features=AutomationControlled')
         options.add_experimental_option("excludeSwitches", ["enable-logging"])
-
-        self.driver = webdriver.Chrome(options=options)
-        self.wait = WebDriverWait(self.driver, 10)
-        self.progress_callback = None
+        if self.browser_profile == "lean":
+            # ページの準備完了は PageReadiness のシグナルで待つため、load イベントまで待たない
+            options.page_load_strategy = 'eager'
+            options.add_argument('--disable-extensions')
+            options.add_argument('--disable-background-networking')
+        if self.tabs > 1:
+            # 裏のタブでもAJAXのタイマーと描画を止めない（先読み中のページの準備が進むように）
+            options.add_argument('--disable-background-timer-throttling')
+            options.add_argument('--disable-renderer-backgrounding')
+            options.add_argument('--disable-backgrounding-occluded-windows')
+        return options
+
+    def _launch_driver(self):
+        """同じ設定でChromeを起動する（メモリ上限による再起動でも使う）"""
+        self.driver = webdriver.Chrome(options=self._chrome_options())
+        if self.browser_profile == "lean":
+            self._block_resources()
+        self.wait = WebDriverWait(self.driver, self.page_timeout)
+        self.readiness.driver = self.driver
+        self._tab_pages.clear()
+        self._tab_numbers.clear()
+        self.pages_since_launch = 0
+
+    def _check_browser_memory(self):
+        """利用者の間にブラウザのRSSを記録し、上限またはページ数を超えていればブラウザを再起動する"""
+        if self.driver is None:
+            return
+        with self.timer.span("browser_rss", pages=self.pages_since_launch) as span:
+            rss = process_tree_rss(self.driver.service.process.pid)
+            span["rss_mb"] = round(rss / 1024 / 1024, 1) if rss is not None else None
+        rss_mb = span["rss_mb"]
+        self._rss_samples += 1
+        if rss_mb is not None and self._rss_samples % 20 == 1:
+            logger.info(f"  ブラウザのメモリ: {rss_mb:.0f}MB（起動してから{self.pages_since_launch}ページ）")
+        if self.recycle_rss_mb and rss_mb is not None and rss_mb >= self.recycle_rss_mb:
+            self._recycle_driver("rss", f"RSS {rss_mb:.0f}MB ≥ {self.recycle_rss_mb:g}MB", rss_mb)
+        elif self.recycle_pages and self.pages_since_launch >= self.recycle_pages:
+            self._recycle_driver(
+                "pages", f"{self.pages_since_launch}ページ ≥ {self.recycle_pages}ページ", rss_mb)
+
+    def _recycle_driver(self, trigger, reason, rss_mb=None):
+        """ブラウザを終了して同じ設定で起動し直し、セッションを引き継ぐ（できなければ再ログインする）"""
+        logger.warning(f"ブラウザを再起動します（{reason}）")
+        start = time.monotonic()
+        try:
+            cookies = self.driver.get_cookies()
+        except Exception:
+            cookies = None
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"  ブラウザの終了に失敗: {e}")
+        try:
+            self._launch_driver()
+            restored = bool(cookies) and self._restore_session(cookies)
+            if restored:
+                self._logged_in_at = time.monotonic()
+            else:
+                # 別のセッションになるため、サーバーに保持された年月も引き継がない
+                self._logged_in_at = None
+                self._session_month = None
+                if not self.login():
+                    logger.error("ブラウザの再起動後のログインに失敗しました")
+        except Exception as e:
+            logger.error(f"ブラウザの再起動に失敗しました: {e}")
+            return
+        elapsed = time.monotonic() - start
+        logger.info(f"ブラウザを再起動しました（{elapsed:.2f}秒, {'セッションを復元' if restored else '再ログイン'}）")
+        self.timer.record("recycle", elapsed, trigger=trigger, reason=reason,
+                          rss_mb=rss_mb, restored=restored)
+
+    def _block_resources(self):
+        """現在のタブで LEAN_BLOCKED_URLS を読み込まないようにする（DevToolsの設定はタブごと）"""
+        self.driver.execute_cdp_cmd("Network.enable", {})
+        self.driver.execute_cdp_cmd(
+            "Network.setBlockedURLs", {"urls": LEAN_BLOCKED_URLS})
 
     def close(self):
-        self.driver.quit()
+        for worker in self._extra_workers:
+            try:
+                worker.close()
+            except Exception:
+                pass
+        self._extra_workers = []
+        if self.driver is not None:
+            self.driver.quit()
+        if self.replay is not None:
+            self.replay.close()
+
+    def _start_budget(self, budget, months):
+        """このワーカーで取得する利用者の時間の上限を設定する（budget は1か月あたりの秒数）"""
+        self._deadline = time.monotonic() + budget * months if budget else None
+        self.readiness.deadline = self._deadline
+        if self._deadline is None and self._page_load_limited:
+            # 上限のない取得（一覧・ログインなど）に戻すため、ページ読み込みの上限を WebDriver の既定値に戻す
+            try:
+                self.driver.set_page_load_timeout(DEFAULT_PAGE_LOAD_TIMEOUT)
+            except Exception:
+                pass
+            self._page_load_limited = False
+
+    def _limit_page_load(self):
+        """driver.get が残りの時間の上限を超えないよう、ページ読み込みのタイムアウトを設定する"""
+        if self._deadline is None:
+            return
+        self.driver.set_page_load_timeout(max(0.1, self._deadline - time.monotonic()))
+        self._page_load_limited = True
+
+    def _budget_exceeded(self):
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    def _webdriver_wait(self):
+        """残りの時間の上限を超えない WebDriverWait"""
+        timeout = self.page_timeout
+        if self._deadline is not None:
+            timeout = max(0.1, min(timeout, self._deadline - time.monotonic()))
+        return WebDriverWait(self.driver, timeout)
+
+    def _end_job(self):
+        """ジョブの終了時にブラウザを閉じる（デーモンモードでは次のジョブのために開いたままにする）"""
+        if not self.keep_alive:
+            self.close()
 
     def login(self):
-        """ログイン処理"""
+        """ログイン処理（有効なセッションキャッシュがあればフォーム入力を省略する）"""
+        if self.replay is not None:
+            return True
+        if self.driver is None and self.http.logged_in:
+            return True
+        if self.keep_alive and self._logged_in_at is not None \
+                and time.monotonic() - self._logged_in_at < SESSION_TTL:
+            # ページ遷移時にログイン画面に戻された場合は _get_logged_in で再ログインする
+            logger.info("ログイン済みのブラウザを使います")
+            return True
+
+        start = time.monotonic()
+        cookies = self.session_cache.load() if self.session_cache else None
+        if cookies:
+            if self._restore_session(cookies):
+                logger.info(
+                    f"ログイン成功（セッションキャッシュから復元, {time.monotonic() - start:.2f}秒）")
+                self._logged_in_at = time.monotonic()
+                return True
+            logger.info(
+                f"キャッシュしたセッションは無効でした（{time.monotonic() - start:.2f}秒）。通常のログインを行います")
+
+        start = time.monotonic()
+        if not self._login_with_form():
+            return False
+        logger.info(f"ログイン完了（フォーム入力, {time.monotonic() - start:.2f}秒）")
+        self._logged_in_at = time.monotonic()
+        if self.session_cache is not None:
+            if self.driver is not None:
+                self.session_cache.save(self.driver.get_cookies())
+            else:
+                self.session_cache.save(self.http.export_cookies())
+        return True
+
+    def _restore_session(self, cookies):
+        """保存済みのCookieを設定し、BASE_URLを1回開いてログイン状態か確認する"""
+        try:
+            if self.driver is None:
+                return self.http.restore_session(cookies)
+            # ページを開く前にCookieを設定できるよう DevTools 経由で登録する
+            for cookie in cookies:
+                self.driver.execute_cdp_cmd("Network.setCookie", _cdp_cookie(cookie))
+            self.driver.get(BASE_URL)
+            if "login" in self.driver.current_url:
+                self.driver.delete_all_cookies()
+                return False
+            if self.http is not None:
+                self.http.load_cookies_from_driver(self.driver)
+            return True
+        except Exception as e:
+            logger.warning(f"セッションキャッシュの復元に失敗: {e}")
+            return False
+
+    def _login_with_form(self):
+        """ログインフォームに入力してログインする"""
+        if self.driver is None:
+            return self.http.login()
+
         logger.info("ログイン処理を開始...")
         self.driver.get(LOGIN_URL)
         try:
@@ -66,6 +2196,9 @@ class KantanKaigoFastScraper:
             self.driver.find_element(By.NAME, "login").click()
             self.wait.until(lambda d: "login" not in d.current_url)
             logger.info("ログイン成功")
+            if self.http is not None:
+                # ブラウザのログインCookieをHTTP取得用のセッションに引き継ぐ
+                self.http.load_cookies_from_driver(self.driver)
             return True
         except Exception as e:
             logger.error(f"ログイン失敗: {e}")
@@ -74,19 +2207,45 @@ class KantanKaigoFastScraper:
     def get_all_customers(self):
         """利用者一覧ページから、全員の「名前」と「PID」を一括取得する"""
         logger.info("利用者情報のリストアップを開始...")
+        if self.replay is not None:
+            # ページが記録されているのは記録時の対象者（--shard・--pids で絞り込んだ後）だけなので、それを使う
+            customers = self.replay.customers()
+            if customers:
+                logger.info(f"記録時の対象者 {len(customers)} 名を処理します（アーカイブ）")
+                return customers
+            html = self.replay.roster_html()
+            if html is None:
+                return []
+            with self.timer.span("replay_parse", page="roster"):
+                customers = parse_customer_page(html)
+            logger.info(f"合計 {len(customers)} 名の利用者IDを取得しました（アーカイブ）")
+            return customers
+        if self.driver is None:
+            try:
+                customers, html = self.http.fetch_customers()
+                if self.recorder is not None:
+                    self.recorder.add_roster(html, f"{BASE_URL}/customers")
+                logger.info(f"合計 {len(customers)} 名の利用者IDを取得しました（HTTP）")
+                if len(customers) == 0:
+                    logger.error("利用者が1人も取得できませんでした。ページの構造が変更されている可能性があります。")
+                return customers
+            except Exception as e:
+                logger.error(f"利用者一覧ページへのアクセスに失敗（HTTP）: {e}")
+                return []
+
         try:
             # 利用者一覧ページに移動
             try:
                 self.driver.find_element(By.ID, "headMenuCustomer").click()
                 self.wait.until(EC.presence_of_element_located(
                     (By.ID, "customerList")))
-                time.sleep(1)  # ページ読み込み待機
+                self.readiness.wait_ajax_idle()
             except:
                 logger.info("メニューから遷移できなかったため、直接URLにアクセスします")
-                self.driver.get(f"{BASE_URL}/customers")
+                self._get_logged_in(f"{BASE_URL}/customers")
                 self.wait.until(EC.presence_of_element_located(
                     (By.ID, "customerList")))
-                time.sleep(1)  # ページ読み込み待機
+                self.readiness.wait_ajax_idle()
 
         except Exception as e:
             logger.error(f"利用者一覧ページへのアクセスに失敗: {e}")
@@ -94,35 +2253,17 @@ class KantanKaigoFastScraper:
 
         customers = []
         try:
-            # PID属性から取得
-            elements = self.driver.find_elements(
-                By.CSS_SELECTOR, "span.planJisseki")
-
-            logger.info(f"見つかったplanJisseki要素数: {len(elements)}")
-
-            for idx, el in enumerate(elements, 1):
-                try:
-                    pid = el.get_attribute("pid")
-                    if not pid:
-                        logger.debug(f"要素 {idx}: PID属性が見つかりません")
-                        continue
-
-                    # 名前を取得
-                    try:
-                        row = el.find_element(By.XPATH, "./ancestor::tr")
-                        name_el = row.find_element(By.CSS_SELECTOR, "a.focus")
-                        name = name_el.text.strip()
-                        if not name:
-                            name = f"利用者ID_{pid}"
-                    except Exception as e:
-                        logger.warning(f"要素 {idx} (PID: {pid}): 名前の取得に失敗: {e}")
-                        name = f"利用者ID_{pid}"
-
-                    customers.append({"name": name, "pid": pid})
-                    logger.debug(f"利用者追加: {name} (PID: {pid})")
-                except Exception as e:
-                    logger.warning(f"要素 {idx} の処理でエラー: {e}")
-                    continue
+            # まず1回のスクリプト実行で全員分を取得し、失敗した場合のみ要素ごとに取得する
+            try:
+                rows = self.driver.execute_script(CUSTOMER_ROWS_SCRIPT)
+                if rows is None:
+                    raise RuntimeError("スクリプトの戻り値が空です")
+                customers = rows_to_customers(rows)
+            except Exception as e:
+                logger.warning(f"利用者一覧の一括取得に失敗したため要素ごとに取得します: {e}")
+                customers = self._extract_customers_per_element()
+            if self.recorder is not None:
+                self.recorder.add_roster(self.driver.page_source, self.driver.current_url)
 
             logger.info(f"合計 {len(customers)} 名の利用者IDを取得しました")
             if len(customers) == 0:
@@ -134,283 +2275,141 @@ class KantanKaigoFastScraper:
             logger.error(traceback.format_exc())
             return []
 
+    def _extract_customers_per_element(self):
+        """planJisseki要素ごとにWebDriverへ問い合わせる従来の取得方法（フォールバック用）"""
+        customers = []
+        # PID属性から取得
+        elements = self.driver.find_elements(
+            By.CSS_SELECTOR, "span.planJisseki")
+
+        logger.info(f"見つかったplanJisseki要素数: {len(elements)}")
+
+        for idx, el in enumerate(elements, 1):
+            try:
+                pid = el.get_attribute("pid")
+                if not pid:
+                    logger.debug(f"要素 {idx}: PID属性が見つかりません")
+                    continue
+
+                # 名前を取得
+                try:
+                    row = el.find_element(By.XPATH, "./ancestor::tr")
+                    name_el = row.find_element(By.CSS_SELECTOR, "a.focus")
+                    name = name_el.text.strip()
+                    if not name:
+                        name = f"利用者ID_{pid}"
+                except Exception as e:
+                    logger.warning(f"要素 {idx} (PID: {pid}): 名前の取得に失敗: {e}")
+                    name = f"利用者ID_{pid}"
+
+                customers.append({"name": name, "pid": pid})
+                logger.debug(f"利用者追加: {name} (PID: {pid})")
+            except Exception as e:
+                logger.warning(f"要素 {idx} の処理でエラー: {e}")
+                continue
+
+        return customers
+
+    def load_roster(self, pids=None):
+        """利用者一覧を取得し、保存済みの一覧と比較して追加・削除された利用者をログ出力する
+
+        pids を指定した場合は利用者一覧ページを開かず、保存済みの一覧から名前を引く。
+        """
+        if pids:
+            index = self.roster_cache.index() if self.roster_cache else {}
+            if self.replay is not None:
+                index = {c["pid"]: c["name"] for c in self.replay.customers()}
+            customers = [{"name": index.get(pid) or f"利用者ID_{pid}", "pid": pid}
+                         for pid in pids]
+            unknown = [pid for pid in pids if pid not in index]
+            logger.info(f"指定された {len(customers)} 名のPIDを処理します（利用者一覧ページは開きません）")
+            if unknown:
+                logger.warning(f"保存済みの利用者一覧にないPID: {', '.join(unknown)}")
+            return customers
+
+        with self.timer.span("get_all_customers") as span:
+            customers = self.get_all_customers()
+            span["customers"] = len(customers)
+        if customers and self.roster_cache is not None:
+            self.roster_cache.update(customers)
+        return customers
+
     def ensure_list_view_and_date(self, target_year, target_month):
-        """カレンダーの年月を合わせる処理"""
+        """カレンダーの年月を合わせる処理（どの方法で設定できたかを所要時間とともに記録する）"""
+        self._nav_branch = None
+        with self.timer.span("ensure_list_view_and_date") as span:
+            ok = self._ensure_list_view_and_date(target_year, target_month)
+            span["branch"] = self._nav_branch if ok else "failed"
+            span["ok"] = ok
+        return ok
+
+    def _ensure_list_view_and_date(self, target_year, target_month):
         max_retries = 2
+        target_year_month = f"{target_year}-{target_month:02d}"
         for retry in range(max_retries):
+            if self._budget_exceeded():
+                logger.warning("  時間の上限を超えたため、年月の設定を中断します")
+                return False
             try:
-                # serviceDate要素が存在するまで待機（Render環境での読み込み遅延対策）
-                service_date_found = False
-                for wait_attempt in range(15):  # 最大15秒待機
-                    try:
-                        # 要素の存在確認
-                        element = self.driver.find_element(
-                            By.ID, "serviceDate")
-                        if element:
-                            # 値が設定されているか確認
-                            current_date_val = self.driver.execute_script(
-                                "var el = document.getElementById('serviceDate'); return el && el.value ? el.value : null;")
-                            if current_date_val:
-                                service_date_found = True
-                                break
-                    except:
-                        pass
-                    time.sleep(1)
-                    if wait_attempt % 3 == 0:  # 3秒ごとにログ出力
-                        logger.debug(
-                            f"  serviceDate要素を待機中... ({wait_attempt + 1}/15)")
-
-                if not service_date_found:
-                    logger.error("  serviceDate要素が見つかりません")
-                    if retry < max_retries - 1:
-                        time.sleep(2)
-                        continue
-                    else:
-                        return False
-
-                # 現在の日付を取得（形式: "2025-11-01"）
-                current_date_val = self.driver.execute_script(
-                    "var el = document.getElementById('serviceDate'); return el && el.value ? el.value : null;")
-
+                # serviceDateに値が入るまで待機（Render環境での読み込み遅延対策）
+                current_date_val = self.readiness.wait_service_date()
                 if not current_date_val:
-                    logger.error("  serviceDateの値が取得できませんでした")
+                    logger.error("  serviceDate要素が見つかりません")
                     if retry < max_retries - 1:
-                        time.sleep(2)
+                        self._reload_current_page()
                         continue
                     else:
                         return False
 
                 # 年月部分を抽出（"2025-11-01" -> "2025-11"）
                 current_year_month = "-".join(current_date_val.split("-")[:2])
-                target_year_month = f"{target_year}-{target_month:02d}"
 
                 # 既に正しい年月が設定されているか確認
                 if current_year_month == target_year_month:
                     logger.info(f"  年月は既に正しく設定されています: {current_date_val}")
-                    # テーブルが読み込まれるまで待機（短縮）
-                    try:
-                        self.wait.until(EC.presence_of_element_located(
-                            (By.CSS_SELECTOR, ".list_table")))
-                    except:
-                        pass
+                    self.readiness.wait_table()
+                    self._nav_branch = "already_set"
+                    self._session_month = (target_year, target_month)
                     return True
 
                 logger.info(
                     f"  日付変更: {current_date_val} -> {target_year}年{target_month}月 (試行 {retry + 1}/{max_retries})")
 
-                # カレンダーピッカーを開く（既に開いている場合はスキップ）
-                try:
-                    # 月ピッカーが既に表示されているかチェック
-                    monthpicker_visible = self.driver.execute_script(
-                        "return $('#ui-monthpicker-div').is(':visible');")
-
-                    if not monthpicker_visible:
-                        # JavaScriptで直接クリック（より確実）
-                        self.driver.execute_script(
-                            "$('.ui-monthpicker-trigger').click();")
-                        time.sleep(0.3)
-                    else:
-                        logger.info("  月ピッカーは既に開いています")
-                except Exception as e:
-                    logger.warning(f"  カレンダートリガーの処理に失敗: {e}")
-                    # フォールバック: 強制的にJavaScriptでクリック
-                    try:
-                        self.driver.execute_script(
-                            "$('#ui-monthpicker-div').hide(); $('.ui-monthpicker-trigger').click();")
-                        time.sleep(0.3)
-                    except:
-                        pass
-
-                # 年を選択（存在する場合）
-                try:
-                    year_select = Select(self.wait.until(EC.presence_of_element_located(
-                        (By.CSS_SELECTOR, "select.ui-datepicker-year"))))
-                    current_year = year_select.first_selected_option.get_attribute(
-                        "value")
-                    if current_year != str(target_year):
-                        year_select.select_by_value(str(target_year))
-                        logger.info(f"  年を {target_year} に設定")
-                        time.sleep(0.3)  # 年変更後の待機
-                except Exception as e:
-                    logger.warning(f"  年の選択に失敗（スキップ）: {e}")
-
-                # 月を選択（<a>タグで直接クリック、0ベースなので target_month - 1）
-                month_index = target_month - 1
-                try:
-                    # 現在のURLを保存（ページ更新を検知するため）
-                    current_url_before = self.driver.current_url
-
-                    # 方法1: JavaScriptで直接クリック
-                    self.driver.execute_script(
-                        f"$('#ui-monthpicker-div a[data-month=\"{month_index}\"]').click();")
-                    logger.info(
-                        f"  月を {target_month} に設定（data-month={month_index}）")
-
-                    # 月ピッカーが閉じられるまで待機
-                    time.sleep(0.5)
-                    for _ in range(10):  # 最大3秒待機
-                        monthpicker_visible = self.driver.execute_script(
-                            "return $('#ui-monthpicker-div').is(':visible');")
-                        if not monthpicker_visible:
-                            break
-                        time.sleep(0.3)
-
-                    # ページが更新されるまで待機（最大10秒に延長）
-                    logger.info("  ページ更新を待機中...")
-                    page_updated = False
-                    for page_wait in range(20):  # 最大10秒待機
-                        time.sleep(0.5)
-                        try:
-                            # serviceDate要素が再表示されるまで待機
-                            element = self.driver.find_element(
-                                By.ID, "serviceDate")
-                            if element:
-                                # 要素に値が設定されるまで待機
-                                date_val = self.driver.execute_script(
-                                    "var el = document.getElementById('serviceDate'); return el && el.value ? el.value : null;")
-                                if date_val:
-                                    logger.info(f"  ページ更新完了: {date_val}")
-                                    page_updated = True
-                                    break
-                        except:
-                            if page_wait % 4 == 0:  # 2秒ごとにログ出力
-                                logger.debug(
-                                    f"  ページ更新待機中... ({page_wait * 0.5:.1f}秒)")
-
-                    if not page_updated:
-                        logger.warning("  ページ更新の確認に時間がかかっています...")
-
-                    # 追加の待機（ページが完全に読み込まれるまで）
-                    time.sleep(2)
-
-                    # もし更新されていない場合、直接設定を試す
-                    check_date = self.driver.execute_script(
-                        "var el = document.getElementById('serviceDate'); return el && el.value ? el.value : null;")
-
-                    if check_date:
-                        check_year_month = "-".join(check_date.split("-")[:2])
-                        if check_year_month != target_year_month:
-                            logger.info("  直接設定を試行します...")
-                            # serviceDateを直接設定
-                            self.driver.execute_script(
-                                f"var el = document.getElementById('serviceDate'); if (el) {{ el.value = '{target_year}-{target_month:02d}-01'; }}")
-                            # changeイベントを発火
-                            self.driver.execute_script(
-                                "$('#serviceDate').trigger('change');")
-                            # ページ更新を待機
-                            time.sleep(2)
-                            # serviceDate要素が再表示されるまで待機
-                            for retry_wait in range(10):
-                                try:
-                                    self.wait.until(EC.presence_of_element_located(
-                                        (By.ID, "serviceDate")))
-                                    break
-                                except:
-                                    time.sleep(0.5)
-                    else:
-                        logger.warning("  serviceDate要素が見つからないため、直接設定をスキップします")
-
-                except Exception as e:
-                    logger.warning(f"  JavaScriptでの月選択に失敗: {e}")
-                    # フォールバック: Seleniumでクリック
-                    try:
-                        month_link = self.wait.until(EC.element_to_be_clickable(
-                            (By.CSS_SELECTOR, f"#ui-monthpicker-div a[data-month='{month_index}']")))
-                        # スクロールして要素を表示
-                        self.driver.execute_script(
-                            "arguments[0].scrollIntoView(true);", month_link)
-                        time.sleep(0.2)
-                        month_link.click()
-                        logger.info(f"  Seleniumで月を選択しました")
-                        # ページ更新を待機
-                        time.sleep(2)
-                        # serviceDate要素が再表示されるまで待機
-                        for retry_wait in range(10):
-                            try:
-                                self.wait.until(EC.presence_of_element_located(
-                                    (By.ID, "serviceDate")))
-                                break
-                            except:
-                                time.sleep(0.5)
-                    except Exception as e2:
-                        logger.error(f"  月の選択が完全に失敗: {e2}")
-                        raise
-
-                # 年月が正しく設定されるまで待機（最大20秒に延長）
-                wait_time = 0
-                max_wait_time = 20
-                while wait_time < max_wait_time:
-                    time.sleep(0.5)  # 待機間隔
-                    wait_time += 0.5
+                # これまでに速く確実に切り替えられた方法から順に試す
+                for strategy in self.month_nav.order():
+                    if self._budget_exceeded():
+                        logger.warning("  時間の上限を超えたため、年月の設定を中断します")
+                        return False
+                    start = time.monotonic()
                     try:
-                        # serviceDate要素が存在するか確認（複数の方法で試行）
-                        element = None
-                        try:
-                            element = self.driver.find_element(
-                                By.ID, "serviceDate")
-                        except:
-                            # DOMを直接確認
-                            try:
-                                element = self.driver.execute_script(
-                                    "return document.getElementById('serviceDate');")
-                            except:
-                                pass
-
-                        if not element:
-                            if wait_time % 2 == 0:  # 2秒ごとにログ出力
-                                logger.debug(
-                                    f"  serviceDate要素が見つかりません（待機中: {wait_time:.1f}秒）")
-                            continue
-
-                        # 要素に値が設定されているか確認
-                        updated_date_val = self.driver.execute_script(
-                            "var el = document.getElementById('serviceDate'); return el && el.value ? el.value : null;")
-
-                        if not updated_date_val:
-                            if wait_time % 2 == 0:  # 2秒ごとにログ出力
-                                logger.debug(
-                                    f"  serviceDateの値が取得できません（待機中: {wait_time:.1f}秒）")
-                            continue
-
-                        updated_year_month = "-".join(
-                            updated_date_val.split("-")[:2])
-                        if updated_year_month == target_year_month:
-                            logger.info(f"  年月の設定が確認されました: {updated_date_val}")
-                            # テーブルが読み込まれるまで待機
-                            try:
-                                self.wait.until(EC.presence_of_element_located(
-                                    (By.CSS_SELECTOR, ".list_table")))
-                            except:
-                                pass
-                            time.sleep(0.5)
-                            return True
-                        else:
-                            if wait_time % 2 == 0:  # 2秒ごとにログ出力
-                                logger.debug(
-                                    f"  待機中... 現在: {updated_year_month}, 目標: {target_year_month} ({wait_time:.1f}秒)")
+                        self.readiness.mark_stale()
+                        ok = getattr(self, f"_navigate_by_{strategy}")(target_year, target_month)
                     except Exception as e:
-                        if wait_time % 2 == 0:  # 2秒ごとにログ出力
-                            logger.debug(f"  日付取得エラー: {e} ({wait_time:.1f}秒)")
-                        pass
-
-                # リトライ前に少し待機
+                        logger.warning(f"  {strategy} での月選択に失敗: {e}")
+                        ok = False
+                    # 年月が合っていても、ページが差し替えられていなければ古い表のままなので受け入れない
+                    replaced = bool(self.readiness.page_state().get("replaced")) if ok else False
+                    if ok and not replaced:
+                        logger.warning(f"  {strategy}: 年月の値は変わりましたが、ページが切り替わっていません")
+                        ok = False
+                    self.month_nav.observe(strategy, ok, time.monotonic() - start, replaced)
+                    if ok:
+                        self._nav_branch = strategy
+                        self._session_month = (target_year, target_month)
+                        logger.info(
+                            f"  年月の設定が確認されました: {self.readiness.last_service_date}（{strategy}）")
+                        return True
+                    logger.info(f"  {strategy} では年月を設定できませんでした。次の方法を試行します...")
+
+                # リトライ前にページを再読み込みして状態をリセット
                 if retry < max_retries - 1:
                     logger.warning(f"  年月の設定確認に失敗。リトライします...")
-                    # リトライ時はページを再読み込みして状態をリセット
-                    try:
-                        current_url = self.driver.current_url
-                        logger.info(f"  ページを再読み込みします: {current_url}")
-                        self.driver.get(current_url)
-                        time.sleep(3)  # ページ読み込み待機
-                    except Exception as e:
-                        logger.warning(f"  ページ再読み込みに失敗: {e}")
-                    time.sleep(1)
+                    self._reload_current_page()
 
             except Exception as e:
                 logger.warning(
                     f"  日付変更処理でエラー (試行 {retry + 1}/{max_retries}): {e}")
                 if retry < max_retries - 1:
-                    time.sleep(1)
                     continue
                 else:
                     logger.error(f"  日付変更処理が最終的に失敗しました: {e}")
@@ -419,290 +2418,1484 @@ class KantanKaigoFastScraper:
         logger.error("  年月の設定に失敗しました（最大リトライ回数に達しました）")
         return False
 
-    def scrape_schedule_table(self):
-        """一覧形式のテーブルからデータを抽出"""
-        schedules = []
+    def _open_monthpicker(self, target_year):
+        """月ピッカーを開き（既に開いている場合はそのまま）、年を合わせる"""
         try:
-            # テーブルが読み込まれるまで待機（短縮）
+            # 月ピッカーが既に表示されているかチェック
+            monthpicker_visible = self.driver.execute_script(
+                "return $('#ui-monthpicker-div').is(':visible');")
+
+            if not monthpicker_visible:
+                # JavaScriptで直接クリック（より確実）
+                self.driver.execute_script(
+                    "$('.ui-monthpicker-trigger').click();")
+                self.readiness.wait_monthpicker(visible=True)
+            else:
+                logger.info("  月ピッカーは既に開いています")
+        except Exception as e:
+            logger.warning(f"  カレンダートリガーの処理に失敗: {e}")
+            # フォールバック: 強制的にJavaScriptでクリック
             try:
-                self.wait.until(EC.presence_of_element_located(
-                    (By.CSS_SELECTOR, ".list_table")))
-                time.sleep(0.3)  # 待機時間を短縮
-            except TimeoutException:
-                logger.warning("  テーブル要素が見つかりません。空の結果を返します。")
-                return schedules
-
-            # 要素を取得
-            dates = self.driver.find_elements(By.CSS_SELECTOR, ".day.edit")
-            times = self.driver.find_elements(By.CSS_SELECTOR, ".time.edit")
-            services = self.driver.find_elements(
-                By.CSS_SELECTOR, ".service.edit")
-            staffs = self.driver.find_elements(By.CSS_SELECTOR, ".staff.edit")
-
-            if len(dates) == 0:
-                logger.warning("  日付要素が1つも見つかりませんでした")
-                return schedules
+                self.driver.execute_script(
+                    "$('#ui-monthpicker-div').hide(); $('.ui-monthpicker-trigger').click();")
+                self.readiness.wait_monthpicker(visible=True)
+            except:
+                pass
 
-            logger.info(
-                f"  取得した要素数: 日付={len(dates)}, 時間={len(times)}, サービス={len(services)}, スタッフ={len(staffs)}")
+        # 年を選択（存在する場合）
+        try:
+            year_select = Select(self._webdriver_wait().until(EC.presence_of_element_located(
+                (By.CSS_SELECTOR, "select.ui-datepicker-year"))))
+            current_year = year_select.first_selected_option.get_attribute(
+                "value")
+            if current_year != str(target_year):
+                year_select.select_by_value(str(target_year))
+                logger.info(f"  年を {target_year} に設定")
+                # 年変更後、月リンクが描画し直されるまで待機
+                self.readiness.wait_ajax_idle()
+        except Exception as e:
+            logger.warning(f"  年の選択に失敗（スキップ）: {e}")
+
+    def _navigate_by_monthpicker(self, target_year, target_month):
+        """月ピッカーの月リンクをJavaScriptでクリックする（0ベースなので target_month - 1）"""
+        self._open_monthpicker(target_year)
+        month_index = target_month - 1
+        self.driver.execute_script(
+            f"$('#ui-monthpicker-div a[data-month=\"{month_index}\"]').click();")
+        logger.info(
+            f"  月を {target_month} に設定（data-month={month_index}）")
+        # serviceDateが目標の年月になり、テーブルの読み込みが終わるまで待機
+        logger.info("  ページ更新を待機中...")
+        return self.readiness.wait_month_loaded(f"{target_year}-{target_month:02d}")
+
+    def _navigate_by_direct_set(self, target_year, target_month):
+        """serviceDateに直接値を設定し、changeイベントを発火する"""
+        if not self.readiness.service_date_value():
+            logger.warning("  serviceDate要素が見つからないため、直接設定をスキップします")
+            return False
+        self.driver.execute_script(
+            f"var el = document.getElementById('serviceDate'); if (el) {{ el.value = '{target_year}-{target_month:02d}-01'; }}")
+        self.driver.execute_script(
+            "$('#serviceDate').trigger('change');")
+        return self.readiness.wait_month_loaded(f"{target_year}-{target_month:02d}")
+
+    def _navigate_by_selenium_click(self, target_year, target_month):
+        """月ピッカーの月リンクをSeleniumでクリックする"""
+        self._open_monthpicker(target_year)
+        month_link = self._webdriver_wait().until(EC.element_to_be_clickable(
+            (By.CSS_SELECTOR, f"#ui-monthpicker-div a[data-month='{target_month - 1}']")))
+        # スクロールして要素を表示
+        self.driver.execute_script(
+            "arguments[0].scrollIntoView(true);", month_link)
+        month_link.click()
+        logger.info(f"  Seleniumで月を選択しました")
+        return self.readiness.wait_month_loaded(f"{target_year}-{target_month:02d}")
+
+    def _reload_current_page(self):
+        """現在のページを再読み込みする（リトライ用）"""
+        try:
+            current_url = self.driver.current_url
+            logger.info(f"  ページを再読み込みします: {current_url}")
+            self.driver.get(current_url)
+        except Exception as e:
+            logger.warning(f"  ページ再読み込みに失敗: {e}")
 
-            loop_count = len(dates)
-            for i in range(loop_count):
-                try:
-                    date_txt = dates[i].text.strip()
-                    if not date_txt:
-                        continue
+    def scrape_schedule_table(self, cust, year_month, target_day=None):
+        """一覧形式のテーブルから cust の year_month（"YYYY-MM"）のデータを ScheduleRecord のリストとして抽出する
 
-                    time_txt = times[i].text.strip() if i < len(times) else ""
-                    service_txt = services[i].text.strip(
-                    ) if i < len(services) else ""
-                    staff_txt = staffs[i].text.strip(
-                    ) if i < len(staffs) else ""
-
-                    schedules.append({
-                        "date": date_txt,
-                        "time": time_txt,
-                        "service": service_txt,
-                        "staff": staff_txt
-                    })
-                except Exception as e:
-                    logger.warning(f"  インデックス {i} のデータ抽出でエラー: {e}")
-                    continue
+        target_day を指定するとその日の行だけ。
+        """
+        with self.timer.span("scrape_schedule_table") as span:
+            schedules = self._scrape_schedule_table(span, cust, year_month, target_day)
+            span["rows"] = len(schedules)
+        return schedules
+
+    def _scrape_schedule_table(self, span, cust, year_month, target_day=None):
+        """表を読み取る。表が表示されない・読み取れない場合は CustomerScrapeError（空の結果を成功として扱わない）"""
+        try:
+            # テーブルが表示されAJAXが完了するまで待機
+            if not self.readiness.wait_table():
+                reason = "時間の上限を超えました" if self._budget_exceeded() else "一覧テーブルが表示されませんでした"
+                logger.error(f"  テーブル要素が見つかりません（{reason}）")
+                raise CustomerScrapeError(reason)
+
+            # まず1回のスクリプト実行で全セルを取得し、失敗した場合のみ要素ごとに取得する
+            try:
+                schedules = self._extract_schedules_bulk(cust, year_month, target_day)
+                span["path"] = "bulk"
+                logger.info(f"  一括取得: {len(schedules)}件")
+                if self.verify_extraction:
+                    fallback = self._extract_schedules_per_element(cust, year_month, target_day)
+                    if fallback == schedules:
+                        logger.info(
+                            f"  抽出結果の照合: 一致（一括={len(schedules)}件, 要素ごと={len(fallback)}件）")
+                    else:
+                        logger.warning(
+                            f"  抽出結果の照合: 不一致（一括={len(schedules)}件, 要素ごと={len(fallback)}件）")
+            except Exception as e:
+                logger.warning(f"  一括取得に失敗したため要素ごとに取得します: {e}")
+                schedules = self._extract_schedules_per_element(cust, year_month, target_day)
+                span["path"] = "per_element"
+                logger.info(f"  要素ごとの取得: {len(schedules)}件")
 
             logger.info(f"  合計 {len(schedules)} 件のスケジュールデータを抽出しました")
 
+        except CustomerScrapeError:
+            raise
         except Exception as e:
+            # 一括取得と要素ごとの取得の両方に失敗した
             logger.error(f"  データ抽出エラー: {e}")
             import traceback
             logger.error(traceback.format_exc())
+            raise CustomerScrapeError(f"表の読み取りに失敗しました: {e}") from e
 
         return schedules
 
-    def save_to_csv(self, year, month, results, day=None):
-        """結果をCSVファイルに保存する"""
-        if day:
-            filename = f"schedule_{year}_{month:02d}_{day:02d}.csv"
-        else:
-            filename = f"schedule_{year}_{month:02d}.csv"
+    def _extract_schedules_bulk(self, cust, year_month, target_day=None):
+        """日付・時間・サービス・スタッフの全セルを1回のスクリプト実行で取得する"""
+        rows = self.driver.execute_script(
+            SCHEDULE_ROWS_SCRIPT, target_day, DAY_CELL_PATTERN)
+        if rows is None:
+            raise RuntimeError("スクリプトの戻り値が空です")
+        return rows_to_schedules(rows, year_month, cust['name'], cust['pid'])
+
+    def _extract_schedules_per_element(self, cust, year_month, target_day=None):
+        """セルごとにWebDriverへ問い合わせる従来の取得方法（フォールバック用）"""
+        schedules = []
+        # 要素を取得
+        dates = self.driver.find_elements(By.CSS_SELECTOR, ".day.edit")
+        times = self.driver.find_elements(By.CSS_SELECTOR, ".time.edit")
+        services = self.driver.find_elements(
+            By.CSS_SELECTOR, ".service.edit")
+        staffs = self.driver.find_elements(By.CSS_SELECTOR, ".staff.edit")
+
+        if len(dates) == 0:
+            logger.warning("  日付要素が1つも見つかりませんでした")
+            return schedules
+
+        logger.info(
+            f"  取得した要素数: 日付={len(dates)}, 時間={len(times)}, サービス={len(services)}, スタッフ={len(staffs)}")
+
+        loop_count = len(dates)
+        for i in range(loop_count):
+            try:
+                date_txt = dates[i].text.strip()
+                if not date_txt:
+                    continue
+                if target_day and parse_day(date_txt) != target_day:
+                    continue
+
+                time_txt = times[i].text.strip() if i < len(times) else ""
+                service_txt = services[i].text.strip(
+                ) if i < len(services) else ""
+                staff_txt = staffs[i].text.strip(
+                ) if i < len(staffs) else ""
 
+                schedules.append(ScheduleRecord(
+                    date_txt, time_txt, service_txt, staff_txt,
+                    year_month, cust['name'], cust['pid']))
+            except Exception as e:
+                logger.warning(f"  インデックス {i} のデータ抽出でエラー: {e}")
+                continue
+
+        return schedules
+
+    def save_to_csv(self, year, month, results, day=None):
+        """結果（{利用者名: ScheduleRecord のリスト}）をCSVファイル（と --output で指定した形式）に保存する"""
+        writers = self._open_outputs(year, month, day)
         try:
-            # encoding='utf-8-sig' にすることでExcelで文字化けせずに開けます
-            with open(filename, 'w', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
+            for idx, (name, scheds) in enumerate(results.items(), 1):
+                for writer in writers:
+                    writer.add(idx, name, scheds)
+        except Exception:
+            for writer in writers:
+                writer.abort()
+            raise
+        for writer in writers:
+            self._finish_output(writer)
 
-                # ヘッダー行
-                writer.writerow(["利用者名", "日付", "時間帯", "サービス内容", "スタッフ名"])
+    def _open_outputs(self, year, month, day=None, last_month=None):
+        """出力形式ごとの書き出しを開始し、書きかけのCSVのファイル名を通知する
 
-                count = 0
-                for name, scheds in results.items():
-                    for s in scheds:
-                        writer.writerow([
-                            name,
-                            s['date'],
-                            s['time'],
-                            s['service'],
-                            s['staff']
-                        ])
-                        count += 1
+        last_month=(年, 月) を指定すると、期間全体を「年月」列付きの1ファイルにまとめる。
+        """
+        if last_month is not None:
+            csv_name = csv_range_filename((year, month), last_month)
+            year_month = None
+        else:
+            csv_name = csv_filename(year, month, day)
+            year_month = f"{year}-{month:02d}"
+        if self.shard:
+            csv_name = shard_filename(csv_name, self.shard)
+        writers = [open_output_writer(fmt, csv_name, year_month,
+                                      month_column=last_month is not None,
+                                      diff=self._diff_against is not None)
+                   for fmt in self.outputs]
+        for writer in writers:
+            if writer.format == "csv":
+                # 書きかけのファイル名を標準出力に出力（Node.js側で途中経過を読めるように）
+                with _stdout_lock:
+                    print(f"CSV_PARTIAL:{writer.partial_path}", flush=True)
+        return writers
+
+    def _finish_output(self, writer):
+        """出力を確定し、利用者ごとの件数をログ出力する"""
+        label = "CSV" if writer.format == "csv" else writer.format
+        try:
+            phase = "save_to_csv" if writer.format == "csv" else f"save_to_{writer.format}"
+            with self.timer.span(phase, rows=writer.row_count):
+                writer.finalize()
 
             logger.info("=" * 50)
-            logger.info(f"CSVファイル保存完了: {filename}")
-            logger.info(f"利用者数: {len(results)}名")
-            logger.info(f"書き込み行数: {count}行")
-            # 各利用者のデータ件数をログ出力
-            data_count = 0
-            no_data_count = 0
-            for name, scheds in results.items():
-                if len(scheds) > 0:
-                    logger.info(f"  ✓ {name}: {len(scheds)}件")
-                    data_count += 1
-                else:
-                    logger.warning(f"  ✗ {name}: データなし")
-                    no_data_count += 1
-            logger.info(f"データあり: {data_count}名, データなし: {no_data_count}名")
+            logger.info(f"{label}ファイル保存完了: {writer.filename}")
+            logger.info(f"利用者数: {len(writer.counts)}名")
+            logger.info(f"書き込み行数: {writer.row_count}行")
+            if writer.format == "summary":
+                logger.info(f"サービス提供時間: 合計 {writer.minutes // 60}時間{writer.minutes % 60}分"
+                            f"（スタッフ {len(writer.staff)}名, {len(writer.days)}日分"
+                            + (f", 時間帯を読み取れない行 {writer.unparsed_time}行" if writer.unparsed_time else "")
+                            + "）")
+            if writer.op_column:
+                # 差分CSVは内容が変わった利用者だけを出力する
+                changed = [(name, count) for name, count in writer.counts if count > 0]
+                for name, count in changed:
+                    logger.info(f"  Δ {name}: {count}件")
+                logger.info(f"変更あり: {len(changed)}名, 変更なし: {len(writer.counts) - len(changed)}名")
+            # 各利用者のデータ件数をログ出力（複数の形式で出力する場合はCSV、CSVがなければ最初の形式の分だけ）
+            elif writer.format == ("csv" if "csv" in self.outputs else self.outputs[0]):
+                failed_names = {name for name, _, _ in self._failures.values()}
+                data_count = 0
+                no_data_count = 0
+                for (name, count), minutes in zip(writer.counts, writer.customer_minutes):
+                    if count > 0:
+                        logger.info(f"  ✓ {name}: {count}件（{minutes // 60}時間{minutes % 60}分）")
+                        data_count += 1
+                    else:
+                        logger.warning(f"  ✗ {name}: {'取得失敗' if name in failed_names else 'データなし'}")
+                        no_data_count += 1
+                logger.info(f"データあり: {data_count}名, データなし: {no_data_count}名")
             logger.info("=" * 50)
 
             # ファイル名を標準出力に出力（Node.js側で取得するため）
-            print(f"CSV_FILE:{filename}", flush=True)
+            tag = "CSV_FILE" if writer.format == "csv" else "OUTPUT_FILE"
+            with _stdout_lock:
+                print(f"{tag}:{writer.filename}", flush=True)
+            if self.shard and writer.format == "csv" and not writer.op_column:
+                self._write_manifest(writer)
 
         except Exception as e:
-            logger.error(f"CSV保存中にエラーが発生しました: {e}")
+            logger.error(f"{label}保存中にエラーが発生しました: {e}")
+            writer.abort()
             raise
 
+    def _write_manifest(self, writer):
+        """シャードのCSVに対応するマニフェスト（全体の利用者一覧と、このCSVに書いた利用者・件数）を出力する
+
+        merge_shards.py はこれを使って、元の利用者一覧の順番で1つのCSVにまとめ、全員が1回ずつ含まれるかを確認する。
+        """
+        i, n = self.shard
+        failed = [{"pid": pid, "month": f"{y}-{m:02d}", "reason": reason}
+                  for (pid, (y, m)), (_, reason, _) in sorted(self._failures.items())
+                  if writer.year_month in (None, f"{y}-{m:02d}")]
+        manifest = {
+            "shard": i,
+            "shards": n,
+            "csv": os.path.basename(writer.filename),
+            "merged_csv": os.path.basename(writer.filename).replace(f"_shard{i}of{n}.csv", ".csv"),
+            "year_month": writer.year_month,
+            "roster": [[c["pid"], c["name"]] for c in self._roster],
+            "customers": [[pid, name, count]
+                          for pid, (name, count) in zip(writer.pids, writer.counts)],
+            "failed": failed,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        path = manifest_filename(writer.filename)
+        with open(f"{path}.part", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(f"{path}.part", path)
+        logger.info(f"マニフェスト保存完了: {path}（シャード {i}/{n}, {len(manifest['customers'])}名）")
+        with _stdout_lock:
+            print(f"OUTPUT_FILE:{path}", flush=True)
+
+    def scrape_customer(self, cust, target_year, target_month, target_day=None):
+        """1人分の利用者ページを開き、対象年月のスケジュールを取得する（失敗時は CustomerScrapeError）
+
+        target_day を指定した場合はその日の行だけを取得する。
+        """
+        name = cust['name']
+        pid = cust['pid']
+        wait_mark = len(self.readiness.records)
+
+        if self.replay is not None:
+            return self._scrape_customer_replay(cust, target_year, target_month, target_day)
+
+        if self.http is not None:
+            try:
+                return self._scrape_customer_http(cust, target_year, target_month, target_day)
+            except CustomerScrapeError as e:
+                if self.driver is None:
+                    logger.error(f"  -> {name}: HTTPで取得できませんでした（{e}）")
+                    raise
+                logger.info(f"  HTTPで取得できなかったため、ブラウザで取得します（{e}）")
+
+        try:
+            # ページに移動（先読み済みのタブがあればそのタブに切り替える）
+            target_url_with_params = customer_url(pid, target_year, target_month, target_day)
+            with self.timer.span("navigate"):
+                self._open_customer_page(target_url_with_params)
+            # このページの準備を待つ間に、次の利用者のページを別のタブで読み込み始める
+            self._prefetch_upcoming(target_day)
+            url_check_start = time.monotonic()
+
+            # serviceDateに値が入りAJAXが落ち着くまで待機（Render環境対応）
+            current_date_val = self.readiness.wait_service_date()
+            if not current_date_val:
+                logger.warning(
+                    "  serviceDate要素が見つかりません（URLパラメータ確認をスキップ）")
+            else:
+                logger.info(f"  serviceDate要素を確認: {current_date_val}")
+
+            target_year_month = f"{target_year}-{target_month:02d}"
+
+            if current_date_val:
+                current_year_month = "-".join(
+                    current_date_val.split("-")[:2])
+                landed = tuple(int(v) for v in current_date_val.split("-")[:2])
+                self.month_nav.observe_landing(
+                    (target_year, target_month), landed, self._session_month)
+                if current_year_month == target_year_month:
+                    # URLパラメータを反映しないサーバーでは、前回選んだ年月がセッションに残っている
+                    branch = "session" if self.month_nav.url_params is False else "url_params"
+                    logger.info(
+                        f"  {'セッションに保持された年月' if branch == 'session' else 'URLパラメータ'}で"
+                        f"年月が正しく設定されました: {current_date_val}")
+                    self._session_month = (target_year, target_month)
+                    # テーブルが読み込まれるまで待機
+                    self.readiness.wait_table()
+                    self.timer.record("ensure_list_view_and_date",
+                                      time.monotonic() - url_check_start,
+                                      branch=branch, ok=True)
+                    # 年月設定をスキップしてデータ抽出へ
+                    date_set_success = True
+                else:
+                    # 通常の年月設定処理を実行
+                    date_set_success = None
+            else:
+                # 通常の年月設定処理を実行
+                date_set_success = None
+
+            # 年月を設定（URLパラメータで設定できなかった場合のみ）
+            if date_set_success is None:
+                date_set_success = self.ensure_list_view_and_date(
+                    target_year, target_month)
+
+            if not date_set_success:
+                logger.error(f"  {name}: 年月の設定に失敗しました")
+                raise CustomerScrapeError("年月の設定に失敗しました")
+
+            self._record_page_metrics()
+
+            # データを抽出
+            data = self.scrape_schedule_table(cust, f"{target_year}-{target_month:02d}", target_day)
+            self._record_page(pid, target_year, target_month, target_day)
+
+            if len(data) == 0:
+                logger.warning(f"  {name}: データが0件でした。")
+                # 現在の日付を確認
+                try:
+                    current_date = self.driver.execute_script(
+                        "return document.getElementById('serviceDate').value")
+                    logger.info(f"  現在表示されている日付: {current_date}")
+                except:
+                    pass
+
+            logger.info(f"  -> {name}: {len(data)}件のデータを取得しました")
+            logger.info(f"  待機時間: {self.readiness.summarize(wait_mark)}")
+            return data
+
+        except CustomerScrapeError:
+            raise
+        except Exception as e:
+            logger.error(f"  -> {name} の処理失敗: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            raise CustomerScrapeError(f"処理中にエラー: {e}") from e
+
+    def _open_customer_page(self, url):
+        """url を開く。別のタブで先読み済みの場合は、そのタブに切り替えるだけにする
+
+        先読みのタブは遷移を始める前に印を付けてあるため、ページが差し替わるまで待ってから URL を確認し、
+        前の利用者のページのまま・ログイン画面・別のページの場合はこのタブで開き直す。
+        """
+        self.pages_since_launch += 1
+        handle = next((h for h, (u, _) in self._tab_pages.items() if u == url), None)
+        if handle is None:
+            self._get_logged_in(url)
+            return
+        _, started = self._tab_pages.pop(handle)
+        self.driver.switch_to.window(handle)
+        lead = time.monotonic() - started
+        tab = self._tab_numbers.get(handle)
+        logger.info(f"  タブ{tab}で先読みしたページを表示します（先読み開始から{lead:.2f}秒）")
+        self.timer.record("prefetch", lead, tab=tab)
+        if not self.readiness.wait_for("prefetched_page", lambda s: s.get("replaced")) \
+                or not same_page_url(self.driver.current_url, url):
+            logger.warning(f"  タブ{tab}の先読みしたページが目的のページではないため開き直します"
+                           f"（{self.driver.current_url}）")
+            self._get_logged_in(url)
+
+    def _prefetch_upcoming(self, target_day=None):
+        """次に取得する予定の利用者のページを空いているタブで読み込み始め、現在のタブに戻る"""
+        if self.tabs < 2 or self.driver is None or self.http is not None or not self._upcoming:
+            return
+        current = self.driver.current_window_handle
+        self._tab_numbers.setdefault(current, len(self._tab_numbers) + 1)
+        wanted = [customer_url(cust['pid'], *months[0], target_day)
+                  for _, cust, months, _ in self._upcoming[:self.tabs - 1]]
+        loading = {url for url, _ in self._tab_pages.values()}
+        free = [h for h in self._tab_numbers
+                if h != current and self._tab_pages.get(h, (None,))[0] not in wanted]
+        try:
+            for url in wanted:
+                if url in loading:
+                    continue
+                if free:
+                    handle = free.pop(0)
+                    self.driver.switch_to.window(handle)
+                elif len(self._tab_numbers) < self.tabs:
+                    self.driver.switch_to.new_window('tab')
+                    if self.browser_profile == "lean":
+                        self._block_resources()
+                    handle = self.driver.current_window_handle
+                    self._tab_numbers[handle] = len(self._tab_numbers) + 1
+                else:
+                    break
+                # 遷移はスクリプトの終了後に始める（ChromeDriverがこのタブの読み込み完了を待たないように）。
+                # 切り替えたときに前の利用者のページを読まないよう、遷移の前に印を付けておく
+                self.driver.execute_script(
+                    STALE_MARK_SCRIPT
+                    + "var url = arguments[0]; setTimeout(function () { window.location.href = url; }, 0);",
+                    url)
+                self._tab_pages[handle] = (url, time.monotonic())
+                self.prefetched += 1
+        except Exception as e:
+            logger.warning(f"  次の利用者のページの先読みに失敗: {e}")
+        finally:
+            self.driver.switch_to.window(current)
+        logger.info(f"  先読み中: {len(self._tab_pages)}タブ（パイプラインの深さ {len(self._tab_pages)}/{self.tabs - 1}）")
+
+    def _reset_tabs(self):
+        """先読みの状態を捨てる（ジョブをまたいで古いページを使わないように）"""
+        self._tab_pages.clear()
+        self._upcoming = []
+        self.prefetched = 0
+
+    def _get_logged_in(self, url):
+        """url を開く。ログイン画面に戻された場合（セッション切れ）は再ログインして開き直す"""
+        self._get_within_budget(url)
+        if "login" not in self.driver.current_url:
+            return
+        logger.warning("  セッションが切れています。再ログインします")
+        self._logged_in_at = None
+        self._session_month = None
+        if self.session_cache is not None:
+            self.session_cache.clear()
+        if not self.login():
+            raise CustomerScrapeError("再ログインに失敗しました")
+        self._get_within_budget(url)
+
+    def _get_within_budget(self, url):
+        """driver.get で url を開く。時間の上限を超えたら読み込みを止めて CustomerScrapeError"""
+        self._limit_page_load()
+        try:
+            self.driver.get(url)
+        except TimeoutException as e:
+            try:
+                self.driver.execute_script("window.stop();")
+            except Exception:
+                pass
+            raise CustomerScrapeError("時間の上限を超えました（ページの読み込み）") from e
+
+    def _record_page_metrics(self):
+        """表示中のページの転送バイト数と読み込み時間をログ出力し、page_load として記録する"""
+        try:
+            metrics = self.driver.execute_script(PAGE_METRICS_SCRIPT) or {}
+        except Exception as e:
+            logger.debug(f"  ページ読み込みの計測に失敗: {e}")
+            return
+        dom_loaded = (metrics.get("domContentLoaded") or 0) / 1000
+        load = metrics.get("load")
+        self.timer.record("page_load", dom_loaded, bytes=metrics.get("bytes", 0),
+                          resources=metrics.get("resources", 0),
+                          load=round(load / 1000, 4) if load else None,
+                          browser_profile=self.browser_profile)
+        logger.info(
+            f"  ページ読み込み: {metrics.get('bytes', 0) / 1024:.1f}KB（リソース{metrics.get('resources', 0)}件）, "
+            f"DOMContentLoaded {dom_loaded:.2f}秒"
+            + (f", load {load / 1000:.2f}秒" if load else ""))
+
+    def _scrape_customer_http(self, cust, target_year, target_month, target_day=None):
+        """利用者ページをHTTPで取得して解析する。取得・確認できない場合は理由を付けて CustomerScrapeError"""
+        name = cust['name']
+        url = customer_url(cust['pid'], target_year, target_month, target_day)
+        target_year_month = f"{target_year}-{target_month:02d}"
+        try:
+            start = time.monotonic()
+            with self.timer.span("http_fetch"):
+                try:
+                    service_date, has_table, rows, html = self.http.fetch_schedule(url)
+                except RuntimeError:
+                    # セッション切れの場合、HTTPログインなら1度だけ再ログインする
+                    if self.driver is not None or not self.http.login():
+                        raise
+                    service_date, has_table, rows, html = self.http.fetch_schedule(url)
+            elapsed = time.monotonic() - start
+
+            if not service_date or not service_date.startswith(target_year_month):
+                raise CustomerScrapeError(
+                    f"年月が一致しません（serviceDate={service_date}, 目標={target_year_month}）")
+            if not has_table:
+                raise CustomerScrapeError("一覧テーブルが見つかりません")
+
+            data = rows_to_schedules(rows, target_year_month, name, cust['pid'])
+            if target_day:
+                data = filter_by_day(data, target_day)
+            if self.recorder is not None:
+                self.recorder.add_page(cust['pid'], target_year, target_month, target_day, html, url)
+            logger.info(
+                f"  -> {name}: {len(data)}件のデータを取得しました（HTTP, {elapsed:.2f}秒）")
+            return data
+        except CustomerScrapeError as e:
+            logger.warning(f"  HTTP取得: {e}")
+            raise
+        except Exception as e:
+            logger.warning(f"  HTTP取得に失敗: {e}")
+            raise CustomerScrapeError(f"HTTP取得に失敗: {e}") from e
+
+    def _check_http_month_params(self, cust, months):
+        """ブラウザを使わないHTTP取得で、サーバーが ?year=&month= の年月を反映するかを最初の利用者で確認する
+
+        反映しないサーバーではHTTPで年月を選べず全員が失敗するため、利用者の数だけ失敗させずに1つのエラーで中止する。
+        """
+        for year, month in months:
+            try:
+                service_date = self.http.fetch_schedule(customer_url(cust['pid'], year, month, self._target_day))[0]
+            except Exception as e:
+                # 通信エラーなどは利用者ごとの取得（再試行あり）に任せる
+                logger.debug(f"  年月の確認をスキップしました: {e}")
+                return
+            if service_date and not service_date.startswith(f"{year}-{month:02d}"):
+                raise RuntimeError(
+                    f"サーバーがURLの年月（{year}年{month}月）を反映しないため、--http-login では取得できません"
+                    f"（表示された年月: {service_date}）。--http-login を付けずにブラウザでログインして実行してください")
+
+    def _record_page(self, pid, target_year, target_month, target_day=None):
+        """--record の場合、表示中の利用者ページのHTMLをアーカイブに保存する"""
+        if self.recorder is None:
+            return
+        try:
+            self.recorder.add_page(pid, target_year, target_month, target_day,
+                                   self.driver.page_source, self.driver.current_url)
+        except Exception as e:
+            logger.warning(f"  ページの保存に失敗: {e}")
+
+    def _scrape_customer_replay(self, cust, target_year, target_month, target_day=None):
+        """アーカイブに保存した利用者ページのHTMLを解析する（HTTP取得と同じ ScheduleTableParser を使う）"""
+        name = cust['name']
+        html = self.replay.page_html(cust['pid'], target_year, target_month, target_day)
+        if html is None:
+            logger.error(f"  -> {name}: アーカイブに{target_year}年{target_month}月のページがありません")
+            raise CustomerScrapeError("アーカイブにページがありません")
+        start = time.monotonic()
+        with self.timer.span("replay_parse", page="customer", bytes=len(html)):
+            service_date, has_table, rows = parse_schedule_page(html)
+            target_year_month = f"{target_year}-{target_month:02d}"
+            data = rows_to_schedules(rows, target_year_month, name, cust['pid'])
+            if target_day:
+                data = filter_by_day(data, target_day)
+        if not service_date or not service_date.startswith(target_year_month):
+            logger.error(f"  -> {name}: 保存したページの年月が一致しません（serviceDate={service_date}）")
+            raise CustomerScrapeError("保存したページの年月が一致しません")
+        if not has_table:
+            logger.warning(f"  {name}: 保存したページにテーブル要素がありません")
+        logger.info(
+            f"  -> {name}: {len(data)}件のデータを取得しました（アーカイブ, {time.monotonic() - start:.4f}秒）")
+        return data
+
     def update_progress(self, progress, message):
         """進捗情報を出力（Node.js側で取得するため）"""
-        print(f"PROGRESS:{progress}:{message}", flush=True)
+        # 並列ワーカーから同時に呼ばれても行が混ざらないようにロックする
+        with _stdout_lock:
+            print(f"PROGRESS:{progress}:{message}", flush=True)
         logger.info(f"[進捗 {progress}%] {message}")
 
-    def run(self, target_year, target_month, target_day=None):
+    def _start_extra_workers(self, count):
+        """追加のブラウザを並列に起動してログインする（失敗したワーカーは除外）"""
+        if self.http is not None:
+            # HTTP取得モードではログイン済みのセッションを共有し、ブラウザは起動しない
+            return [KantanKaigoFastScraper(
+                page_timeout=self.page_timeout, fetch_mode="http",
+                http_login=True, http_client=self.http, timer=self.timer,
+                snapshot_label=None)
+                for _ in range(count)]
+
+        workers = [None] * count
+
+        def start(slot):
+            try:
+                worker = KantanKaigoFastScraper(
+                    headless=self.headless, page_timeout=self.page_timeout,
+                    verify_extraction=self.verify_extraction,
+                    session_cache=self.session_cache is not None,
+                    timer=self.timer, browser_profile=self.browser_profile,
+                    snapshot_label=None, month_navigator=self.month_nav,
+                    tabs=self.tabs, recycle_rss_mb=self.recycle_rss_mb,
+                    recycle_pages=self.recycle_pages)
+            except Exception as e:
+                logger.error(f"ワーカー{slot + 2}: ブラウザの起動に失敗: {e}")
+                return
+            if worker.login():
+                workers[slot] = worker
+            else:
+                logger.error(f"ワーカー{slot + 2}: ログインに失敗したため除外します")
+                worker.close()
+
+        threads = [threading.Thread(target=start, args=(i,), daemon=True)
+                   for i in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return [w for w in workers if w is not None]
+
+    def scrape_customer_months(self, cust, months, target_day=None):
+        """複数月を取得する。ブラウザでは同じページのまま年月を切り替え、再読み込みしない
+
+        戻り値は [((年, 月), スケジュールのリスト, 失敗理由またはNone)]
+        """
+        results = []
+        # ブラウザが対象の利用者ページを表示しているか（HTTP取得時は毎回取得する）
+        on_page = False
+        if self.month_nav.session_sticky and self._session_month in months:
+            # 選んだ年月がセッションに残るサーバーでは、前の利用者の最後の月から取得すると切り替えが1回減る
+            start = months.index(self._session_month)
+            months = months[start:] + months[:start]
+        for year, month in months:
+            if self._budget_exceeded():
+                results.append(((year, month), [], "時間の上限を超えました"))
+                continue
+            try:
+                if on_page:
+                    data = self._scrape_next_month(cust, year, month, target_day)
+                else:
+                    data = self.scrape_customer(cust, year, month, target_day)
+                    on_page = self.driver is not None and self.http is None
+                results.append(((year, month), data, None))
+            except CustomerScrapeError as e:
+                reason = str(e)
+                if self._budget_exceeded():
+                    reason = f"時間の上限を超えました（{reason}）"
+                results.append(((year, month), [], reason))
+                on_page = False
+        return results
+
+    def _scrape_next_month(self, cust, target_year, target_month, target_day=None):
+        """表示中の利用者ページで年月だけを切り替えて取得する"""
+        name = cust['name']
+        logger.info(f"  {name}: {target_year}年{target_month}月に切り替えます")
+        self.pages_since_launch += 1
+        try:
+            if not self.ensure_list_view_and_date(target_year, target_month):
+                raise CustomerScrapeError("年月の設定に失敗しました")
+            data = self.scrape_schedule_table(cust, f"{target_year}-{target_month:02d}", target_day)
+            self._record_page(cust['pid'], target_year, target_month, target_day)
+        except CustomerScrapeError:
+            logger.error(f"  {name}: {target_year}年{target_month}月の年月の設定に失敗しました")
+            raise
+        except Exception as e:
+            logger.error(f"  -> {name} の処理失敗: {e}")
+            raise CustomerScrapeError(f"処理中にエラー: {e}") from e
+        logger.info(
+            f"  -> {name}: {target_year}年{target_month}月 {len(data)}件のデータを取得しました")
+        return data
+
+    def _process_customer(self, worker, idx, cust, months, found, attempt=1):
+        """worker で1人分の未取得の月を取得し、取得済みの月と合わせて記録する
+
+        失敗した月がある場合、再試行の回数が残っていれば記録せずに再試行キューに入れる。
+        """
+        results = dict(found)
+        errors = {}
+        # 利用者の切れ目でブラウザのメモリを確認する（上限を超えていれば次の利用者の前に再起動する）
+        worker._check_browser_memory()
+        if self.pacer is not None:
+            self.pacer.acquire(len(months))
+        start = time.monotonic()
+        worker._start_budget(self.customer_budget, len(months))
+        try:
+            with self.timer.context(pid=cust['pid'], name=cust['name']), \
+                    self.timer.span("customer", months=len(months), attempt=attempt):
+                scraped = worker.scrape_customer_months(cust, months, self._target_day)
+        finally:
+            worker._start_budget(None, 0)
+            if self.pacer is not None:
+                self.pacer.release()
+        if self.pacer is not None:
+            self.pacer.observe((time.monotonic() - start) / max(1, len(months)),
+                               ok=not any(error for _, _, error in scraped))
+        for year_month, data, error in scraped:
+            results[year_month] = data
+            # 日を指定した取得結果は1か月分ではないので月次キャッシュには保存しない
+            if error:
+                errors[year_month] = error
+            elif self.month_cache is not None and not self._target_day:
+                self.month_cache.put(cust['pid'], *year_month, data)
+            if self._checkpoint is not None:
+                self._checkpoint.record(cust, year_month, data, error)
+        if self._breaker is not None:
+            self._breaker.record(not errors)
+        self._defer_or_record(idx, cust, results, errors, attempt)
+
+    def _process_customer_safely(self, worker, idx, cust, months, found, attempt=1):
+        """_process_customer を実行し、予期しない例外はその利用者の全ての月の失敗（再試行の対象）として扱う"""
+        try:
+            self._process_customer(worker, idx, cust, months, found, attempt)
+        except Exception as e:
+            logger.error(f"  -> {cust['name']} の処理中に予期しないエラー: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            self._defer_or_record(idx, cust, {**found, **{ym: [] for ym in months}},
+                                  {ym: f"処理中にエラー: {e}" for ym in months}, attempt)
+
+    def _defer_or_record(self, idx, cust, results, errors, attempt):
+        """失敗した月があり再試行の回数が残っていれば再試行キューに入れ、そうでなければ結果を記録する"""
+        if errors and attempt <= self.retries:
+            done = {ym: rows for ym, rows in results.items() if ym not in errors}
+            with self._result_lock:
+                self._deferred.append((idx, cust, sorted(errors), done))
+                # 再試行の前に中断した場合にも理由を報告できるよう、最新の失敗理由を残しておく
+                for year_month, error in errors.items():
+                    self._failures[(cust['pid'], year_month)] = (cust['name'], error, attempt)
+            logger.warning(
+                f"  {cust['name']}: {len(errors)}か月分の取得に失敗したため、後で再試行します"
+                f"（{attempt}回目: {next(iter(errors.values()))}）")
+            return
+        self._record_customer(idx, cust, results, errors, attempt)
+
+    def _record_customer(self, idx, cust, results, errors=None, attempts=1):
+        """1人分の結果（{(年, 月): スケジュール}）を月ごとのCSVに追記する"""
+        with self._result_lock:
+            for year_month in results:
+                if year_month not in (errors or {}):
+                    # 再試行で取得できた月
+                    self._failures.pop((cust['pid'], year_month), None)
+            for year_month, error in (errors or {}).items():
+                self._failures[(cust['pid'], year_month)] = (cust['name'], error, attempts)
+            deltas = self._update_snapshot(cust, results, errors or {})
+            self._add_to_writers(idx, cust['name'], cust['pid'], results, deltas)
+
+    def _add_to_writers(self, idx, name, pid, results, deltas, delta_only=False):
+        """1人分の結果を各出力に追記する（差分CSVには deltas を書く）"""
+        writers = [w for w in self._writers if w.op_column or not delta_only]
+        # 取得時に作った ScheduleRecord のリストを、全ての出力でそのまま共有する
+        if self._combined:
+            rows, delta_rows = ([r for ym in self._months for r in source.get(ym, [])]
+                                for source in (results, deltas))
+            for writer in writers:
+                writer.add(idx, name, delta_rows if writer.op_column else rows, pid)
+        else:
+            for writer in writers:
+                source = deltas if writer.op_column else results
+                year_month = tuple(int(v) for v in writer.year_month.split("-"))
+                writer.add(idx, name, source.get(year_month, []), pid)
+
+    def _update_snapshot(self, cust, results, errors):
+        """今回の結果をスナップショットに保存し、--diff-against の内容との差分 {(年, 月): 行} を返す
+
+        内容のハッシュが同じ月は差分なし。取得に失敗した月は前回の内容を残し、差分も出さない。
+        """
+        deltas = {}
+        if self.snapshots is None:
+            return deltas
+        for year_month in self._months:
+            if year_month in errors:
+                continue
+            rows = results.get(year_month, [])
+            scope = snapshot_scope(*year_month, self._target_day)
+            digest = SnapshotStore.content_hash(rows)
+            if self._diff_against:
+                previous = self.snapshots.get(self._diff_against, scope, cust['pid'], cust['name'])
+                if previous is None:
+                    deltas[year_month] = [r.with_op("added") for r in rows]
+                elif previous[0] != digest:
+                    deltas[year_month] = diff_schedules(previous[1], rows)
+            if self.snapshot_label:
+                self.snapshots.put(self.snapshot_label, scope, cust['pid'],
+                                   cust['name'], rows, digest)
+        return deltas
+
+    def _record_removed_customers(self, customers):
+        """比較対象のスナップショットにあり、今回の利用者一覧にいない利用者を削除（removed）として出力する"""
+        current = {c['pid'] for c in customers}
+        removed = {}
+        for year_month in self._months:
+            scope = snapshot_scope(*year_month, self._target_day)
+            for pid, name in self.snapshots.customers(self._diff_against, scope).items():
+                if pid in current:
+                    continue
+                if self.shard and shard_of(pid, self.shard[1]) != self.shard[0]:
+                    # 他のシャードが担当する利用者
+                    continue
+                _, rows = self.snapshots.get(self._diff_against, scope, pid, name)
+                removed.setdefault((pid, name), {})[year_month] = \
+                    [r.with_op("removed") for r in rows]
+                if self.snapshot_label:
+                    self.snapshots.delete(self.snapshot_label, scope, pid)
+        for idx, ((pid, name), deltas) in enumerate(removed.items(), len(customers) + 1):
+            logger.info(f"  利用者一覧から削除された利用者: {name} (PID: {pid})")
+            with self._result_lock:
+                self._add_to_writers(idx, name, pid, {}, deltas, delta_only=True)
+
+    def _report_failures(self):
+        """取得に失敗した利用者・月をログと標準出力（FAILED:<PID>:<YYYY-MM>:<理由>）に出力する"""
+        if not self._failures:
+            return
+        logger.warning(f"取得に失敗した利用者・月: {len(self._failures)}件")
+        for (pid, (year, month)), (name, reason, attempts) in sorted(self._failures.items()):
+            logger.warning(
+                f"  ✗ {name} (PID: {pid}, {year}-{month:02d}): {reason}（{attempts}回試行）")
+            # 失敗した利用者・月を標準出力に出力（Node.js側で取得するため）
+            with _stdout_lock:
+                print(f"FAILED:{pid}:{year}-{month:02d}:{reason}", flush=True)
+
+    def _dispatch(self, tasks, total, attempt=1):
+        """利用者の取得を1人ずつ、または並列ワーカーで実行する（サーキットブレーカーが開いたら止める）"""
+        if self.workers > 1 and len(tasks) > 1:
+            self._run_worker_pool(tasks, total, attempt)
+            return
+        for n, (idx, cust, pending, found) in enumerate(tasks):
+            if self._breaker is not None and self._breaker.is_open:
+                break
+            # --tabs が2以上の場合、後に続く利用者のページを先読みする
+            self._upcoming = tasks[n + 1:n + self.tabs]
+            name = cust['name']
+            pid = cust['pid']
+
+            # 再試行の間は進捗を戻さない
+            progress = 30 + int((idx / total) * 60) if attempt == 1 else 90
+            self.update_progress(
+                progress, f"[{idx}/{total}] {name} の処理中...")
+            logger.info(
+                f"[{idx}/{total}] {name} (PID: {pid}) の処理を開始...")
+            self._process_customer_safely(self, idx, cust, pending, found, attempt)
+        self._upcoming = []
+
+    def _run_worker_pool(self, tasks, total, attempt=1):
+        """複数のログイン済みブラウザで利用者を分担して取得する
+
+        追加のワーカーは実行の終わり（デーモンモードでは終了時）まで再試行にも使い回す。
+        """
+        extra_workers = self._extra_workers
+        if len(extra_workers) < self.workers - 1:
+            extra_workers += self._start_extra_workers(
+                self.workers - 1 - len(extra_workers))
+        for w in extra_workers:
+            w.recorder = self.recorder
+        workers = [self] + extra_workers
+        logger.info(f"並列モード: {len(workers)} ワーカーで処理します")
+
+        task_queue = queue.Queue()
+        for task in tasks:
+            task_queue.put(task)
+
+        done_count = [total - len(tasks)]
+        lock = threading.Lock()
+
+        def work(worker_no, worker):
+            # 先読みのため、タブの数だけ先の利用者までこのワーカーで引き受ける
+            lookahead = deque()
+            while True:
+                if self._breaker is not None and self._breaker.is_open:
+                    break
+                while len(lookahead) < worker.tabs:
+                    try:
+                        lookahead.append(task_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not lookahead:
+                    break
+                idx, cust, months, found = lookahead.popleft()
+                worker._upcoming = list(lookahead)
+                name = cust['name']
+                logger.info(
+                    f"[{idx}/{total}] {name} (PID: {cust['pid']}) の処理を開始... (ワーカー{worker_no})")
+                # スレッドが止まると、この利用者と先に引き受けた利用者が出力から抜けるため、例外は失敗として扱って続ける
+                self._process_customer_safely(worker, idx, cust, months, found, attempt)
+                with lock:
+                    done_count[0] += 1
+                    done = done_count[0]
+                    progress = 30 + int((done / total) * 60) if attempt == 1 else 90
+                    self.update_progress(
+                        progress, f"[{done}/{total}] {name} の処理が完了しました")
+            worker._upcoming = []
+
+        threads = [threading.Thread(target=work, args=(no, w), daemon=True)
+                   for no, w in enumerate(workers, 1)]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            for w in extra_workers:
+                self.readiness.records.extend(w.readiness.records)
+                w.readiness.records = []
+            self._extra_workers = extra_workers
+        # サーキットブレーカーで止めた場合を除き、全員分の処理（成功・失敗・再試行待ち）が終わっていなければ出力を確定しない
+        if done_count[0] != total and not (self._breaker is not None and self._breaker.is_open):
+            raise RuntimeError(
+                f"並列取得で{total - done_count[0]}名の処理が完了しませんでした。出力を確定せずに中断します")
+
+    def run(self, target_year, target_month, target_day=None, job_id=None,
+            resume=False):
+        return self.run_months([(target_year, target_month)], target_day,
+                               job_id=job_id, resume=resume)
+
+    def run_months(self, months, target_day=None, job_id=None, resume=False,
+                   combine=False, pids=None, diff_against=None, record=False):
+        """1回のログインと利用者一覧の取得で、指定した全ての月を取得する
+
+        combine=True の場合は「年月」列を付けた1つのCSVに、それ以外は月ごとのCSVに出力する。
+        pids を指定した場合はその利用者だけを取得する。
+        diff_against にスナップショット名を指定すると、CSVはその内容からの差分CSVになる。
+        record=True の場合、取得したページのHTMLを1つのアーカイブ（*.pages.zip）に保存する（--replay で再生できる）。
+        """
+        checkpoint = None
+        first_year, first_month = months[0]
+        last_year, last_month = months[-1]
+        if len(months) == 1:
+            target_label = f"{first_year}年{first_month}月" + \
+                (f"{target_day}日" if target_day else "")
+        else:
+            target_label = f"{first_year}年{first_month}月〜{last_year}年{last_month}月（{len(months)}か月）"
         try:
             self.update_progress(10, "ログイン処理を開始しています...")
-            if not self.login():
-                self.close()
+            with self.timer.span("login") as span:
+                span["ok"] = self.login()
+            if not span["ok"]:
+                self._end_job()
                 return False
 
-            self.update_progress(
-                20, f"対象年月: {target_year}年{target_month}月" + (f"{target_day}日" if target_day else ""))
-            logger.info(f"対象年月: {target_year}年{target_month}月" +
-                        (f"{target_day}日" if target_day else ""))
-
-            # 1. 全員のIDを取得
-            self.update_progress(30, "利用者情報を取得しています...")
-            customers = self.get_all_customers()
+            self.update_progress(20, f"対象年月: {target_label}")
+            logger.info(f"対象年月: {target_label}")
+
+            # ジョブIDがある場合は利用者ごとの結果をチェックポイントに記録する
+            if job_id:
+                checkpoint = CheckpointStore(job_id, months, target_day)
+                logger.info(f"チェックポイント: {checkpoint.path}")
+            if record:
+                archive_csv = csv_filename(first_year, first_month, target_day) if len(months) == 1 \
+                    else csv_range_filename(months[0], months[-1])
+                if self.shard:
+                    archive_csv = shard_filename(archive_csv, self.shard)
+                self.recorder = PageArchive(archive_filename(archive_csv), months, target_day)
+                self.recorder.index["shard"] = list(self.shard) if self.shard else None
+                logger.info(f"取得したページを保存します: {self.recorder.path}")
+
+            # 1. 全員のIDを取得（再開時は前回の利用者一覧をそのまま使う）
+            customers = checkpoint.load_roster() if checkpoint and resume else []
+            if customers:
+                logger.info(f"チェックポイントの利用者一覧を再利用します（{len(customers)}名）")
+            else:
+                self.update_progress(30, "利用者情報を取得しています...")
+                customers = self.load_roster(pids)
 
             if not customers:
                 self.update_progress(0, "利用者情報の取得に失敗しました")
-                self.close()
+                self._end_job()
                 return False
 
-            all_results = {}
-            total = len(customers)
-            logger.info(f"合計 {total} 名の利用者を処理します")
+            # 全体の利用者一覧（シャードの場合はマニフェストに記録し、マージ時の並び順に使う）
+            self._roster = customers
+            if self.replay is not None and self.shard and self.replay.roster_html() is not None:
+                # 再生する対象者はシャードの分だけなので、全体の一覧は記録した利用者一覧ページから求める
+                self._roster = parse_customer_page(self.replay.roster_html())
+            if self.shard:
+                customers = [c for c in customers if shard_of(c['pid'], self.shard[1]) == self.shard[0]]
+                logger.info(
+                    f"シャード {self.shard[0]}/{self.shard[1]}: {len(self._roster)}名のうち{len(customers)}名を担当します")
+            if self.recorder is not None:
+                self.recorder.index["customers"] = [[c['pid'], c['name']] for c in customers]
 
-            # 2. 全員分ループ
+            total = len(customers)
+            self._months = list(months)
+            self._target_day = target_day
+            self._diff_against = diff_against
+            if diff_against and self.snapshots is None:
+                # 保存はしないが、比較のためにスナップショットを読む
+                self.snapshots = SnapshotStore()
+            self._combined = combine and len(months) > 1
+            self._failures = {}
+            for worker in [self] + self._extra_workers:
+                worker._reset_tabs()
+            self._deferred = []
+            self._breaker = CircuitBreaker(self.breaker_threshold) \
+                if self.breaker_threshold else None
+            self._result_lock = threading.Lock()
+            self._checkpoint = checkpoint
+            # 出力は最初に開き、利用者の取得が終わるたびに追記する
+            if self._combined:
+                self._writers = self._open_outputs(
+                    first_year, first_month, last_month=(last_year, last_month))
+            else:
+                self._writers = [writer for y, m in self._months
+                                 for writer in self._open_outputs(y, m, target_day)]
+
+            completed = {}
+            if checkpoint is not None:
+                checkpoint.start(self._roster, resume)
+                completed = checkpoint.completed_results()
+            # ページを記録する場合は、全員分のページが揃うよう月次キャッシュを使わない
+            closed_months = [ym for ym in self._months
+                             if self.month_cache is not None and not record
+                             and self.month_cache.is_closed(*ym)]
+
+            # 取得済み（チェックポイント）・締まった月（キャッシュ）の結果を先に確定し、
+            # 残りの月がある利用者だけをサイトから取得する
+            tasks = []
+            resumed = 0
+            cache_hits = 0
             for idx, cust in enumerate(customers, 1):
-                name = cust['name']
-                pid = cust['pid']
-                target_url = f"{BASE_URL}/jissekis/editCustomer/{pid}"
-
-                progress = 30 + int((idx / total) * 60)
-                self.update_progress(
-                    progress, f"[{idx}/{total}] {name} の処理中...")
-                logger.info(f"[{idx}/{total}] {name} (PID: {pid}) の処理を開始...")
-
-                try:
-                    # ページに移動（URLパラメータで年月を指定してみる）
-                    # ただし、この方法が動作しない可能性もあるので、通常のURLも試す
-                    target_url_with_params = f"{target_url}?year={target_year}&month={target_month}"
-                    self.driver.get(target_url_with_params)
-
-                    # ページが完全に読み込まれるまで待機（Render環境対応）
-                    # まず、基本的な要素が読み込まれるまで待機
-                    try:
-                        self.wait.until(EC.presence_of_element_located(
-                            (By.CSS_SELECTOR, "body")))
-                        # JavaScriptの実行が完了するまで待機
-                        for ready_check in range(10):  # 最大10秒待機
-                            ready_state = self.driver.execute_script(
-                                "return document.readyState")
-                            if ready_state == "complete":
-                                break
-                            time.sleep(1)
-                        time.sleep(3)  # 追加の待機時間（Render環境では長めに）
-                    except:
-                        time.sleep(3)  # フォールバック
-
-                    # serviceDate要素が存在するまで待機（タイムアウトを延長）
-                    service_date_found = False
-                    for wait_attempt in range(20):  # 最大20秒待機（Render環境対応）
-                        try:
-                            # 要素の存在確認
-                            element = self.driver.find_element(
-                                By.ID, "serviceDate")
-                            if element:
-                                # 要素が実際に値を持っているか確認
-                                current_date_val = self.driver.execute_script(
-                                    "var el = document.getElementById('serviceDate'); return el && el.value ? el.value : null;")
-                                if current_date_val:
-                                    service_date_found = True
-                                    logger.info(
-                                        f"  serviceDate要素を確認: {current_date_val} (待機時間: {wait_attempt + 1}秒)")
-                                    break
-                        except:
-                            pass
-                        time.sleep(1)
-                        if wait_attempt % 3 == 0:  # 3秒ごとにログ出力
-                            logger.debug(
-                                f"  serviceDate要素を待機中... ({wait_attempt + 1}/20)")
-
-                    if not service_date_found:
-                        logger.warning(
-                            "  serviceDate要素が見つかりません（URLパラメータ確認をスキップ）")
-                        current_date_val = None
-                    else:
-                        logger.info(f"  serviceDate要素を確認: {current_date_val}")
-
-                    target_year_month = f"{target_year}-{target_month:02d}"
-
-                    if current_date_val:
-                        current_year_month = "-".join(
-                            current_date_val.split("-")[:2])
-                        if current_year_month == target_year_month:
-                            logger.info(
-                                f"  URLパラメータで年月が正しく設定されました: {current_date_val}")
-                            # テーブルが読み込まれるまで待機
-                            try:
-                                self.wait.until(EC.presence_of_element_located(
-                                    (By.CSS_SELECTOR, ".list_table")))
-                            except:
-                                pass
-                            time.sleep(0.5)
-                            # 年月設定をスキップしてデータ抽出へ
-                            date_set_success = True
-                        else:
-                            # 通常の年月設定処理を実行
-                            date_set_success = None
-                    else:
-                        # 通常の年月設定処理を実行
-                        date_set_success = None
-
-                    # 年月を設定（URLパラメータで設定できなかった場合のみ）
-                    if date_set_success is None:
-                        date_set_success = self.ensure_list_view_and_date(
-                            target_year, target_month)
-
-                    if not date_set_success:
-                        logger.error(f"  {name}: 年月の設定に失敗しました")
-                        all_results[name] = []
+                found = {}
+                pending = []
+                from_cache = 0
+                for year_month in self._months:
+                    key = (cust['pid'], year_month)
+                    if key in completed:
+                        found[year_month] = completed[key]
                         continue
-
-                    # データを抽出
-                    data = self.scrape_schedule_table()
-
-                    if len(data) == 0:
-                        logger.warning(f"  {name}: データが0件でした。")
-                        # 現在の日付を確認
-                        try:
-                            current_date = self.driver.execute_script(
-                                "return document.getElementById('serviceDate').value")
-                            logger.info(f"  現在表示されている日付: {current_date}")
-                        except:
-                            pass
-
-                    all_results[name] = data
-                    logger.info(f"  -> {name}: {len(data)}件のデータを取得しました")
-
-                except Exception as e:
-                    logger.error(f"  -> {name} の処理失敗: {e}")
-                    import traceback
-                    logger.error(traceback.format_exc())
-                    # エラーが発生しても空のリストを追加（全員分の記録を保持）
-                    all_results[name] = []
+                    cached = self.month_cache.get(cust['pid'], *year_month, cust['name']) \
+                        if year_month in closed_months else None
+                    if cached is None:
+                        pending.append(year_month)
+                        continue
+                    if target_day:
+                        cached = filter_by_day(cached, target_day)
+                    found[year_month] = cached
+                    from_cache += 1
+                    if checkpoint is not None:
+                        checkpoint.record(cust, year_month, cached)
+                if pending:
+                    tasks.append((idx, cust, pending, found))
+                    continue
+                self._record_customer(idx, cust, found)
+                if from_cache:
+                    cache_hits += 1
+                    progress = 30 + int((idx / total) * 60)
+                    self.update_progress(
+                        progress, f"[{idx}/{total}] {cust['name']} はキャッシュから取得しました（{sum(len(r) for r in found.values())}件）")
+                else:
+                    resumed += 1
+            if resumed:
+                logger.info(f"チェックポイントから再開: 取得済み {resumed}名をスキップします")
+            if closed_months:
+                logger.info(
+                    f"月次キャッシュ: {cache_hits}名をキャッシュから取得、{len(tasks)}名をサイトから取得します")
+            logger.info(f"合計 {total} 名の利用者を処理します（今回の取得対象: {len(tasks)}名）")
+
+            if tasks and self.http is not None and self.driver is None:
+                self._check_http_month_params(tasks[0][1], tasks[0][2])
+
+            # 2. 全員分ループ（失敗・時間切れの利用者は1巡目の後にまとめて再試行する）
+            self._dispatch(tasks, total)
+            attempt = 1
+            while self._deferred and not (self._breaker and self._breaker.is_open):
+                retry_tasks, self._deferred = sorted(self._deferred, key=lambda t: t[0]), []
+                wait = self.retry_backoff * 2 ** (attempt - 1)
+                attempt += 1
+                self.update_progress(
+                    90, f"取得に失敗した{len(retry_tasks)}名を再試行しています（{attempt - 1}/{self.retries}回目）...")
+                logger.info(f"再試行 {attempt - 1}/{self.retries}回目: {len(retry_tasks)}名を{wait:g}秒後に取得し直します")
+                time.sleep(wait)
+                self._dispatch(retry_tasks, total, attempt)
+            if self._breaker is not None and self._breaker.is_open:
+                self._report_failures()
+                raise RuntimeError(
+                    "取得の失敗が続いたため、サイトが停止している可能性があります。処理を中断しました"
+                    "（--job-id を指定していれば --resume で取得済みの利用者をスキップして再開できます）")
 
             # 3. CSV保存とログ出力
-            logger.info(f"全員分の処理が完了しました。取得した利用者数: {len(all_results)}名")
+            logger.info(f"全員分の処理が完了しました。取得した利用者数: {total}名")
+            if cache_hits:
+                logger.info(f"うちキャッシュから取得: {cache_hits}名")
+            logger.info(f"ページ待機時間（全体）: {self.readiness.summarize()}")
+            if self.pacer is not None:
+                logger.info(f"ペース調整: {self.pacer.summarize()}")
+            if self.driver is not None:
+                logger.info(f"年月の切り替え: {self.month_nav.summarize()}")
+            page_loads = [s for s in self.timer.spans if s["phase"] == "page_load"]
+            if page_loads:
+                total_bytes = sum(s["bytes"] for s in page_loads)
+                logger.info(
+                    f"ページ読み込み（{self.browser_profile}）: {len(page_loads)}ページ, "
+                    f"合計 {total_bytes / 1024:.1f}KB（平均 {total_bytes / len(page_loads) / 1024:.1f}KB）, "
+                    f"DOMContentLoaded 平均 {sum(s['seconds'] for s in page_loads) / len(page_loads):.2f}秒")
+            parses = [s for s in self.timer.spans
+                      if s["phase"] == "replay_parse" and s.get("page") == "customer"]
+            if parses:
+                parse_seconds = sum(s["seconds"] for s in parses)
+                logger.info(
+                    f"アーカイブの解析: {len(parses)}ページ, 合計 {parse_seconds:.3f}秒"
+                    f"（{len(parses) / max(parse_seconds, 1e-9):.0f}ページ/秒, "
+                    f"{sum(s['bytes'] for s in parses) / 1024 / 1024 / max(parse_seconds, 1e-9):.1f}MB/秒）")
+            if self.tabs > 1 and self.http is None:
+                used = [s["seconds"] for s in self.timer.spans if s["phase"] == "prefetch"]
+                issued = sum(w.prefetched for w in [self] + self._extra_workers)
+                logger.info(
+                    f"タブの先読み（1ブラウザ {self.tabs}タブ）: 先読み {issued}ページ, 使用 {len(used)}ページ"
+                    + (f", 先読み開始から表示まで 平均 {sum(used) / len(used):.2f}秒" if used else ""))
+            rss = [s["rss_mb"] for s in self.timer.spans
+                   if s["phase"] == "browser_rss" and s.get("rss_mb") is not None]
+            if rss:
+                recycles = Counter({"rss": "RSS", "pages": "ページ数"}[s["trigger"]]
+                                   for s in self.timer.spans if s["phase"] == "recycle")
+                logger.info(
+                    f"ブラウザのメモリ（RSS）: 最初 {rss[0]:.0f}MB, 最大 {max(rss):.0f}MB, 最後 {rss[-1]:.0f}MB"
+                    f"（{len(rss)}回計測）, 再起動 {sum(recycles.values())}回"
+                    + (f"（{', '.join(f'{k} {v}回' for k, v in recycles.items())}）" if recycles else ""))
+            self._report_failures()
+            if diff_against and pids is None:
+                self._record_removed_customers(customers)
             self.update_progress(95, "CSVファイルを保存しています...")
-            self.save_to_csv(target_year, target_month,
-                             all_results, target_day)
+            writers, self._writers = self._writers, []
+            for writer in writers:
+                self._finish_output(writer)
+            # 出力がすべて確定してからスナップショットを確定する
+            if self.snapshots is not None:
+                self.snapshots.commit()
+            if self.recorder is not None:
+                self.recorder.close()
+                with _stdout_lock:
+                    print(f"OUTPUT_FILE:{self.recorder.path}", flush=True)
+                self.recorder = None
+            if checkpoint is not None and not self._failures:
+                # 全員分を取得できたジョブは再開する必要がない（失敗があれば --resume のために残す）
+                checkpoint.remove()
+                checkpoint = None
             self.update_progress(100, "処理が完了しました")
-            self.close()
+            self._end_job()
             return True
         except Exception as e:
             logger.error(f"実行エラー: {e}")
             self.update_progress(0, f"エラーが発生しました: {str(e)}")
-            self.close()
+            self._end_job()
             return False
+        finally:
+            for writer in self._writers:
+                writer.abort()
+            self._writers = []
+            if self.recorder is not None:
+                self.recorder.abort()
+                self.recorder = None
+            if self.profile:
+                self.timer.report()
+            if checkpoint is not None:
+                checkpoint.close()
+            self._diff_against = None
+            if self.snapshots is not None:
+                # 確定していない（途中で失敗した実行の）スナップショットは破棄する
+                self.snapshots.rollback()
+                if not self.keep_alive:
+                    self.snapshots.close()
+            if self.month_cache is not None and not self.keep_alive:
+                self.month_cache.close()
+
+    def serve(self, stream):
+        """JSON Lines のジョブを1行ずつ読み、ログイン済みのブラウザを使い回して順番に実行する
+
+        1行が1ジョブ（例: {"job_id": "abc", "year": 2025, "month": 11, "day": 15}）。
+        期間指定は "from"/"to"（YYYY-MM）、ほかに "combine"・"pids"・"resume" を指定できる。
+        ジョブごとに JOB_START:<ジョブID> と JOB_END:<ジョブID>:<ok|error> を出力し、その間に
+        通常の実行と同じ PROGRESS: / CSV_FILE: を出力する。{"command": "shutdown"} か入力の終わりで終了する。
+        """
+        self.keep_alive = True
+        try:
+            # 最初のジョブを待たずにログインし、並列ワーカーも起動しておく
+            if not self.login():
+                logger.error("デーモンの起動時のログインに失敗しました")
+                return False
+            if self.workers > 1:
+                self._extra_workers = self._start_extra_workers(self.workers - 1)
+            with _stdout_lock:
+                print("READY", flush=True)
+            logger.info(f"ジョブの受付を開始しました（ワーカー数: {1 + len(self._extra_workers)}）")
+
+            for line in stream:
+                line = line.strip()
+                if not line:
+                    continue
+                job = None
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict):
+                        raise ValueError("JSONオブジェクトではありません")
+                    if job.get("command") == "shutdown":
+                        break
+                    months = job_months(job)
+                except (ValueError, KeyError, TypeError) as e:
+                    job_id = job.get("job_id") or "" if isinstance(job, dict) else ""
+                    logger.error(f"ジョブの形式が正しくありません: {e}")
+                    with _stdout_lock:
+                        print(f"JOB_END:{job_id}:error", flush=True)
+                    continue
+                self._run_job(job, months)
+            return True
+        finally:
+            self.keep_alive = False
+            self.close()
+            if self.month_cache is not None:
+                self.month_cache.close()
+            if self.snapshots is not None:
+                self.snapshots.close()
+
+    def _run_job(self, job, months):
+        """デーモンで受け付けた1件のジョブを実行する"""
+        job_id = job.get("job_id") or ""
+        with _stdout_lock:
+            print(f"JOB_START:{job_id}", flush=True)
+        self.timer.reset()
+        self.readiness.records = []
+        started_at = time.time()
+        pids = job.get("pids")
+        if isinstance(pids, str):
+            pids = [p.strip() for p in pids.split(",") if p.strip()]
+        success = self.run_months(months, job.get("day"), job_id=job.get("job_id"),
+                                  resume=bool(job.get("resume")),
+                                  combine=bool(job.get("combine")), pids=pids or None,
+                                  diff_against=job.get("diff_against"),
+                                  record=bool(job.get("record")))
+        first = min((s["started_at"] for s in self.timer.spans if s["phase"] == "customer"),
+                    default=None)
+        if first is not None:
+            logger.info(f"ジョブ {job_id}: 最初の利用者の取得開始まで {first - started_at:.2f}秒")
+        logger.info(f"ジョブ {job_id}: {'完了' if success else '失敗'}（{time.time() - started_at:.1f}秒）")
+        with _stdout_lock:
+            print(f"JOB_END:{job_id}:{'ok' if success else 'error'}", flush=True)
+
+
+def job_months(job):
+    """デーモンのジョブ（辞書）から対象の [(年, 月)] を返す。不正な場合は ValueError"""
+    if job.get("from") or job.get("to"):
+        if not (job.get("from") and job.get("to")):
+            raise ValueError("from と to は両方指定してください")
+        if not all(re.fullmatch(r"\d{4}-\d{2}", str(job[k])) for k in ("from", "to")):
+            raise ValueError("from/to は YYYY-MM 形式で指定してください")
+        if job.get("day"):
+            raise ValueError("day は from/to と同時に指定できません")
+        months = month_range(job["from"], job["to"])
+        if not months:
+            raise ValueError("from には to 以前の月を指定してください")
+        return months
+    year, month = int(job["year"]), int(job["month"])
+    if not 1 <= month <= 12:
+        raise ValueError(f"month が不正です: {month}")
+    return [(year, month)]
+
+
+def month_range(start, end):
+    """"YYYY-MM" 形式の開始月から終了月までの [(年, 月)] を返す"""
+    start_year, start_month = (int(v) for v in start.split("-"))
+    end_year, end_month = (int(v) for v in end.split("-"))
+    months = []
+    year, month = start_year, start_month
+    while (year, month) <= (end_year, end_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='かんたん介護スケジュール取得')
-    parser.add_argument('--year', type=int, required=True, help='対象年')
-    parser.add_argument('--month', type=int, required=True, help='対象月')
+    parser.add_argument('--year', type=int, help='対象年（--from/--to を使わない場合は必須）')
+    parser.add_argument('--month', type=int, help='対象月（--from/--to を使わない場合は必須）')
+    parser.add_argument('--from', dest='month_from', type=str,
+                        help='期間指定の開始月（YYYY-MM）。--to と組み合わせて複数月を1回で取得する')
+    parser.add_argument('--to', dest='month_to', type=str, help='期間指定の終了月（YYYY-MM）')
+    parser.add_argument('--pids', type=str,
+                        help='取得する利用者のPID（カンマ区切り）。指定すると利用者一覧ページを開かない')
+    parser.add_argument('--metrics-file', type=str,
+                        help='フェーズごとの所要時間を JSON Lines で書き出すファイル')
+    parser.add_argument('--profile', action='store_true',
+                        help='実行の最後にフェーズ別の所要時間（p50/p95/最大）と時間のかかった利用者を表示する')
+    parser.add_argument('--combine', action='store_true',
+                        help='期間指定時に「年月」列付きの1つのCSVにまとめる（デフォルトは月ごとのCSV）')
     parser.add_argument('--day', type=int, help='対象日（オプション）')
     parser.add_argument('--job-id', type=str, help='ジョブID（進捗管理用）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='並列に起動するブラウザ数（デフォルト: 1）')
+    parser.add_argument('--page-timeout', type=float, default=PAGE_TIMEOUT,
+                        help=f'ページ準備完了の待機上限秒数（デフォルト: {PAGE_TIMEOUT:g}）')
+    parser.add_argument('--verify-extraction', action='store_true',
+                        help='一括取得と要素ごとの取得の両方を実行して結果を照合する')
+    parser.add_argument('--fetch-mode', choices=['browser', 'http'], default='browser',
+                        help='利用者ページの取得方法（http: ログイン後はブラウザを使わずHTTPで取得）')
+    parser.add_argument('--shard', type=str,
+                        help='利用者一覧をPIDでN分割した i 番目だけを取得する（例: 2/4）。出力は merge_shards.py でまとめる')
+    parser.add_argument('--tabs', type=int, default=1,
+                        help='1つのブラウザで開くタブの数（2以上の場合、次の利用者のページを別のタブで先読みする。デフォルト: 1）')
+    parser.add_argument('--http-login', action='store_true',
+                        help='--fetch-mode http でログインもHTTPのフォーム送信で行う（Chromeを起動しない）')
+    parser.add_argument('--recycle-rss-mb', type=float, default=0,
+                        help='ブラウザ（chromedriver と Chrome の全プロセス）のメモリ使用量（RSS, MB）がこの値以上になったら、'
+                             '次の利用者の前にブラウザを再起動する（0: 再起動しない。デフォルト: 0）')
+    parser.add_argument('--recycle-pages', type=int, default=0,
+                        help='ブラウザを起動してからこのページ数を開いたら、次の利用者の前にブラウザを再起動する（0: 再起動しない。デフォルト: 0）')
+    parser.add_argument('--output', type=str, default='csv',
+                        help='出力形式（カンマ区切りで複数指定可: csv, sqlite, parquet, arrow, summary。デフォルト: csv）')
+    parser.add_argument('--snapshot', type=str,
+                        help='今回の取得結果を指定した名前のスナップショットに保存する（例: latest。'
+                             'デフォルト: 保存しない。--diff-against を指定した場合はその名前）')
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help='取得結果をスナップショットに保存しない')
+    parser.add_argument('--diff-against', type=str,
+                        help='指定したスナップショットからの差分（追加・削除・変更の行）だけをCSVに出力する（例: latest）')
+    parser.add_argument('--adaptive-pacing', action='store_true',
+                        help='応答時間と失敗に応じて同時実行数（--workers が上限）と取得の間隔を自動で調整する')
+    parser.add_argument('--max-rps', type=float,
+                        help='1秒あたりのページ読み込みの開始回数の上限')
+    parser.add_argument('--customer-budget', type=float, default=0,
+                        help='利用者1人・1か月あたりの取得時間の上限（秒、例: 60）。超えた利用者は後で再試行する（デフォルト: 0、上限なし）')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='取得に失敗した利用者を1巡目の後に取得し直す回数（デフォルト: 2）')
+    parser.add_argument('--retry-backoff', type=float, default=5,
+                        help='再試行の前の待ち時間（秒）。再試行のたびに2倍にする（デフォルト: 5）')
+    parser.add_argument('--breaker-threshold', type=float, default=0,
+                        help='直近10名のうち取得に失敗した割合がこの値以上になったら実行を中止する（例: 0.8。デフォルト: 0、中止しない）')
+    parser.add_argument('--record', action='store_true',
+                        help='取得した利用者一覧・利用者ページのHTMLを1つの圧縮アーカイブ（schedule_YYYY_MM.pages.zip）に保存する')
+    parser.add_argument('--replay', type=str, metavar='ARCHIVE',
+                        help='--record で保存したアーカイブを、サイトにアクセスせずブラウザなしで解析してCSVを出力する')
+    parser.add_argument('--daemon', action='store_true',
+                        help='ログイン済みのブラウザを保持したまま、標準入力から JSON Lines のジョブを受け付ける')
+    parser.add_argument('--browser-profile', choices=['default', 'lean'], default='default',
+                        help='ブラウザの設定（lean: 画像・フォント・CSSを読み込まず、DOMContentLoaded で次の処理に進む）')
+    parser.add_argument('--no-session-cache', action='store_true',
+                        help='保存済みのログインセッションを使わず、毎回ログインする')
+    parser.add_argument('--resume', action='store_true',
+                        help='同じ --job-id のチェックポイントから再開し、取得済みの利用者をスキップする')
+    parser.add_argument('--month-cache', action='store_true',
+                        help='月次の取得結果キャッシュを使い、締まった月は保存済みの結果を使う（デフォルト: 使わない）')
+    parser.add_argument('--month-cache-days', type=int, default=MONTH_CACHE_DAYS,
+                        help=f'--month-cache で、月末からこの日数を超えた月は保存済みの結果を使う（当月・前月は常に取得。デフォルト: {MONTH_CACHE_DAYS}）')
+    # 以前の既定（月次キャッシュを使う）で指定していた呼び出し元のために受け付ける（指定しなくても使わない）
+    parser.add_argument('--no-month-cache', action='store_true', help=argparse.SUPPRESS)
 
     args = parser.parse_args()
-
-    scraper = KantanKaigoFastScraper(headless=True)
-    success = scraper.run(args.year, args.month, args.day)
+    outputs = [f.strip() for f in args.output.split(",") if f.strip()]
+    unknown = [f for f in outputs if f not in OUTPUT_EXTENSIONS]
+    if not outputs or unknown:
+        parser.error(f'--output には {", ".join(OUTPUT_EXTENSIONS)} を指定してください')
+    if pa is None and {"parquet", "arrow"} & set(outputs):
+        parser.error('Parquet/Arrow の出力には pyarrow が必要です（pip install pyarrow）')
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError:
+            parser.error('--shard は i/N 形式（1 ≤ i ≤ N）で指定してください（例: 2/4）')
+        if "csv" not in outputs:
+            parser.error('--shard にはCSVの出力（--output に csv）が必要です')
+    if args.tabs < 1:
+        parser.error('--tabs には1以上の値を指定してください')
+    if args.recycle_rss_mb < 0 or args.recycle_pages < 0:
+        parser.error('--recycle-rss-mb・--recycle-pages には0以上の値を指定してください')
+    if args.max_rps is not None and args.max_rps <= 0:
+        parser.error('--max-rps には正の数を指定してください')
+    if args.retries < 0 or args.retry_backoff < 0 or args.customer_budget < 0:
+        parser.error('--retries・--retry-backoff・--customer-budget には0以上の値を指定してください')
+    if not 0 <= args.breaker_threshold <= 1:
+        parser.error('--breaker-threshold には0から1までの値を指定してください')
+    if args.snapshot and args.no_snapshot:
+        parser.error('--snapshot は --no-snapshot と同時に指定できません')
+    if args.resume and not args.job_id:
+        parser.error('--resume には --job-id が必要です')
+    replay = None
+    if args.replay:
+        if args.daemon or args.record or args.diff_against:
+            parser.error('--replay は --daemon・--record・--diff-against と同時に指定できません')
+        try:
+            replay = PageArchiveReader(args.replay)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            parser.error(f'アーカイブを開けません: {args.replay} ({e})')
+        # シャードで記録したアーカイブは同じシャードのファイル名で出力し、全体のCSVを上書きしない
+        if shard is not None and replay.shard() not in (None, shard):
+            parser.error(f'--shard がアーカイブのシャード（{"/".join(map(str, replay.shard()))}）と一致しません')
+        shard = shard or replay.shard()
+    if args.month_from or args.month_to:
+        if not (args.month_from and args.month_to):
+            parser.error('--from と --to は両方指定してください')
+        if args.day:
+            parser.error('--day は --from/--to と同時に指定できません')
+        if not all(re.fullmatch(r"\d{4}-\d{2}", v) for v in (args.month_from, args.month_to)):
+            parser.error('--from/--to は YYYY-MM 形式で指定してください')
+        months = month_range(args.month_from, args.month_to)
+        if not months:
+            parser.error('--from には --to 以前の月を指定してください')
+    elif replay is not None and args.year is None and args.month is None:
+        # 記録したときの対象期間をそのまま再生する
+        months = replay.months()
+        args.day = args.day or replay.index.get("day")
+    elif args.daemon:
+        months = None
+    elif args.year is None or args.month is None:
+        parser.error('--year と --month（または --from と --to）を指定してください')
+    else:
+        months = [(args.year, args.month)]
+
+    if args.month_cache and args.no_month_cache:
+        parser.error('--month-cache は --no-month-cache と同時に指定できません')
+    month_cache = MonthResultCache(args.month_cache_days) \
+        if args.month_cache and replay is None else None
+    timer = PhaseTimer(args.metrics_file)
+    if replay is not None:
+        # 再生ではサイトにアクセスしないため、1プロセスで解析し、キャッシュ・スナップショット・再試行は使わない
+        args.workers = 1
+        args.no_snapshot = True
+        args.no_session_cache = True
+        args.retries = 0
+        args.customer_budget = 0
+        args.breaker_threshold = 0
+    scraper = KantanKaigoFastScraper(headless=True, workers=args.workers,
+                                     page_timeout=args.page_timeout,
+                                     verify_extraction=args.verify_extraction,
+                                     fetch_mode=args.fetch_mode,
+                                     http_login=args.http_login,
+                                     session_cache=not args.no_session_cache,
+                                     month_cache=month_cache,
+                                     roster_cache=replay is None,
+                                     timer=timer, profile=args.profile,
+                                     browser_profile=args.browser_profile,
+                                     outputs=outputs,
+                                     # --diff-against だけの場合は、比較したスナップショットを今回の結果で更新する
+                                     snapshot_label=None if args.no_snapshot
+                                     else args.snapshot or args.diff_against,
+                                     adaptive_pacing=args.adaptive_pacing,
+                                     max_rps=args.max_rps,
+                                     customer_budget=args.customer_budget or None,
+                                     retries=args.retries,
+                                     retry_backoff=args.retry_backoff,
+                                     breaker_threshold=args.breaker_threshold or None,
+                                     tabs=args.tabs, shard=shard, replay=replay,
+                                     recycle_rss_mb=args.recycle_rss_mb or None,
+                                     recycle_pages=args.recycle_pages or None)
+    if args.daemon:
+        success = scraper.serve(sys.stdin)
+        timer.close()
+        sys.exit(0 if success else 1)
+    pids = [p.strip() for p in args.pids.split(",") if p.strip()] if args.pids else None
+    success = scraper.run_months(months, args.day, job_id=args.job_id,
+                                 resume=args.resume, combine=args.combine,
+                                 pids=pids, diff_against=args.diff_against,
+                                 record=args.record)
+    timer.close()
     sys.exit(0 if success else 1)
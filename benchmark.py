@@ -0,0 +1,146 @@
+"""モックサーバーに対して KantanKaigoFastScraper を最初から最後まで実行し、処理速度を測定する
+
+    python benchmark.py --customers 150 --rows 40 --latency 0.2 --workers 4
+    python benchmark.py --fetch-mode http --http-login --json result.json
+    python benchmark.py --baseline result.json --max-regression 0.2   # 基準より20%以上遅ければ終了コード1
+
+1分あたりの利用者数とフェーズ別の所要時間（PhaseTimer のスパン）を出力する。
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+from mock_server import MockKantanServer
+
+logger = logging.getLogger("benchmark")
+
+
+def summarize_phases(spans):
+    """フェーズごとの件数・合計秒・平均秒"""
+    phases = {}
+    for span in spans:
+        entry = phases.setdefault(span["phase"], {"count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += span["seconds"]
+    for entry in phases.values():
+        entry["seconds"] = round(entry["seconds"], 3)
+        entry["mean"] = round(entry["seconds"] / entry["count"], 4)
+    return phases
+
+
+def run_benchmark(args):
+    server = MockKantanServer(
+        customers=args.customers, rows=args.rows, latency=args.latency,
+        jitter=args.jitter, ajax_delay=args.ajax_delay,
+        honor_url_params=not args.ignore_url_params).start()
+    workdir = tempfile.mkdtemp(prefix="kantan_bench_")
+    # auto_login は読み込み時に接続先とキャッシュの場所を決めるため、先に環境変数を設定する
+    os.environ["KANTAN_BASE_URL"] = server.base_url
+    os.environ["KANTAN_CACHE_DIR"] = os.path.join(workdir, "cache")
+    import auto_login
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        timer = auto_login.PhaseTimer(args.metrics_file)
+        scraper = auto_login.KantanKaigoFastScraper(
+            headless=True, workers=args.workers, fetch_mode=args.fetch_mode,
+            http_login=args.http_login, session_cache=False, month_cache=None,
+            roster_cache=False, timer=timer, profile=args.profile, tabs=args.tabs)
+        start = time.monotonic()
+        ok = scraper.run(args.year, args.month)
+        elapsed = time.monotonic() - start
+        timer.close()
+        csv_path = os.path.join(workdir, auto_login.csv_filename(args.year, args.month))
+        rows = 0
+        # 実行が失敗した場合はCSVが作られない（結果はNGとして出力する）
+        if os.path.exists(csv_path):
+            with open(csv_path, encoding="utf-8-sig") as f:
+                rows = sum(1 for _ in f) - 1
+    finally:
+        os.chdir(cwd)
+        server.stop()
+
+    expected_rows = args.customers * args.rows
+    return {
+        "ok": bool(ok) and rows == expected_rows,
+        "customers": args.customers,
+        "rows": rows,
+        "expected_rows": expected_rows,
+        "seconds": round(elapsed, 3),
+        "customers_per_minute": round(args.customers / elapsed * 60, 2),
+        "requests": server.requests,
+        "config": {
+            "fetch_mode": args.fetch_mode, "http_login": args.http_login,
+            "workers": args.workers, "tabs": args.tabs, "latency": args.latency, "jitter": args.jitter,
+            "ajax_delay": args.ajax_delay, "ignore_url_params": args.ignore_url_params,
+        },
+        "phases": summarize_phases(timer.spans),
+    }
+
+
+def print_result(result):
+    logger.info("=" * 50)
+    logger.info(f"結果: {'OK' if result['ok'] else 'NG'}  "
+                f"({result['rows']}/{result['expected_rows']}行, リクエスト {result['requests']}回)")
+    logger.info(f"所要時間: {result['seconds']:.2f}秒  "
+                f"処理速度: {result['customers_per_minute']:.1f}名/分")
+    logger.info(f"  {'フェーズ':<28} {'件数':>6} {'合計':>9} {'平均':>8}")
+    for phase, entry in sorted(result["phases"].items(), key=lambda kv: -kv[1]["seconds"]):
+        logger.info(f"  {phase:<28} {entry['count']:>6} {entry['seconds']:>9.2f} {entry['mean']:>8.3f}")
+    logger.info("=" * 50)
+
+
+def check_regression(result, baseline_path, max_regression):
+    """基準の処理速度から max_regression の割合を超えて遅くなっていれば False"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    floor = baseline["customers_per_minute"] * (1 - max_regression)
+    if result["customers_per_minute"] < floor:
+        logger.error(f"性能が低下しています: {result['customers_per_minute']:.1f}名/分 "
+                     f"(基準 {baseline['customers_per_minute']:.1f}名/分, 下限 {floor:.1f}名/分)")
+        return False
+    logger.info(f"基準との比較: {result['customers_per_minute']:.1f}名/分 "
+                f"(基準 {baseline['customers_per_minute']:.1f}名/分)")
+    return True
+
+
+if __name__ == "__main__":
+    today = date.today()
+    parser = argparse.ArgumentParser(description='モックサーバーを使ったスクレイピング性能測定')
+    parser.add_argument('--customers', type=int, default=30, help='利用者数')
+    parser.add_argument('--rows', type=int, default=30, help='1か月あたりの実績の行数')
+    parser.add_argument('--latency', type=float, default=0.05, help='各リクエストの応答遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='応答遅延の揺らぎ（秒）')
+    parser.add_argument('--ajax-delay', type=float, default=0.0,
+                        help='一覧テーブルをAJAXで読み込むまでの遅延（秒）')
+    parser.add_argument('--ignore-url-params', action='store_true',
+                        help='サーバーが ?year=&month= を無視し、月ピッカーでの選択が必要な状態を再現する')
+    parser.add_argument('--year', type=int, default=today.year)
+    parser.add_argument('--month', type=int, default=today.month)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--tabs', type=int, default=1, help='1つのブラウザで開くタブの数（先読み）')
+    parser.add_argument('--fetch-mode', choices=['browser', 'http'], default='browser')
+    parser.add_argument('--http-login', action='store_true')
+    parser.add_argument('--profile', action='store_true', help='スクレイパー側のフェーズ別集計も出力する')
+    parser.add_argument('--metrics-file', type=str, help='スパンを JSON Lines で書き出すファイル')
+    parser.add_argument('--json', type=str, help='結果を書き出すJSONファイル（--baseline の基準に使える）')
+    parser.add_argument('--baseline', type=str, help='比較する基準の結果JSON')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='基準から許容する処理速度の低下の割合（デフォルト: 0.2）')
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print_result(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    passed = result["ok"]
+    if args.baseline:
+        passed = check_regression(result, args.baseline, args.max_regression) and passed
+    sys.exit(0 if passed else 1)
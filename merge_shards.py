@@ -0,0 +1,176 @@
+"""--shard i/N で分担して取得したCSVを、元の利用者一覧の順番で1つのCSVにまとめる
+
+    python merge_shards.py shards/                      # ディレクトリ内のマニフェストをすべてまとめる
+    python merge_shards.py host*/schedule_2025_11_shard*.manifest.json -o out/
+
+各シャードの出力（schedule_YYYY_MM_shardiofN.csv と .manifest.json）をマニフェストごとに読み込み、
+まとめる前に全てのマニフェスト（--from/--to の月ごとのCSVを含む）について以下を確認する。
+1つでも満たさない場合は、どのCSVも書き出さずに終了コード1で終わる。
+
+- 1〜N のシャードが1つずつ揃っている
+- 全シャードの利用者一覧（分割前）が一致する
+- 利用者一覧の全PIDがちょうど1回ずつ含まれている
+- CSVのヘッダーと行数がマニフェストと一致する
+"""
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+from collections import Counter
+
+logger = logging.getLogger("merge_shards")
+
+
+class MergeError(Exception):
+    """シャードの出力が揃っていない・矛盾している（メッセージが理由）"""
+
+
+def load_manifests(paths):
+    """マニフェストのファイル（ディレクトリの場合はその中の *.manifest.json）を読み込む"""
+    manifests = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, "*.manifest.json"))) \
+            if os.path.isdir(path) else [path]
+        for file in files:
+            with open(file, encoding="utf-8") as f:
+                manifest = json.load(f)
+            manifest["_dir"] = os.path.dirname(file)
+            manifests.append(manifest)
+    return manifests
+
+
+def check_coverage(manifests):
+    """シャードが揃い、利用者一覧の全PIDが1回ずつ含まれていることを確認し、分割前の利用者一覧を返す"""
+    merged = manifests[0]["merged_csv"]
+    shards = {m["shards"] for m in manifests}
+    if len(shards) != 1:
+        raise MergeError(f"{merged}: シャード数が一致しません（{sorted(shards)}）")
+    n = shards.pop()
+    numbers = Counter(m["shard"] for m in manifests)
+    missing = [i for i in range(1, n + 1) if i not in numbers]
+    duplicated = [i for i, count in numbers.items() if count > 1]
+    if missing or duplicated:
+        raise MergeError(f"{merged}: シャードが揃っていません"
+                         f"（不足: {missing or 'なし'}, 重複: {duplicated or 'なし'}）")
+
+    roster = manifests[0]["roster"]
+    for m in manifests[1:]:
+        if m["roster"] != roster:
+            raise MergeError(f"{merged}: シャード{m['shard']}の利用者一覧がシャード{manifests[0]['shard']}と"
+                             "一致しません（利用者一覧が変わった可能性があります。全シャードを取得し直してください）")
+
+    covered = Counter(pid for m in manifests for pid, _, _ in m["customers"])
+    roster_pids = [pid for pid, _ in roster]
+    problems = []
+    not_covered = [pid for pid in roster_pids if covered[pid] == 0]
+    if not_covered:
+        problems.append(f"含まれていないPID {len(not_covered)}件: {', '.join(not_covered[:10])}")
+    twice = [pid for pid, count in covered.items() if count > 1]
+    if twice:
+        problems.append(f"複数回含まれているPID {len(twice)}件: {', '.join(twice[:10])}")
+    unknown = sorted(set(covered) - set(roster_pids))
+    if unknown:
+        problems.append(f"利用者一覧にないPID {len(unknown)}件: {', '.join(unknown[:10])}")
+    if problems:
+        raise MergeError(f"{merged}: " + " / ".join(problems))
+    return roster
+
+
+def read_shard_rows(manifest):
+    """シャードのCSVを読み、(ヘッダー, {PID: 行のリスト}) を返す（マニフェストの件数で利用者ごとに分ける）"""
+    path = os.path.join(manifest["_dir"], manifest["csv"])
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    expected = sum(count for _, _, count in manifest["customers"])
+    if len(rows) != expected:
+        raise MergeError(f"{manifest['csv']}: 行数がマニフェストと一致しません（CSV {len(rows)}行, マニフェスト {expected}行）")
+    by_pid = {}
+    pos = 0
+    for pid, _, count in manifest["customers"]:
+        by_pid[pid] = rows[pos:pos + count]
+        pos += count
+    return header, by_pid
+
+
+def prepare(manifests):
+    """1つのCSV分のマニフェストを確認して各シャードのCSVを読み、write_merged() に渡す内容を返す"""
+    roster = check_coverage(manifests)
+    header = None
+    rows_by_pid = {}
+    for manifest in sorted(manifests, key=lambda m: m["shard"]):
+        shard_header, by_pid = read_shard_rows(manifest)
+        if header is not None and shard_header != header:
+            raise MergeError(f"{manifest['csv']}: CSVのヘッダーが他のシャードと一致しません")
+        header = shard_header
+        rows_by_pid.update(by_pid)
+        for failure in manifest.get("failed", []):
+            logger.warning(f"  ✗ シャード{manifest['shard']}で取得に失敗: PID {failure['pid']} "
+                           f"({failure['month']}): {failure['reason']}")
+    return manifests, roster, header, rows_by_pid
+
+
+def write_merged(prepared, output_dir):
+    """prepare() の内容を元の利用者一覧の順番で1つのCSVに書き出し、書き出したファイルのパスを返す"""
+    manifests, roster, header, rows_by_pid = prepared
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, manifests[0]["merged_csv"])
+    partial_path = f"{path}.part"
+    row_count = 0
+    # encoding='utf-8-sig' にすることでExcelで文字化けせずに開けます（各シャードのCSVと同じ）
+    with open(partial_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for pid, _ in roster:
+            writer.writerows(rows_by_pid[pid])
+            row_count += len(rows_by_pid[pid])
+    os.replace(partial_path, path)
+    logger.info(f"CSVファイル保存完了: {path}（{len(manifests)}シャード, 利用者 {len(roster)}名, {row_count}行）")
+    return path
+
+
+def merge(manifests, output_dir):
+    """1つのCSV分のマニフェストをまとめて書き出し、書き出したファイルのパスを返す"""
+    return write_merged(prepare(manifests), output_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S')
+    parser = argparse.ArgumentParser(description='--shard で分担して取得したCSVのマージ')
+    parser.add_argument('paths', nargs='+', help='マニフェスト（*.manifest.json）またはそれを含むディレクトリ')
+    parser.add_argument('-o', '--output-dir', default='.', help='まとめたCSVの出力先（デフォルト: カレントディレクトリ）')
+    args = parser.parse_args()
+
+    manifests = load_manifests(args.paths)
+    if not manifests:
+        parser.error('マニフェストが見つかりません')
+    # 月ごとのCSV（--from/--to）はまとめ先のファイル名ごとに分けてマージする
+    groups = {}
+    for manifest in manifests:
+        groups.setdefault(manifest["merged_csv"], []).append(manifest)
+
+    # 全てのCSVを確認してから書き出す（一部の月だけがまとめられた状態を残さない）
+    prepared = []
+    ok = True
+    for merged_csv, group in sorted(groups.items()):
+        try:
+            prepared.append(prepare(group))
+        except (MergeError, OSError, KeyError) as e:
+            logger.error(f"マージできませんでした: {e}")
+            ok = False
+    if not ok:
+        logger.error("確認に失敗したCSVがあるため、どのCSVも書き出しませんでした")
+        sys.exit(1)
+    for group in prepared:
+        try:
+            path = write_merged(group, args.output_dir)
+        except OSError as e:
+            logger.error(f"書き出せませんでした: {e}")
+            sys.exit(1)
+        # ファイル名を標準出力に出力（Node.js側で取得するため）
+        print(f"CSV_FILE:{path}", flush=True)
@@ -0,0 +1,424 @@
+"""かんたん介護のページ構造を模したローカルのモックサーバー
+
+auto_login.py が依存するページ（ログインフォーム、利用者一覧、利用者ごとの実績一覧と月ピッカー）だけを
+再現する。遅延・利用者数・1か月あたりの行数を指定でき、本番のSaaSにアクセスせずに性能を測定できる。
+
+    python mock_server.py --port 8000 --customers 150 --rows 40 --latency 0.2
+    KANTAN_BASE_URL=http://127.0.0.1:8000/home python auto_login.py --year 2025 --month 11
+"""
+import argparse
+import calendar
+import html
+import logging
+import random
+import secrets
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = "MOCKSESSID"
+WEEKDAYS = "月火水木金土日"
+SERVICES = ["身体介護", "生活援助", "身体介護・生活援助", "通院等乗降介助"]
+STAFFS = ["鈴木 一郎", "高橋 花子", "田中 健", "伊藤 美咲", "渡辺 大輔"]
+
+# auto_login.py が使う jQuery の機能（$(...).is(':visible')・click・trigger・hide・ajaxComplete、jQuery.active）だけを実装した代替
+JQUERY_SHIM = """
+(function () {
+    function Q(selector) {
+        if (typeof selector === 'string') {
+            this.els = Array.prototype.slice.call(document.querySelectorAll(selector));
+        } else {
+            this.els = selector && selector.nodeType ? [selector] : [];
+        }
+    }
+    Q.prototype.each = function (fn) { this.els.forEach(fn); return this; };
+    Q.prototype.is = function (state) {
+        if (state !== ':visible') { return false; }
+        return this.els.some(function (el) {
+            return !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+        });
+    };
+    Q.prototype.on = function (name, fn) {
+        return this.each(function (el) { el.addEventListener(name, fn); });
+    };
+    Q.prototype.click = function () { return this.each(function (el) { el.click(); }); };
+    Q.prototype.trigger = function (name) {
+        return this.each(function (el) { el.dispatchEvent(new Event(name, {bubbles: true})); });
+    };
+    Q.prototype.hide = function () { return this.each(function (el) { el.style.display = 'none'; }); };
+    Q.prototype.show = function () { return this.each(function (el) { el.style.display = 'block'; }); };
+    Q.prototype.val = function () { return this.els.length ? this.els[0].value : undefined; };
+    Q.prototype.ajaxComplete = function (fn) { completeHandlers.push(fn); return this; };
+    var completeHandlers = [];
+    var jQuery = function (selector) { return new Q(selector); };
+    jQuery.active = 0;
+    // 通信の完了。jQuery と同じく ajaxComplete を呼んでから jQuery.active を減らす
+    jQuery.ajaxDone = function () {
+        completeHandlers.forEach(function (fn) { fn(); });
+        jQuery.active--;
+    };
+    window.jQuery = window.$ = jQuery;
+})();
+"""
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="{prefix}/js/jquery.js"></script>
+</head>
+<body>
+<div id="header"><a id="headMenuCustomer" href="{prefix}/customers">利用者</a></div>
+{body}
+</body>
+</html>
+"""
+
+
+class MockData:
+    """利用者一覧と実績データを決まった乱数で生成する"""
+
+    def __init__(self, customers=30, rows=30, seed=1):
+        self.customers = [
+            {"pid": str(1000 + n), "name": f"模擬 利用者{n:03d}"}
+            for n in range(1, customers + 1)
+        ]
+        self.rows = rows
+        self.seed = seed
+
+    def schedule(self, pid, year, month, day=None):
+        """[日付, 時間帯, サービス内容, スタッフ名] のリスト（day を指定するとその日の行だけ）"""
+        rng = random.Random(f"{self.seed}:{pid}:{year}:{month}")
+        days = calendar.monthrange(year, month)[1]
+        rows = []
+        for i in range(self.rows):
+            row_day = 1 + i * days // max(1, self.rows)
+            weekday = WEEKDAYS[date(year, month, row_day).weekday()]
+            start = rng.randrange(8 * 60, 18 * 60, 30)
+            end = start + rng.choice([30, 60, 90])
+            row = [
+                f"{month}/{row_day:02d}({weekday})",
+                f"{start // 60:02d}:{start % 60:02d}～{end // 60:02d}:{end % 60:02d}",
+                rng.choice(SERVICES),
+                rng.choice(STAFFS),
+            ]
+            if not day or day == row_day:
+                rows.append(row)
+        return rows
+
+
+class MockKantanServer:
+    """モックサーバー本体。start() で別スレッドで起動し、base_url を KANTAN_BASE_URL に指定する
+
+    latency: 各リクエストの応答前に待つ秒数（jitter の範囲で揺らぐ）
+    ajax_delay: 0より大きい場合、一覧テーブルをページ表示後にAJAXで読み込む（jQuery.active が増える）
+    honor_url_params: False の場合、?year=&month= を無視し、月ピッカーで選んだ月（セッションに保持）を表示する
+    capacity: 0より大きい場合、同時に処理中のリクエストがこの数を超えると応答遅延がその割合で伸びる（混雑の再現）
+    fail_rate: 利用者ページ（実績入力）がこの割合で500エラーを返す（1.0でサイト停止の再現）
+    ajax_month_switch: True の場合、月ピッカーで月を切り替えてもページを再読み込みせず、
+        一覧テーブルの要素を残したまま中身（innerHTML）と serviceDate だけをAJAXで差し替える
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, customers=30, rows=30,
+                 latency=0.0, jitter=0.0, ajax_delay=0.0, honor_url_params=True,
+                 seed=1, capacity=0, fail_rate=0.0, ajax_month_switch=False):
+        self.data = MockData(customers, rows, seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.ajax_delay = ajax_delay
+        self.honor_url_params = honor_url_params
+        self.capacity = capacity
+        self.fail_rate = fail_rate
+        self.ajax_month_switch = ajax_month_switch
+        self.in_flight = 0
+        self.prefix = "/home"
+        # セッションID -> {"month": (年, 月)}
+        self.sessions = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{self.prefix}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(MockRequestHandler):
+            mock = server
+
+        return Handler
+
+
+def _day_param(query):
+    """?day= の値（指定がなければ None）。指定された場合はその日の行だけを返す"""
+    value = (query.get("day") or [""])[0]
+    return int(value) if value.isdigit() else None
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt, *args)
+
+    # --- 共通処理 ---
+
+    def _delay(self):
+        with self.mock.lock:
+            self.mock.requests += 1
+            self.mock.in_flight += 1
+            in_flight = self.mock.in_flight
+        delay = self.mock.latency
+        if self.mock.jitter:
+            delay += random.uniform(-self.mock.jitter, self.mock.jitter)
+        if self.mock.capacity and in_flight > self.mock.capacity:
+            delay *= in_flight / self.mock.capacity
+        try:
+            if delay > 0:
+                time.sleep(delay)
+        finally:
+            with self.mock.lock:
+                self.mock.in_flight -= 1
+
+    def _session(self):
+        cookie = self.headers.get("Cookie") or ""
+        for part in cookie.split(";"):
+            key, _, value = part.strip().partition("=")
+            if key == SESSION_COOKIE and value in self.mock.sessions:
+                return self.mock.sessions[value]
+        return None
+
+    def _send(self, body, status=200, content_type="text/html; charset=utf-8",
+              headers=None):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def _redirect(self, location, headers=None):
+        self._send("", 302, headers={"Location": location, **(headers or {})})
+
+    def _page(self, title, body):
+        self._send(PAGE_TEMPLATE.format(title=title, prefix=self.mock.prefix, body=body))
+
+    # --- ルーティング ---
+
+    def do_GET(self):
+        self._delay()
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        prefix = self.mock.prefix
+        path = url.path
+
+        if path == f"{prefix}/js/jquery.js":
+            return self._send(JQUERY_SHIM, content_type="application/javascript")
+        if path == f"{prefix}/users/login":
+            return self._login_page()
+
+        session = self._session()
+        if session is None:
+            return self._redirect(f"{prefix}/users/login")
+
+        if path in (prefix, f"{prefix}/"):
+            return self._page("ホーム", "<p>ログイン中</p>")
+        if path == f"{prefix}/customers":
+            return self._customer_list()
+        if path == f"{prefix}/jissekis/setMonth":
+            # 月ピッカーで選んだ月をセッションに保持して元のページに戻る
+            session["month"] = (int(query["year"][0]), int(query["month"][0]))
+            if "ajax" in query:
+                return self._send("", 204)
+            return self._redirect(query.get("back", [f"{prefix}/"])[0])
+        if path.startswith(f"{prefix}/jissekis/editCustomer/"):
+            pid = path.rsplit("/", 1)[-1]
+            if self.mock.fail_rate and random.random() < self.mock.fail_rate:
+                return self._send("Internal Server Error", 500)
+            return self._edit_customer(session, pid, query)
+        if path.startswith(f"{prefix}/jissekis/listTable/"):
+            pid = path.rsplit("/", 1)[-1]
+            year, month = int(query["year"][0]), int(query["month"][0])
+            return self._send(self._list_table(pid, year, month, _day_param(query)))
+        self._send("Not Found", 404)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_POST(self):
+        self._delay()
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        prefix = self.mock.prefix
+        if urlparse(self.path).path != f"{prefix}/users/login":
+            return self._send("Not Found", 404)
+        if not form.get("data[User][username]") or not form.get("data[User][password]"):
+            return self._redirect(f"{prefix}/users/login")
+        token = secrets.token_hex(16)
+        today = date.today()
+        self.mock.sessions[token] = {"month": (today.year, today.month)}
+        self._redirect(f"{prefix}/", headers={
+            "Set-Cookie": f"{SESSION_COOKIE}={token}; Path=/; HttpOnly"})
+
+    # --- ページ ---
+
+    def _login_page(self):
+        prefix = self.mock.prefix
+        self._page("ログイン", f"""
+<form action="{prefix}/users/login" method="post" id="UserLoginForm">
+<input type="hidden" name="_method" value="POST">
+<input type="text" name="data[User][username]">
+<input type="password" name="data[User][password]">
+<input type="text" id="UserGroupGroupname2" name="data[UserGroup][groupname]">
+<input type="submit" name="login" value="ログイン">
+</form>""")
+
+    def _customer_list(self):
+        rows = "\n".join(
+            f'<tr><td><a class="focus" href="#">{html.escape(c["name"])}</a></td>'
+            f'<td><span class="planJisseki" pid="{c["pid"]}">予定・実績</span></td></tr>'
+            for c in self.mock.data.customers)
+        self._page("利用者一覧", f'<table id="customerList">\n{rows}\n</table>')
+
+    def _list_table(self, pid, year, month, day=None):
+        cells = []
+        for row in self.mock.data.schedule(pid, year, month, day):
+            cells.append(
+                "<tr>" + "".join(
+                    f'<td class="{cls} edit">{html.escape(text)}</td>'
+                    for cls, text in zip(("day", "time", "service", "staff"), row))
+                + "</tr>")
+        # 新規入力用の空行（日付が空の行は取得対象外）
+        cells.append('<tr><td class="day edit"></td><td class="time edit"></td>'
+                     '<td class="service edit"></td><td class="staff edit"></td></tr>')
+        return '<table class="list_table">\n' + "\n".join(cells) + "\n</table>"
+
+    def _edit_customer(self, session, pid, query):
+        if self.mock.honor_url_params and "year" in query and "month" in query:
+            year, month = int(query["year"][0]), int(query["month"][0])
+        else:
+            year, month = session["month"]
+        day = _day_param(query)
+        prefix = self.mock.prefix
+        back = quote(f"{prefix}/jissekis/editCustomer/{pid}")
+        year_options = "".join(
+            f'<option value="{y}"{" selected" if y == year else ""}>{y}</option>'
+            for y in range(year - 3, year + 2))
+        month_links = "".join(
+            f'<a href="#" data-month="{m}">{m + 1}月</a>' for m in range(12))
+        if self.mock.ajax_delay > 0:
+            table = '<div id="listArea"></div>'
+            loader = f"""
+jQuery.active++;
+setTimeout(function () {{
+    fetch('{prefix}/jissekis/listTable/{pid}?year={year}&month={month}&day={day or ""}', {{credentials: 'same-origin'}})
+        .then(function (r) {{ return r.text(); }})
+        .then(function (t) {{ document.getElementById('listArea').innerHTML = t; jQuery.ajaxDone(); }});
+}}, {int(self.mock.ajax_delay * 1000)});"""
+        else:
+            table = self._list_table(pid, year, month, day)
+            loader = ""
+        if self.mock.ajax_month_switch:
+            switch = f"""
+    fetch('{prefix}/jissekis/setMonth?year=' + y + '&month=' + m + '&ajax=1', {{credentials: 'same-origin'}})
+        .then(function () {{
+            return fetch('{prefix}/jissekis/listTable/{pid}?year=' + y + '&month=' + m + '&day={day or ""}',
+                         {{credentials: 'same-origin'}});
+        }})
+        .then(function (r) {{ return r.text(); }})
+        .then(function (t) {{
+            var tmp = document.createElement('div');
+            tmp.innerHTML = t;
+            document.querySelector('.list_table').innerHTML = tmp.querySelector('.list_table').innerHTML;
+            document.getElementById('serviceDate').value = y + '-' + ('0' + m).slice(-2) + '-01';
+            jQuery.ajaxDone();
+        }});"""
+        else:
+            switch = f"""
+    location.href = '{prefix}/jissekis/setMonth?year=' + y + '&month=' + m + '&back={back}';"""
+        self._page("実績入力", f"""
+<div id="monthSelect">
+<input type="text" id="serviceDate" value="{year}-{month:02d}-01" readonly>
+<button type="button" class="ui-monthpicker-trigger">月を選択</button>
+</div>
+<div id="ui-monthpicker-div" style="display:none">
+<select class="ui-datepicker-year">{year_options}</select>
+{month_links}
+</div>
+{table}
+<script>
+function selectMonth(y, m) {{
+    jQuery.active++;{switch}
+}}
+$('.ui-monthpicker-trigger').on('click', function () {{ $('#ui-monthpicker-div').show(); }});
+$('#ui-monthpicker-div a').on('click', function (e) {{
+    e.preventDefault();
+    $('#ui-monthpicker-div').hide();
+    selectMonth($('select.ui-datepicker-year').val(), parseInt(this.getAttribute('data-month'), 10) + 1);
+}});
+$('#serviceDate').on('change', function () {{
+    var parts = this.value.split('-');
+    selectMonth(parts[0], parseInt(parts[1], 10));
+}});
+{loader}
+</script>""")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%H:%M:%S')
+    parser = argparse.ArgumentParser(description='かんたん介護モックサーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--customers', type=int, default=30, help='利用者数')
+    parser.add_argument('--rows', type=int, default=30, help='1か月あたりの実績の行数')
+    parser.add_argument('--latency', type=float, default=0.0, help='各リクエストの応答遅延（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='応答遅延の揺らぎ（秒）')
+    parser.add_argument('--ajax-delay', type=float, default=0.0,
+                        help='一覧テーブルをAJAXで読み込むまでの遅延（秒、0なら最初からHTMLに含める）')
+    parser.add_argument('--ignore-url-params', action='store_true',
+                        help='?year=&month= を無視し、月ピッカーで選んだ月を表示する')
+    parser.add_argument('--capacity', type=int, default=0,
+                        help='同時に処理できるリクエスト数（超えると応答遅延が伸びる。0なら無制限）')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='利用者ページが500エラーを返す割合（1.0でサイト停止を再現）')
+    parser.add_argument('--ajax-month-switch', action='store_true',
+                        help='月の切り替えでページを再読み込みせず、一覧テーブルの中身だけをAJAXで差し替える')
+    args = parser.parse_args()
+
+    server = MockKantanServer(args.host, args.port, args.customers, args.rows,
+                              args.latency, args.jitter, args.ajax_delay,
+                              honor_url_params=not args.ignore_url_params,
+                              capacity=args.capacity, fail_rate=args.fail_rate,
+                              ajax_month_switch=args.ajax_month_switch)
+    logger.info(f"モックサーバーを起動しました: {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
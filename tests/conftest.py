@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# auto_login は読み込み時にキャッシュの場所を決めるため、テスト用の一時ディレクトリを先に指定する
+os.environ.setdefault("KANTAN_CACHE_DIR", tempfile.mkdtemp(prefix="kantan_test_cache_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,73 @@
+"""--day の絞り込み（DAY_CELL_PATTERN・parse_day・filter_by_day・SCHEDULE_ROWS_SCRIPT）のテスト"""
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from auto_login import DAY_CELL_PATTERN, SCHEDULE_ROWS_SCRIPT, filter_by_day, parse_day, rows_to_schedules
+
+DAY_CELLS = [
+    ("11/15(土)", 15),
+    ("11/5(水)", 5),
+    ("2025-11-15", 15),
+    ("2025/11/05", 5),
+    ("11月15日", 15),
+    ("11月5日(水)", 5),
+    ("15日", 15),
+    ("15(土)", 15),
+    (" 7 ", 7),
+    ("", None),
+    ("合計", None),
+]
+
+
+@pytest.mark.parametrize("text, day", DAY_CELLS)
+def test_parse_day(text, day):
+    assert parse_day(text) == day
+
+
+def test_parse_day_does_not_read_month_as_day():
+    # "11/15" の 11（月）や "2025-11-15" の 2025 を日と取り違えない
+    assert parse_day("11/15(土)") != 11
+    assert parse_day("2025-11-15") != 20
+
+
+def test_filter_by_day_keeps_only_that_day():
+    rows = [["11/01(土)", "09:00～10:00", "身体介護", "A"],
+            ["11/15(土)", "10:00～11:00", "生活援助", "B"],
+            ["11/15(土)", "13:00～14:00", "身体介護", "C"],
+            ["11/25(火)", "09:00～10:00", "身体介護", "D"]]
+    records = rows_to_schedules(rows, "2025-11")
+    assert [r.staff for r in filter_by_day(records, 15)] == ["B", "C"]
+    assert [r.staff for r in filter_by_day(records, 5)] == []
+
+
+NODE_HARNESS = """
+var cells = JSON.parse(process.argv[1]), args = JSON.parse(process.argv[2]);
+function els(values) { return values.map(function (v) { return {innerText: v}; }); }
+global.document = {querySelectorAll: function (selector) {
+    return els(cells[selector.split('.')[1]]);
+}};
+var run = new Function(%s);
+console.log(JSON.stringify(run.apply(null, args)));
+"""
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node がない")
+def test_schedule_rows_script_filters_day_like_python():
+    dates = [text for text, _ in DAY_CELLS]
+    cells = {"day": dates,
+             "time": [f"t{i}" for i in range(len(dates))],
+             "service": [f"s{i}" for i in range(len(dates))],
+             "staff": [f"f{i}" for i in range(len(dates))]}
+    harness = NODE_HARNESS % json.dumps(SCHEDULE_ROWS_SCRIPT)
+
+    def run(day):
+        out = subprocess.run(["node", "-e", harness, json.dumps(cells), json.dumps([day, DAY_CELL_PATTERN])],
+                             capture_output=True, text=True, check=True).stdout
+        return json.loads(out)
+
+    assert len(run(None)) == len(dates)
+    for day in (5, 7, 15):
+        assert [row[0] for row in run(day)] == [text for text in dates if parse_day(text) == day]
@@ -0,0 +1,71 @@
+"""--diff-against の差分（diff_schedules）とスナップショットの保存形式のテスト"""
+from auto_login import SnapshotStore, diff_schedules, rows_to_schedules
+
+
+def records(*rows):
+    return rows_to_schedules([list(row) for row in rows], "2025-11", "山田", "101")
+
+
+def ops(delta):
+    return sorted((r.op, r.date_text, r.time_text, r.service, r.staff) for r in delta)
+
+
+def test_no_difference():
+    old = records(("11/01", "09:00～10:00", "身体介護", "A"), ("11/02", "09:00～10:00", "生活援助", "B"))
+    assert diff_schedules(old, list(reversed(old))) == []
+
+
+def test_added_removed_and_changed():
+    old = records(("11/01", "09:00～10:00", "身体介護", "A"),
+                  ("11/02", "09:00～10:00", "生活援助", "B"),
+                  ("11/03", "09:00～10:00", "生活援助", "C"))
+    new = records(("11/01", "09:00～10:00", "身体介護", "A"),
+                  ("11/02", "09:00～10:00", "生活援助", "X"),
+                  ("11/04", "13:00～14:00", "身体介護", "D"))
+    assert ops(diff_schedules(old, new)) == [
+        ("added", "11/04", "13:00～14:00", "身体介護", "D"),
+        ("changed", "11/02", "09:00～10:00", "生活援助", "X"),
+        ("removed", "11/03", "09:00～10:00", "生活援助", "C"),
+    ]
+
+
+def test_duplicate_rows_are_counted():
+    row = ("11/01", "09:00～10:00", "身体介護", "A")
+    assert ops(diff_schedules(records(row), records(row, row))) == [("added",) + row]
+    assert ops(diff_schedules(records(row, row), records(row))) == [("removed",) + row]
+
+
+def test_changed_pairs_one_to_one_within_a_slot():
+    old = records(("11/01", "09:00～10:00", "身体介護", "A"), ("11/01", "09:00～10:00", "身体介護", "B"))
+    new = records(("11/01", "09:00～10:00", "身体介護", "C"))
+    assert ops(diff_schedules(old, new)) == [
+        ("changed", "11/01", "09:00～10:00", "身体介護", "C"),
+        ("removed", "11/01", "09:00～10:00", "身体介護", "B"),
+    ]
+
+
+def test_diff_does_not_modify_inputs():
+    old = records(("11/01", "09:00～10:00", "身体介護", "A"))
+    new = records(("11/02", "09:00～10:00", "身体介護", "A"))
+    delta = diff_schedules(old, new)
+    assert {r.op for r in delta} == {"added", "removed"}
+    assert old[0].op is None and new[0].op is None
+
+
+def test_everything_added_against_empty_snapshot():
+    new = records(("11/01", "09:00～10:00", "身体介護", "A"))
+    assert ops(diff_schedules([], new)) == [("added", "11/01", "09:00～10:00", "身体介護", "A")]
+
+
+def test_snapshot_round_trip_keeps_hash(tmp_path):
+    rows = records(("11/01", "09:00～10:00", "身体介護", "A"), ("11/02", "10:00～11:30", "生活援助", "B"))
+    store = SnapshotStore(cache_dir=str(tmp_path))
+    digest = SnapshotStore.content_hash(rows)
+    store.put("latest", "2025-11", "101", "山田", rows, digest)
+    store.commit()
+    saved_digest, saved = store.get("latest", "2025-11", "101", "山田")
+    store.close()
+    assert saved_digest == digest == SnapshotStore.content_hash(saved)
+    assert saved == rows
+    assert saved[1].minutes == 90 and saved[1].customer == "山田"
+    assert diff_schedules(saved, rows) == []
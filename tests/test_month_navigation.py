@@ -0,0 +1,63 @@
+"""年月の切り替え方法の学習（MonthNavigationLearner）のテスト"""
+from auto_login import MonthNavigationLearner
+
+
+def test_landing_on_target_without_previous_month_is_undecided():
+    nav = MonthNavigationLearner()
+    nav.observe_landing((2025, 11), (2025, 11), None)
+    assert nav.url_params is None
+    assert nav.session_sticky is None
+
+
+def test_landing_on_target_after_another_month_means_url_params_work():
+    nav = MonthNavigationLearner()
+    nav.observe_landing((2025, 11), (2025, 11), (2025, 10))
+    assert nav.url_params is True
+    assert nav.session_sticky is None
+
+
+def test_landing_on_another_month_means_url_params_ignored():
+    nav = MonthNavigationLearner()
+    nav.observe_landing((2025, 11), (2026, 1), None)
+    assert nav.url_params is False
+    assert nav.session_sticky is None
+
+
+def test_session_keeps_the_selected_month():
+    nav = MonthNavigationLearner()
+    # 1人目: URLの年月は無視され、今月が表示された（月ピッカーで 2025-11 を選ぶ）
+    nav.observe_landing((2025, 11), (2026, 1), None)
+    # 2人目: 前回選んだ年月で開いた
+    nav.observe_landing((2025, 11), (2025, 11), (2025, 11))
+    assert nav.url_params is False
+    assert nav.session_sticky is True
+
+
+def test_session_does_not_keep_the_selected_month():
+    nav = MonthNavigationLearner()
+    nav.observe_landing((2025, 11), (2026, 1), (2025, 11))
+    assert nav.url_params is False
+    assert nav.session_sticky is False
+    # 一度保持しないと判定したら、たまたま一致しても保持するとはみなさない
+    nav.observe_landing((2025, 11), (2025, 11), (2025, 11))
+    assert nav.session_sticky is False
+
+
+def test_order_tries_each_strategy_first_then_prefers_fast_successes():
+    nav = MonthNavigationLearner()
+    first = [nav.order()[0] for _ in nav.STRATEGIES]
+    assert sorted(first) == sorted(nav.STRATEGIES)
+    nav.observe("monthpicker", True, 2.0)
+    nav.observe("direct_set", True, 0.5)
+    nav.observe("selenium_click", False, 0.1)
+    assert nav.order() == ("direct_set", "monthpicker", "selenium_click")
+
+
+def test_success_without_replaced_page_counts_as_failure():
+    nav = MonthNavigationLearner()
+    for _ in nav.STRATEGIES:
+        nav.order()
+    nav.observe("direct_set", True, 0.1, replaced=False)
+    nav.observe("monthpicker", True, 1.5)
+    assert nav.stats["direct_set"][:2] == [0, 1]
+    assert nav.order()[0] == "monthpicker"
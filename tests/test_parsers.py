@@ -0,0 +1,99 @@
+"""HTTP取得・アーカイブの再生で使うHTMLの解析（ScheduleTableParser・CustomerListParser）のテスト"""
+import pytest
+
+from auto_login import (CustomerListParser, ScheduleTableParser, parse_customer_page,
+                        parse_schedule_page, rows_to_schedules)
+from mock_server import MockKantanServer
+
+
+SCHEDULE_PAGE = """
+<div id="monthSelect"><input type="text" id="serviceDate" value="2025-11-01" readonly></div>
+<table class="list_table">
+<tr><th>日付</th><th>時間</th><th>サービス</th><th>スタッフ</th></tr>
+<tr><td class="day edit">11/01(土)</td><td class="time edit">09:00～10:00</td>
+    <td class="service edit"><span>身体介護</span></td><td class="staff edit">鈴木&nbsp;一郎</td></tr>
+<tr><td class="day edit">11/02(日)</td><td class="time edit">10:00<br>～11:30</td>
+    <td class="service edit">  生活援助  </td><td class="staff edit">高橋 &amp; 田中</td></tr>
+<tr><td class="day edit"></td><td class="time edit"></td><td class="service edit"></td><td class="staff edit"></td></tr>
+</table>
+"""
+
+
+def test_schedule_table_parser_reads_cells_like_inner_text():
+    parser = ScheduleTableParser()
+    parser.feed(SCHEDULE_PAGE)
+    assert parser.service_date == "2025-11-01"
+    assert parser.has_table
+    assert parser.rows() == [
+        ["11/01(土)", "09:00～10:00", "身体介護", "鈴木 一郎"],
+        ["11/02(日)", "10:00\n～11:30", "生活援助", "高橋 & 田中"],
+        ["", "", "", ""],
+    ]
+
+
+def test_parse_schedule_page_without_table():
+    service_date, has_table, rows = parse_schedule_page(
+        '<input id="serviceDate" value=""><p>データがありません</p>')
+    assert service_date is None
+    assert not has_table
+    assert rows == []
+
+
+def test_parse_schedule_page_pads_missing_columns():
+    _, _, rows = parse_schedule_page(
+        '<table class="list_table"><tr><td class="day edit">3日</td><td class="time edit">08:00～09:00</td></tr></table>')
+    assert rows == [["3日", "08:00～09:00", "", ""]]
+
+
+def test_rows_to_schedules_skips_rows_without_date():
+    _, _, rows = parse_schedule_page(SCHEDULE_PAGE)
+    records = rows_to_schedules(rows, "2025-11", "山田 花子", "P1")
+    assert [r.key() for r in records] == [tuple(row) for row in rows[:2]]
+    assert records[0].customer == "山田 花子" and records[0].pid == "P1"
+    assert records[0].minutes == 60
+
+
+def test_parse_schedule_page_matches_mock_server_page():
+    server = MockKantanServer(customers=3, rows=5)
+    try:
+        data = server.data
+        pid = data.customers[0]["pid"]
+        handler_class = server._handler_class()
+        html = handler_class.__new__(handler_class)._list_table(pid, 2025, 11)
+    finally:
+        server.httpd.server_close()
+    _, has_table, rows = parse_schedule_page(html)
+    assert has_table
+    assert [row for row in rows if row[0]] == [list(row) for row in data.schedule(pid, 2025, 11)]
+
+
+CUSTOMER_PAGE = """
+<table id="customerList">
+<tr><td><a class="focus" href="#">  山田 太郎 </a></td><td><span class="planJisseki" pid="101">予定・実績</span></td></tr>
+<tr><td><a class="focus" href="#">佐藤 花子</a></td><td><span class="planJisseki" pid="102">予定・実績</span></td></tr>
+<tr><td>名前なし</td><td><span class="planJisseki" pid="103">予定・実績</span></td></tr>
+<tr><td><span class="planJisseki">PIDなし</span></td></tr>
+</table>
+"""
+
+
+def test_customer_list_parser_reads_pid_and_name_per_row():
+    parser = CustomerListParser()
+    parser.feed(CUSTOMER_PAGE)
+    assert parser.has_customer_list
+    assert parser.customers() == [
+        {"name": "山田 太郎", "pid": "101"},
+        {"name": "佐藤 花子", "pid": "102"},
+        {"name": "利用者ID_103", "pid": "103"},
+    ]
+
+
+def test_customer_list_parser_keeps_order_with_unclosed_rows():
+    html = ('<table id="customerList"><tr><td><a class="focus">A</a><span class="planJisseki" pid="1"></span>'
+            '<tr><td><a class="focus">B</a><span class="planJisseki" pid="2"></span></table>')
+    assert [c["pid"] for c in parse_customer_page(html)] == ["1", "2"]
+
+
+def test_parse_customer_page_requires_customer_list():
+    with pytest.raises(RuntimeError):
+        parse_customer_page("<p>ログインしてください</p>")
@@ -0,0 +1,106 @@
+"""--shard の分割（parse_shard・shard_of）と merge_shards.py のマージのテスト"""
+import csv
+import json
+import os
+
+import pytest
+
+from auto_login import CSV_HEADER, manifest_filename, parse_shard, shard_filename, shard_of
+from merge_shards import MergeError, load_manifests, merge
+
+
+@pytest.mark.parametrize("text, expected", [("1/4", (1, 4)), (" 2 / 3 ", (2, 3)), ("1/1", (1, 1))])
+def test_parse_shard(text, expected):
+    assert parse_shard(text) == expected
+
+
+@pytest.mark.parametrize("text", ["0/4", "5/4", "2", "a/b", "", None])
+def test_parse_shard_rejects_invalid(text):
+    with pytest.raises(ValueError):
+        parse_shard(text)
+
+
+def test_shard_of_is_stable_and_covers_every_shard():
+    pids = [str(1000 + i) for i in range(200)]
+    assignment = [shard_of(pid, 4) for pid in pids]
+    # ホスト・プロセスによらず同じ結果（組み込みの hash() を使わない）
+    assert assignment == [shard_of(pid, 4) for pid in pids]
+    assert shard_of("1000", 4) == shard_of(1000, 4)
+    assert set(assignment) == {1, 2, 3, 4}
+    assert all(shard_of(pid, 1) == 1 for pid in pids)
+
+
+def test_shard_filename():
+    assert shard_filename("schedule_2025_11.csv", (2, 4)) == "schedule_2025_11_shard2of4.csv"
+    assert manifest_filename("schedule_2025_11_shard2of4.csv") == "schedule_2025_11_shard2of4.manifest.json"
+
+
+ROSTER = [["101", "山田"], ["102", "佐藤"], ["103", "鈴木"], ["104", "田中"]]
+ROWS = {"101": [["11/01(土)", "09:00～10:00", "身体介護", "A"]],
+        "102": [],
+        "103": [["11/02(日)", "10:00～11:00", "生活援助", "B"], ["11/03(月)", "10:00～11:00", "生活援助", "C"]],
+        "104": [["11/04(火)", "12:00～13:00", "身体介護", "D"]]}
+
+
+def write_shard(directory, shard, shards, pids, roster=ROSTER):
+    """auto_login.py の --shard と同じ形式のCSVとマニフェストを書き出す"""
+    names = dict(ROSTER)
+    csv_name = shard_filename("schedule_2025_11.csv", (shard, shards))
+    with open(os.path.join(directory, csv_name), "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for pid in pids:
+            writer.writerows([names[pid]] + row for row in ROWS[pid])
+    manifest = {"shard": shard, "shards": shards, "csv": csv_name, "merged_csv": "schedule_2025_11.csv",
+                "year_month": "2025-11", "roster": roster,
+                "customers": [[pid, names[pid], len(ROWS[pid])] for pid in pids], "failed": []}
+    with open(os.path.join(directory, manifest_filename(csv_name)), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.reader(f))
+
+
+def test_merge_restores_roster_order(tmp_path):
+    shards = tmp_path / "shards"
+    shards.mkdir()
+    write_shard(shards, 1, 2, ["103", "101"])
+    write_shard(shards, 2, 2, ["102", "104"])
+    path = merge(load_manifests([str(shards)]), str(tmp_path / "out"))
+    assert path == str(tmp_path / "out" / "schedule_2025_11.csv")
+    assert read_csv(path) == [CSV_HEADER] + [
+        [name] + row for pid, name in ROSTER for row in ROWS[pid]]
+
+
+def test_merge_rejects_missing_shard(tmp_path):
+    write_shard(tmp_path, 1, 2, ["101", "103"])
+    with pytest.raises(MergeError, match="シャードが揃っていません"):
+        merge(load_manifests([str(tmp_path)]), str(tmp_path / "out"))
+    assert not (tmp_path / "out").exists()
+
+
+def test_merge_rejects_missing_and_duplicated_pids(tmp_path):
+    write_shard(tmp_path, 1, 2, ["101", "103"])
+    write_shard(tmp_path, 2, 2, ["103", "104"])
+    with pytest.raises(MergeError, match="含まれていないPID 1件: 102.*複数回含まれているPID 1件: 103"):
+        merge(load_manifests([str(tmp_path)]), str(tmp_path / "out"))
+
+
+def test_merge_rejects_different_rosters(tmp_path):
+    write_shard(tmp_path, 1, 2, ["101", "103"])
+    write_shard(tmp_path, 2, 2, ["102", "104"], roster=ROSTER[:3])
+    with pytest.raises(MergeError, match="利用者一覧"):
+        merge(load_manifests([str(tmp_path)]), str(tmp_path / "out"))
+
+
+def test_merge_rejects_row_count_mismatch(tmp_path):
+    write_shard(tmp_path, 1, 2, ["101", "103"])
+    write_shard(tmp_path, 2, 2, ["102", "104"])
+    csv_path = tmp_path / shard_filename("schedule_2025_11.csv", (1, 2))
+    with open(csv_path, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(["山田", "11/09(日)", "", "", ""])
+    with pytest.raises(MergeError, match="行数がマニフェストと一致しません"):
+        merge(load_manifests([str(tmp_path)]), str(tmp_path / "out"))
+    assert not (tmp_path / "out").exists()